@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+
+Measures the i2c cost of every public method of RV_3028 against the simulator and checks it against the budgets in
+budgets.json. Exits with status 1 if a method goes over its budget or has no scenario. The methods are measured in
+the default configuration and with the register cache enabled (loaded before the measurement).
+
+    python benchmarks/bus_cost.py            # report and check
+    python benchmarks/bus_cost.py --update   # rewrite budgets.json with the measured costs
+    python benchmarks/bus_cost.py --combined # simulate a bus with combined transfers (I2C_RDWR transport)
+"""
+
+import argparse
+import datetime
+import inspect
+import json
+import os
+import sys
+
+# run from a checkout without installing the package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import melopero_RV_3028 as mp  # noqa: E402
+from melopero_RV_3028.simulator import transaction_bytes, transaction_duration  # noqa: E402
+from melopero_RV_3028.transport import MAX_MESSAGES  # noqa: E402
+
+BUDGETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'budgets.json')
+
+BUS_FREQUENCIES = (100000, 400000)
+
+# configuration name -> RV_3028 arguments
+CONFIGURATIONS = {
+    'default': {},
+    'register_cache': {'register_cache': True},
+}
+
+
+class SimulatedDeviceFile():
+    """
+    Stands for /dev/i2c-N with the simulator behind it, counting the syscalls the transports of transport.py would
+    make: open and an I2C_FUNCS ioctl to open the bus, close to close it, one ioctl per transfer (one per
+    MAX_MESSAGES operations for a combined transfer) and, for smbus2, an I2C_SLAVE ioctl before the first
+    transfer after opening the bus (I2CRdwrTransport puts the address in every message).
+    """
+
+    def __init__(self, simulator: mp.RV_3028_Simulator):
+        self.simulator = simulator
+        self.syscalls = 0
+
+    def open(self, bus_number: int) -> '_SimulatedTransport':
+        self.syscalls += 2
+        return _SimulatedTransport(self)
+
+
+class _SimulatedTransport():
+
+    def __init__(self, device_file: SimulatedDeviceFile):
+        self.device_file = device_file
+        self.supports_combined_transfers = device_file.simulator.supports_combined_transfers
+        self._address_set = self.supports_combined_transfers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        self.device_file.syscalls += 1
+
+    def _transfer(self, operation: str, i2c_addr: int, *args):
+        if not self._address_set:
+            self.device_file.syscalls += 1
+            self._address_set = True
+        self.device_file.syscalls += 1
+        return getattr(self.device_file.simulator, operation)(i2c_addr, *args)
+
+    def read_byte_data(self, *args):
+        return self._transfer('read_byte_data', *args)
+
+    def write_byte_data(self, *args):
+        return self._transfer('write_byte_data', *args)
+
+    def read_i2c_block_data(self, *args):
+        return self._transfer('read_i2c_block_data', *args)
+
+    def write_i2c_block_data(self, *args):
+        return self._transfer('write_i2c_block_data', *args)
+
+    def combined_transfer(self, i2c_addr: int, operations: list) -> list:
+        self.device_file.syscalls += (len(operations) - 1) // MAX_MESSAGES
+        return self._transfer('combined_transfer', i2c_addr, operations)
+
+
+def _batch(rtc):
+    with rtc.batch():
+        rtc.set_timer(5, mp.RV_3028.TIMER_FREQ_1Hz)
+        rtc.enable_timer(enable=True, repeat=True, generate_interrupt=True)
+        rtc.enable_alarm(enable=True, generate_interrupt=True)
+        rtc.enable_periodic_time_update_interrupt(generate_interrupt=True)
+
+
+def _read_unix_time_edge(rtc):
+    # on the virtual clock of the simulator, the next second starts 1 s after the first poll
+    wait = rtc.eeprom_wait
+    rtc.read_unix_time_edge(poll_interval=0.25, clock=lambda: int(wait.clock() * 1e9), sleep=wait.sleep)
+
+
+def _locked(rtc):
+    with rtc.locked():
+        rtc.write_register(mp.RV_3028.USER_RAM1_ADDRESS, rtc.read_register(mp.RV_3028.USER_RAM1_ADDRESS) + 1)
+
+
+# method name -> function running the method on an rtc
+SCENARIOS = {
+    'close': lambda rtc: rtc.close(),
+    'read_register': lambda rtc: rtc.read_register(mp.RV_3028.USER_RAM1_ADDRESS),
+    'read_registers': lambda rtc: rtc.read_registers(mp.RV_3028.USER_RAM1_ADDRESS, 2),
+    'write_register': lambda rtc: rtc.write_register(mp.RV_3028.USER_RAM1_ADDRESS, 0x42),
+    'write_registers': lambda rtc: rtc.write_registers(mp.RV_3028.USER_RAM1_ADDRESS, [0x42, 0x43]),
+    'and_or_register': lambda rtc: rtc.and_or_register(mp.RV_3028.CONTROL2_REGISTER_ADDRESS, 0xFF, 0x20),
+    'get_field': lambda rtc: rtc.get_field('TIMER_VALUE'),
+    'get_fields': lambda rtc: rtc.get_fields('TE', 'TIE', 'TF', 'TIMER_VALUE', 'TIMER_STATUS'),
+    'set_fields': lambda rtc: rtc.set_fields(TIMER_VALUE=5, TD=mp.RV_3028.TIMER_FREQ_1Hz, TRPT=1, TE=1, TIE=1),
+    'batch': _batch,
+    'locked': _locked,
+    'invalidate_register_cache': lambda rtc: rtc.invalidate_register_cache(),
+    'sync_register_cache': lambda rtc: rtc.sync_register_cache(),
+    'snapshot': lambda rtc: rtc.snapshot(),
+    'apply': lambda rtc: rtc.apply({'TIMER_VALUE': 5, 'TD': mp.RV_3028.TIMER_FREQ_1Hz, 'TRPT': 1, 'TE': 1, 'TIE': 1}),
+    'is_using_12h_mode': lambda rtc: rtc.is_using_12h_mode(),
+    'set_12h_format': lambda rtc: rtc.set_12h_format(True),
+    'get_time': lambda rtc: rtc.get_time(),
+    'set_time': lambda rtc: rtc.set_time(14, 16, 42),
+    'get_date': lambda rtc: rtc.get_date(),
+    'set_date': lambda rtc: rtc.set_date(6, 26, 7, 20),
+    'get_datetime': lambda rtc: rtc.get_datetime(),
+    'get_datetime_tuple': lambda rtc: rtc.get_datetime_tuple(),
+    'get_datetime_object': lambda rtc: rtc.get_datetime_object(),
+    'get_struct_time': lambda rtc: rtc.get_struct_time(),
+    'set_datetime': lambda rtc: rtc.set_datetime(datetime.datetime(2020, 7, 26, 14, 16, 42)),
+    'set_minute_alarm': lambda rtc: rtc.set_minute_alarm(42),
+    'set_hour_alarm_24h_format': lambda rtc: rtc.set_hour_alarm_24h_format(16),
+    'set_hour_alarm_12h_format': lambda rtc: rtc.set_hour_alarm_12h_format(4, True),
+    'set_date_alarm': lambda rtc: rtc.set_date_alarm(24),
+    'set_weekday_alarm': lambda rtc: rtc.set_weekday_alarm(0),
+    'enable_alarm': lambda rtc: rtc.enable_alarm(enable=True, generate_interrupt=True),
+    'set_timer': lambda rtc: rtc.set_timer(5, mp.RV_3028.TIMER_FREQ_1Hz),
+    'enable_timer': lambda rtc: rtc.enable_timer(enable=True, repeat=True, generate_interrupt=True),
+    'get_timer_status': lambda rtc: rtc.get_timer_status(),
+    'set_periodic_time_update': lambda rtc: rtc.set_periodic_time_update(second_period=False),
+    'enable_periodic_time_update_interrupt': lambda rtc: rtc.enable_periodic_time_update_interrupt(True),
+    'clear_interrupt_flags': lambda rtc: rtc.clear_interrupt_flags(),
+    'set_interrupt_mask': lambda rtc: rtc.set_interrupt_mask(True, False, False, False),
+    'enable_event_timestamp': lambda rtc: rtc.enable_event_timestamp(rising_edge=True, overwrite=True),
+    'get_unix_time': lambda rtc: rtc.get_unix_time(),
+    'set_unix_time': lambda rtc: rtc.set_unix_time(1595773002),
+    'get_unix_timestamp': lambda rtc: rtc.get_unix_timestamp(last_edge_ns=0, clock=lambda: 500000000),
+    'read_unix_time_edge': _read_unix_time_edge,
+    'use_eeprom': lambda rtc: rtc.use_eeprom(True),
+    'read_eeprom_register': lambda rtc: rtc.read_eeprom_register(0x10),
+    'write_eeprom_register': lambda rtc: rtc.write_eeprom_register(0x10, 0x42),
+    'read_eeprom': lambda rtc: rtc.read_eeprom(0x00, 0x2B),
+    'write_eeprom': lambda rtc: rtc.write_eeprom(0x00, b'\x42' * 0x2B),
+    'is_eeprom_busy': lambda rtc: rtc.is_eeprom_busy(),
+}
+
+
+def public_methods() -> list:
+    return sorted(name for name, member in inspect.getmembers(mp.RV_3028)
+                  if not name.startswith('_') and callable(member))
+
+
+def measure(scenario, configuration: dict, combined_transfers: bool = False, persistent: bool = True) -> dict:
+    """
+    Runs the scenario on a fresh simulator, with the bus already open and the register cache (if enabled) already
+    loaded (steady state of a long running program).
+
+    :param configuration: the arguments of RV_3028 (see CONFIGURATIONS)
+    :param combined_transfers: if True the simulator offers combined transfers
+    :param persistent: the persistent argument of RV_3028: if False the bus is opened on every transfer
+    :return: the cost of the scenario
+    """
+    sim = mp.RV_3028_Simulator(start=datetime.datetime(2020, 7, 26, 14, 16, 42),
+                               combined_transfers=combined_transfers)
+    device_file = SimulatedDeviceFile(sim)
+    rtc = mp.RV_3028(transport=device_file.open, bus_manager=mp.BusManager(device_file.open), persistent=persistent,
+                     **configuration)
+    rtc.eeprom_wait = mp.BusyWait(sleep=sim.clock.sleep, clock=sim.clock.monotonic)
+    if rtc.register_cache:
+        rtc.sync_register_cache()
+    else:
+        # opens the bus
+        rtc.read_register(mp.RV_3028.USER_RAM1_ADDRESS)
+    sim.reset_transactions()
+    device_file.syscalls = 0
+
+    scenario(rtc)
+
+    transactions = sim.transactions
+    cost = {
+        'transactions': len(transactions),
+        'bytes': sum(transaction_bytes(t.operation, len(t.data), t.parts) for t in transactions),
+        'syscalls': device_file.syscalls,
+    }
+    for frequency in BUS_FREQUENCIES:
+        cost['bus_time_{}k'.format(frequency // 1000)] = sum(
+            transaction_duration(t.operation, len(t.data), frequency, t.parts) for t in transactions)
+    return cost
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="i2c cost of the RV_3028 methods")
+    parser.add_argument('--update', action='store_true', help="rewrite the budgets with the measured costs")
+    parser.add_argument('--combined', action='store_true',
+                        help="simulate a bus with combined transfers (I2C_RDWR transport)")
+    args = parser.parse_args()
+    if args.update and args.combined:
+        parser.error("the budgets are measured without combined transfers")
+
+    with open(BUDGETS_PATH) as budgets_file:
+        budgets = json.load(budgets_file)
+
+    failures = []
+    measured = {}
+    for configuration_name, configuration in CONFIGURATIONS.items():
+        print("{} configuration".format(configuration_name))
+        print("{:40} {:>6} {:>6} {:>10} {:>10} {:>11} {:>11}".format(
+            "method", "trans", "bytes", "syscalls", "per-call", "100kHz [us]", "400kHz [us]"))
+        measured[configuration_name] = {}
+        for name in public_methods():
+            if name not in SCENARIOS:
+                failures.append("{}: no scenario".format(name))
+                continue
+            cost = measured[configuration_name][name] = measure(SCENARIOS[name], configuration, args.combined)
+            per_call = measure(SCENARIOS[name], configuration, args.combined, persistent=False)
+            print("{:40} {:>6} {:>6} {:>10} {:>10} {:>11.0f} {:>11.0f}".format(
+                name, cost['transactions'], cost['bytes'], cost['syscalls'], per_call['syscalls'],
+                cost['bus_time_100k'] * 1e6, cost['bus_time_400k'] * 1e6))
+
+            budget = budgets.get(configuration_name, {}).get(name)
+            if budget is None:
+                failures.append("{} ({}): no budget".format(name, configuration_name))
+                continue
+            for key in ('transactions', 'bytes'):
+                if cost[key] > budget[key]:
+                    failures.append("{} ({}): {} {} over budget {}".format(
+                        name, configuration_name, cost[key], key, budget[key]))
+        print()
+
+    if args.update:
+        with open(BUDGETS_PATH, 'w') as budgets_file:
+            json.dump({configuration_name: {name: {'transactions': cost['transactions'], 'bytes': cost['bytes']}
+                                            for name, cost in costs.items()}
+                       for configuration_name, costs in measured.items()}, budgets_file, indent=2, sort_keys=True)
+            budgets_file.write('\n')
+        print("budgets updated")
+        return 0
+
+    for failure in sorted(set(failures)):
+        print("FAIL", failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -19,9 +19,9 @@ def main():
     # retrieve the datetime from the library datetime
     current_datetime = datetime.datetime.now()
 
-    # set the date and time for the device
-    rtc.set_time(current_datetime.hour, current_datetime.minute, current_datetime.second)
-    rtc.set_date(current_datetime.weekday(), current_datetime.day, current_datetime.month, current_datetime.year % 2000)
+    # set the date and time for the device with a single block write, at the start of the next second
+    # (the same as running: python -m melopero_RV_3028 systohc)
+    rtc.set_datetime(current_datetime, align=True)
     print("Date and Time set to: {}".format(current_datetime))
 
     # print datetime to make sure everything works
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import melopero_RV_3028 as mp
+from signal import pause
+
+
+def main():
+    # First initialize and create the rtc device
+    rtc = mp.RV_3028()
+
+    # First disable other sources of interrupts
+    rtc.enable_alarm(enable=False, generate_interrupt=False)
+    rtc.clear_interrupt_flags()
+
+    # set the timer to repeatedly fire after 5 seconds and the periodic time update to fire every minute
+    rtc.set_timer(5, mp.RV_3028.TIMER_FREQ_1Hz)
+    rtc.enable_timer(enable=True, repeat=True, generate_interrupt=True)
+    rtc.set_periodic_time_update(second_period=False)
+    rtc.enable_periodic_time_update_interrupt(generate_interrupt=True)
+
+    # the dispatcher reads the status register once per interrupt and calls the handler of each source
+    dispatcher = mp.InterruptDispatcher(rtc, mp.GpiozeroInterruptBackend("GPIO4"))
+
+    def on_timer(source):
+        print("Timer: beep beep")
+        print(rtc.get_time())
+
+    def on_time_update(source):
+        print("A minute has passed")
+        print("edges: {} latency: {:.0f} us".format(dispatcher.edges, dispatcher.latency.mean / 1000))
+
+    dispatcher.add_handler(mp.InterruptDispatcher.TIMER, on_timer)
+    dispatcher.add_handler(mp.InterruptDispatcher.PERIODIC_TIME_UPDATE, on_time_update)
+    dispatcher.start()
+    print("Press CTRL + C to terminate program...")
+
+    pause()
+
+
+if __name__ == "__main__":
+    main()
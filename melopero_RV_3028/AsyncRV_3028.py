@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import asyncio
+import copy
+import datetime
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from melopero_RV_3028.RV_3028 import RV_3028
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_bus_executor(bus_number: int) -> ThreadPoolExecutor:
+    """
+    :param bus_number: the i2c bus number
+    :return: the single thread executor that runs all the transfers on bus bus_number
+    """
+    with _executors_lock:
+        executor = _executors.get(bus_number)
+        if executor is None:
+            executor = _executors[bus_number] = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='i2c-{}'.format(bus_number))
+        return executor
+
+
+def _shared_read(name: str):
+    async def method(self, *args, **kwargs):
+        return await self._shared(name, *args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = "Coroutine version of RV_3028.{}. Concurrent identical calls share one transfer.".format(name)
+    return method
+
+
+def _serialized(name: str):
+    async def method(self, *args, **kwargs):
+        return await self.run(getattr(RV_3028, name), *args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = "Coroutine version of RV_3028.{}.".format(name)
+    return method
+
+
+class AsyncRV_3028():
+    """
+    asyncio front-end for RV_3028. The bus transfers run on a single thread executor dedicated to the i2c bus,
+    so they are serialized with the transfers of the other devices on the same bus while the event loop stays
+    free. Concurrent calls to the same read method with the same arguments share a single in-flight transfer.
+
+    Example:
+        async with AsyncRV_3028() as rtc:
+            print(await rtc.get_datetime())
+    """
+
+    def __init__(self, i2c_addr=RV_3028.RV_3028_ADDRESS, i2c_bus=1, rtc: RV_3028 = None, **kwargs):
+        """
+        :param i2c_addr: the i2c address of the device
+        :param i2c_bus: the i2c bus number
+        :param rtc: an existing RV_3028 to wrap. If None a new one is created with i2c_addr, i2c_bus and kwargs.
+        """
+        self.rtc = rtc if rtc is not None else RV_3028(i2c_addr, i2c_bus, **kwargs)
+        self._executor = get_bus_executor(self.rtc.i2c_bus)
+        self._in_flight = {}
+        self._eeprom_lock = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def run(self, function, *args, **kwargs):
+        """
+        Runs function(rtc, *args, **kwargs) on the bus executor. Use it to run a sequence of calls (e.g. a batch)
+        without other transfers in between.
+
+        Example:
+            await artc.run(lambda rtc: rtc.set_timer(5, RV_3028.TIMER_FREQ_1Hz) or rtc.enable_timer(True, True, True))
+
+        :param function: the function to run, its first argument is the wrapped RV_3028
+        :return: the value returned by function
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(function, self.rtc, *args, **kwargs))
+
+    async def _shared(self, name: str, *args, **kwargs):
+        key = (name, args, tuple(sorted(kwargs.items())))
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self.run(getattr(RV_3028, name), *args, **kwargs))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda done: self._in_flight.pop(key, None))
+        # every caller gets its own copy of mutable results (lists, dictionaries)
+        return copy.copy(await asyncio.shield(future))
+
+    async def close(self) -> None:
+        await self.run(RV_3028.close)
+
+    # reads
+    read_register = _shared_read('read_register')
+    read_registers = _shared_read('read_registers')
+    get_field = _shared_read('get_field')
+    get_fields = _shared_read('get_fields')
+    snapshot = _shared_read('snapshot')
+    is_using_12h_mode = _shared_read('is_using_12h_mode')
+    get_time = _shared_read('get_time')
+    get_date = _shared_read('get_date')
+    get_datetime = _shared_read('get_datetime')
+    get_datetime_tuple = _shared_read('get_datetime_tuple')
+    get_datetime_object = _shared_read('get_datetime_object')
+    get_struct_time = _shared_read('get_struct_time')
+    get_timer_status = _shared_read('get_timer_status')
+    get_unix_time = _shared_read('get_unix_time')
+    is_eeprom_busy = _shared_read('is_eeprom_busy')
+
+    # writes
+    write_register = _serialized('write_register')
+    write_registers = _serialized('write_registers')
+    and_or_register = _serialized('and_or_register')
+    set_fields = _serialized('set_fields')
+    apply = _serialized('apply')
+    set_12h_format = _serialized('set_12h_format')
+    set_time = _serialized('set_time')
+    set_date = _serialized('set_date')
+    set_minute_alarm = _serialized('set_minute_alarm')
+    set_hour_alarm_24h_format = _serialized('set_hour_alarm_24h_format')
+    set_hour_alarm_12h_format = _serialized('set_hour_alarm_12h_format')
+    set_date_alarm = _serialized('set_date_alarm')
+    set_weekday_alarm = _serialized('set_weekday_alarm')
+    enable_alarm = _serialized('enable_alarm')
+    set_timer = _serialized('set_timer')
+    enable_timer = _serialized('enable_timer')
+    set_periodic_time_update = _serialized('set_periodic_time_update')
+    enable_periodic_time_update_interrupt = _serialized('enable_periodic_time_update_interrupt')
+    clear_interrupt_flags = _serialized('clear_interrupt_flags')
+    set_interrupt_mask = _serialized('set_interrupt_mask')
+    enable_event_timestamp = _serialized('enable_event_timestamp')
+    use_eeprom = _serialized('use_eeprom')
+    set_unix_time = _serialized('set_unix_time')
+    get_unix_timestamp = _serialized('get_unix_timestamp')
+
+    async def set_datetime(self, dt: datetime.datetime = None, align: bool = False) -> None:
+        """
+        Coroutine version of RV_3028.set_datetime. The wait for the next whole second (align=True) happens on
+        the event loop, not on the bus executor.
+        """
+        start = time.perf_counter()
+        if dt is None:
+            dt = datetime.datetime.now()
+        if align and dt.microsecond:
+            wait = 1 - dt.microsecond / 1000000
+            dt = dt.replace(microsecond=0) + datetime.timedelta(seconds=1)
+            await asyncio.sleep(max(0.0, start + wait - time.perf_counter()))
+        await self.run(RV_3028.set_datetime, dt)
+
+    # eeprom: every register access (command, wait for the end of the command, data read) is a single job of the bus
+    # executor, run under the bus lock of the device (see RV_3028.read_eeprom_register), so the other transfers can
+    # only run between two registers
+
+    def _get_eeprom_lock(self) -> asyncio.Lock:
+        if self._eeprom_lock is None:
+            self._eeprom_lock = asyncio.Lock()
+        return self._eeprom_lock
+
+    async def _read_eeprom_register(self, register_address: int) -> int:
+        return await self.run(RV_3028.read_eeprom_register, register_address)
+
+    async def _write_eeprom_register(self, register_address: int, value: int) -> None:
+        await self.run(RV_3028.write_eeprom_register, register_address, value)
+
+    async def read_eeprom_register(self, register_address: int) -> int:
+        """
+        Coroutine version of RV_3028.read_eeprom_register.
+        """
+        async with self._get_eeprom_lock():
+            return await self._read_eeprom_register(register_address)
+
+    async def write_eeprom_register(self, register_address: int, value: int) -> None:
+        """
+        Coroutine version of RV_3028.write_eeprom_register.
+        """
+        async with self._get_eeprom_lock():
+            await self._write_eeprom_register(register_address, value)
+
+    async def _eeprom_session_start(self) -> bool:
+        refresh_was_enabled = not await self.run(RV_3028.get_field, 'EERD')
+        await self.run(RV_3028.use_eeprom, True)
+        return refresh_was_enabled
+
+    async def read_eeprom(self, start_address: int, length: int) -> bytes:
+        """
+        Coroutine version of RV_3028.read_eeprom.
+        """
+        async with self._get_eeprom_lock():
+            refresh_was_enabled = await self._eeprom_session_start()
+            try:
+                return bytes([await self._read_eeprom_register(address)
+                              for address in range(start_address, start_address + length)])
+            finally:
+                if refresh_was_enabled:
+                    await self.run(RV_3028.use_eeprom, False)
+
+    async def write_eeprom(self, start_address: int, data: bytes) -> int:
+        """
+        Coroutine version of RV_3028.write_eeprom.
+        """
+        programmed = 0
+        async with self._get_eeprom_lock():
+            refresh_was_enabled = await self._eeprom_session_start()
+            try:
+                for address, value in zip(range(start_address, start_address + len(data)), data):
+                    if await self._read_eeprom_register(address) != value:
+                        await self._write_eeprom_register(address, value)
+                        programmed += 1
+            finally:
+                if refresh_was_enabled:
+                    await self.run(RV_3028.use_eeprom, False)
+        return programmed
@@ -4,7 +4,38 @@
 @author: Leonardo La Rocca
 """
 
-from smbus2 import SMBus
+import datetime
+import functools
+import threading
+import time
+import types
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+from melopero_RV_3028.bus import BusLock, BusManager, I2CBus, bus_manager as default_bus_manager
+from melopero_RV_3028.errors import WriteVerificationError
+from melopero_RV_3028.transport import supports_combined_transfers
+from melopero_RV_3028.registers import BCD_TO_DEC, CONFIGURATION_REGISTERS, DEC_TO_BCD, FIELDS, WRITE_ZERO_TO_CLEAR, \
+    RegisterSnapshot, field_changes
+from melopero_RV_3028.wait import BusyWait
+
+if TYPE_CHECKING:
+    from melopero_RV_3028.resilience import CircuitBreaker, RetryPolicy
+
+# lookup tables of the time and date fields
+_SECONDS, _MINUTES, _HOURS, _HOURS_12, _PM, _WEEKDAY, _DATE, _MONTH, _YEAR = (FIELDS[name] for name in (
+    'SECONDS', 'MINUTES', 'HOURS', 'HOURS_12', 'PM', 'WEEKDAY', 'DATE', 'MONTH', 'YEAR'))
+_H12 = FIELDS['H12']
+_TF, _AF, _UF = (FIELDS[name] for name in ('TF', 'AF', 'UF'))
+# registers whose encoding depends on H12: hours and hours alarm
+_HOURS_REGISTERS = frozenset((0x02, 0x08))
+_TIMER_STATUS_0, _TIMER_STATUS_1 = FIELDS['TIMER_STATUS'].part_decode
+
+# registers that are not compared when writes are verified: time keeping and status registers updated by the
+# device, read-only registers, the password registers and the eeprom data (overwritten by the eeprom reads) and
+# command registers
+_UNVERIFIABLE_REGISTERS = frozenset(list(range(0x00, 0x07)) + [0x0C, 0x0D, 0x0E] + list(range(0x14, 0x1F)) +
+                                    list(range(0x21, 0x25)) + [0x26, 0x27, 0x28])
 
 
 class RV_3028():
@@ -54,68 +85,612 @@ class RV_3028():
 
     UNIX_TIME_ADDRESS = 0x1B
 
-    def __init__(self, i2c_addr=RV_3028_ADDRESS, i2c_bus=1):
+    EVENT_CONTROL_ADDRESS = 0x13
+    EVENT_COUNT_ADDRESS = 0x14
+
+    # sampling period of the EVI pin filter
+    EVENT_FILTER_NONE = 0
+    EVENT_FILTER_256Hz = 1
+    '''period 3.9 milliseconds'''
+    EVENT_FILTER_64Hz = 2
+    '''period 15.6 milliseconds'''
+    EVENT_FILTER_8Hz = 3
+    '''period 125 milliseconds'''
+
+    # expected duration of the eeprom commands (seconds)
+    EEPROM_READ_TIME = 0.001
+    EEPROM_WRITE_TIME = 0.010
+
+    # registers mirrored by the register cache, mapped to the bits the device can change on its own.
+    # Volatile bits are always read from the device.
+    CACHED_REGISTERS = {
+        STATUS_REGISTER_ADDRESS: 0xFF,
+        CONTROL1_REGISTER_ADDRESS: 0x00,
+        CONTROL2_REGISTER_ADDRESS: 0x00,
+        EVENT_CONTROL_ADDRESS: 0x00,
+    }
+    # bits that are cleared by the device right after being written (CONTROL2 RESET, EVENT CONTROL TSR)
+    _SELF_CLEARING_BITS = {
+        CONTROL2_REGISTER_ADDRESS: 0x01,
+        EVENT_CONTROL_ADDRESS: 0x04,
+    }
+
+    def __init__(self, i2c_addr=RV_3028_ADDRESS, i2c_bus=1, persistent=True, shared=True, register_cache=False,
+                 bus=None, instrumentation=None, bus_manager: BusManager = None, transport=None,
+                 retry_policy: 'RetryPolicy' = None, circuit_breaker: 'CircuitBreaker' = None, verify_writes=False):
+        """
+        :param i2c_addr: the i2c address of the device
+        :param i2c_bus: the i2c bus number
+        :param persistent: if True the bus is opened once and kept open until close() is called. If False the
+            bus is opened and closed on every register access.
+        :param shared: if True (and persistent) the bus handle is shared with the other devices on the same bus
+        :param register_cache: if True the last known value of the control registers (see CACHED_REGISTERS) is
+            kept in memory, so that reading them or updating some of their bits does not need a bus access. Enable
+            it only if no other program configures the device.
+        :param bus: an open object with the SMBus interface (e.g. an RV_3028_Simulator) to use instead of
+            opening i2c_bus. It is not closed by close().
+        :param instrumentation: a BusInstrumentation that records every bus transfer, or None
+        :param bus_manager: the BusManager that owns the handle and the lock of i2c_bus, defaults to the
+            bus_manager of the module. The devices and drivers using the same manager never interleave their
+            read-modify-write sequences.
+        :param transport: the function that opens i2c_bus, called with the bus number (see transport.py), e.g.
+            transport.I2CRdwrTransport. Defaults to the transport of bus_manager (smbus2.SMBus if installed). A
+            shared bus is opened with the transport of its first user.
+        :param retry_policy: the resilience.RetryPolicy of the failed transfers and their deadline, None to raise
+            the first OSError
+        :param circuit_breaker: a resilience.CircuitBreaker that fails fast after repeated failures, None to always
+            access the bus
+        :param verify_writes: if True the multi-register writes are read back and written again (according to
+            retry_policy) if the registers differ. The registers the device updates on its own are not compared.
+        """
         self.i2c_address = i2c_addr
         self.i2c_bus = i2c_bus
+        self.persistent = persistent
+        self.shared = shared
+        self.bus = bus
+        self._bus = None
+        self.bus_manager = bus_manager if bus_manager is not None else default_bus_manager
+        self.transport = transport
+        self._combined = None
+        # lock held during every register access and multi-register operation. A bus object passed to the
+        # constructor gets a lock of its own.
+        self.lock = BusLock() if bus is not None else self.bus_manager.lock(i2c_bus)
+        self.instrumentation = instrumentation
+        # the public method run by each thread and its deadline, used by the instrumentation and the retry policy
+        self._caller = _Caller()
+        self.register_cache = register_cache
+        self._shadow = {}
+        self._batch = None
+        # strategy used to wait for the end of the eeprom commands
+        self.eeprom_wait = BusyWait()
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self.verify_writes = verify_writes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        """
+        Releases the persistent bus handle. The bus is reopened if the device is accessed again.
+        """
+        bus, self._bus = self._bus, None
+        self._combined = None
+        if bus is not None:
+            if self.shared:
+                self.bus_manager.unregister(bus)
+            else:
+                bus.close()
+
+    def _run_as(self, method: str, function, *args, **kwargs):
+        """
+        Runs function as the public method method, unless the thread is already running a public method: its
+        transfers are reported to the instrumentation as made by method and share the deadline of the retry policy
+        measured from now.
+        """
+        caller = self._caller
+        if caller.method is not None or self.instrumentation is None and self.retry_policy is None:
+            return function(*args, **kwargs)
+        caller.method = method
+        caller.deadline = self.retry_policy.deadline() if self.retry_policy is not None else None
+        try:
+            return function(*args, **kwargs)
+        finally:
+            caller.method = caller.deadline = None
+
+    def _transfer(self, operation: str, *args):
+        if self.retry_policy is None and self.circuit_breaker is None and not self.verify_writes:
+            return self._measured_transfer(operation, *args)
+        if self.retry_policy is None:
+            return self._checked_transfer(operation, *args)
+        deadline = self._caller.deadline
+        if deadline is None:
+            deadline = self.retry_policy.deadline()
+        return self.retry_policy.call(lambda: self._checked_transfer(operation, *args), deadline,
+                                      self._record_retry(operation, args))
+
+    def _record_retry(self, operation: str, args: tuple):
+        if self.instrumentation is None:
+            return None
+        return lambda error: self.instrumentation.record_retry(self, operation, args)
+
+    def _checked_transfer(self, operation: str, *args):
+        """
+        A single attempt of a transfer, through the circuit breaker and verified if verify_writes is True.
+        """
+        breaker = self.circuit_breaker
+        if breaker is not None:
+            breaker.check()
+        try:
+            result = self._measured_transfer(operation, *args)
+            if self.verify_writes:
+                self._verify_write(operation, args)
+        except OSError:
+            if breaker is not None and breaker.record_failure() and self.instrumentation is not None:
+                self.instrumentation.record_circuit_trip(self)
+            raise
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+    def _verify_write(self, operation: str, args: tuple) -> None:
+        if operation == 'write_i2c_block_data':
+            writes = [args]
+        elif operation == 'combined_transfer':
+            writes = [(start, values) for kind, start, values in args[0] if kind == 'write']
+        else:
+            return
+        if sum(len(values) for _, values in writes) < 2:
+            return
+        if len(writes) > 1:
+            read_back = self._measured_transfer('combined_transfer', [
+                ('read', start, len(values)) for start, values in writes])
+        else:
+            read_back = [self._measured_transfer('read_i2c_block_data', writes[0][0], len(writes[0][1]))]
+        for (start, values), actual in zip(writes, read_back):
+            for reg_address, (expected, value) in enumerate(zip(values, actual), start):
+                if reg_address in _UNVERIFIABLE_REGISTERS:
+                    continue
+                mask = ~(RV_3028.CACHED_REGISTERS.get(reg_address, 0) |
+                         RV_3028._SELF_CLEARING_BITS.get(reg_address, 0)) & 0xFF
+                if (expected ^ value) & mask:
+                    raise WriteVerificationError("register 0x{:02X} reads 0x{:02X} after writing 0x{:02X}".format(
+                        reg_address, value, expected & 0xFF))
+
+    def _measured_transfer(self, operation: str, *args):
+        if self.instrumentation is not None:
+            return self.instrumentation.measure(self, self._bus_transfer, operation, *args)
+        return self._bus_transfer(operation, *args)
+
+    def _bus_transfer(self, operation: str, *args):
+        if self.bus is not None:
+            return getattr(self.bus, operation)(self.i2c_address, *args)
+
+        if not self.persistent:
+            with (self.transport or self.bus_manager.transport)(self.i2c_bus) as bus:
+                return getattr(bus, operation)(self.i2c_address, *args)
+
+        try:
+            return getattr(self._get_bus(), operation)(self.i2c_address, *args)
+        except OSError:
+            # drop the handle, the bus will be reopened on the next access
+            self._bus.reset()
+            raise
+
+    def _get_bus(self):
+        if self._bus is None:
+            if self.shared:
+                self._bus = self.bus_manager.register(self.i2c_bus, self.transport)
+            else:
+                self._bus = I2CBus(self.i2c_bus, self.lock, self.transport or self.bus_manager.transport)
+        return self._bus.get()
+
+    @property
+    def combined_transfers(self) -> bool:
+        """
+        True if the bus can run several transfers in a single transaction (see transport.I2CRdwrTransport). The
+        reads and writes of non-adjacent registers (get_fields, batch, snapshot, apply) then take a single
+        transaction. Opens the bus if needed.
+        """
+        if self._combined is None:
+            if self.bus is not None:
+                self._combined = supports_combined_transfers(self.bus)
+            elif not self.persistent:
+                self._combined = False
+            else:
+                with self.locked():
+                    self._combined = supports_combined_transfers(self._get_bus())
+        return self._combined
+
+    @contextmanager
+    def locked(self):
+        """
+        Holds the bus lock for the duration of the with block, so that a sequence of calls is not interleaved
+        with the register accesses of other threads or of the other drivers registered with the same bus
+        manager. The lock is re-entrant. The time spent waiting for the lock is reported to the instrumentation.
+
+        Example:
+            with rtc.locked():
+                if rtc.read_register(RV_3028.USER_RAM1_ADDRESS) == 0:
+                    rtc.write_register(RV_3028.USER_RAM1_ADDRESS, 1)
+        """
+        wait = self.lock.acquire()
+        try:
+            if wait and self.instrumentation is not None:
+                self.instrumentation.record_lock_wait(self, wait)
+            yield self
+        finally:
+            self.lock.release()
 
     def read_register(self, reg_address: int) -> int:
-        with SMBus(self.i2c_bus) as bus:
-            return bus.read_byte_data(self.i2c_address, reg_address)
+        with self.locked():
+            pending = self._batch.get(reg_address) if self._batch else None
+            if pending is not None and not pending[0]:
+                return pending[1]
+
+            if self._is_cached(reg_address):
+                value = self._shadow[reg_address]
+            else:
+                value = self._transfer('read_byte_data', reg_address)
+                self._update_shadow(reg_address, value)
+
+        if pending is not None:
+            value = value & pending[0] | pending[1]
+        return value
 
     def read_registers(self, start_reg_address: int, amount: int) -> list:
-        with SMBus(self.i2c_bus) as bus:
-            return bus.read_i2c_block_data(self.i2c_address, start_reg_address, amount)
+        with self.locked():
+            values = self._transfer('read_i2c_block_data', start_reg_address, amount)
+            if self.register_cache:
+                for reg_address, value in enumerate(values, start_reg_address):
+                    self._update_shadow(reg_address, value)
+            if self._batch:
+                for reg_address, (and_flag, or_flag) in self._batch.items():
+                    if 0 <= reg_address - start_reg_address < len(values):
+                        values[reg_address - start_reg_address] = \
+                            values[reg_address - start_reg_address] & and_flag | or_flag
+        return values
 
     def write_register(self, reg_address: int, value: int) -> None:
-        with SMBus(self.i2c_bus) as bus:
-            bus.write_byte_data(self.i2c_address, reg_address, value)
+        with self.locked():
+            if self._batch is not None:
+                self._batch[reg_address] = (0, value & 0xFF)
+                return
+            self._transfer('write_byte_data', reg_address, value)
+            self._update_shadow(reg_address, value)
+
+    def write_registers(self, start_reg_address: int, values: list) -> None:
+        """
+        Writes consecutive registers with a single block write.
+
+        :param start_reg_address: the address of the first register
+        :param values: the values to write
+        :return:
+        """
+        with self.locked():
+            if self._batch is not None:
+                for reg_address, value in enumerate(values, start_reg_address):
+                    self._batch[reg_address] = (0, value & 0xFF)
+                return
+            values = list(values)
+            self._transfer('write_i2c_block_data', start_reg_address, values)
+            if self.register_cache:
+                for reg_address, value in enumerate(values, start_reg_address):
+                    self._update_shadow(reg_address, value)
+
+    def _is_cached(self, reg_address: int) -> bool:
+        return self.register_cache and reg_address in self._shadow and not RV_3028.CACHED_REGISTERS[reg_address]
+
+    def _is_known(self, reg_address: int) -> bool:
+        """
+        :return: True if the value of the register is known without a transfer (register cache or pending batch
+            write)
+        """
+        pending = self._batch.get(reg_address) if self._batch else None
+        return self._is_cached(reg_address) or pending is not None and not pending[0]
+
+    def get_field(self, name: str) -> int:
+        """
+        :param name: the name of a field of the register map (see registers.FIELDS), e.g. 'TE' or 'TIMER_VALUE'
+        :return: the value of the field
+        """
+        field = FIELDS[name]
+        if field.decode is not None:
+            return field.decode[self.read_register(field.registers[0])]
+        return self.get_fields(name)[name]
+
+    def get_fields(self, *names) -> dict:
+        """
+        Reads any combination of fields with the fewest transfers: the registers in the register cache are not
+        read, the others are read with block reads (registers separated by small gaps are read together).
+
+        :param names: the names of fields of the register map (see registers.FIELDS)
+        :return: a dictionary field name -> value
+        """
+        fields = [FIELDS[name] for name in names]
+        registers = [0] * 0x40
+        with self.locked():
+            to_read = []
+            for reg_address in sorted({reg_address for field in fields for reg_address in field.registers}):
+                if self._is_known(reg_address):
+                    registers[reg_address] = self.read_register(reg_address)
+                else:
+                    to_read.append(reg_address)
+            self._read_runs(self._register_runs(to_read, max_gap=3), registers)
+        return {field.name: field.from_registers(registers) for field in fields}
+
+    def set_fields(self, **values) -> None:
+        """
+        Sets any combination of fields with the fewest transfers: the changes are merged per register and
+        written like a batch (see batch()). A register is read first only if some bits of other fields must be
+        kept and they are not in the register cache.
+
+        Example:
+            rtc.set_fields(TIMER_VALUE=5, TD=RV_3028.TIMER_FREQ_1Hz, TRPT=1, TE=1)
+
+        :param values: field name (see registers.FIELDS) -> value
+        :return:
+        """
+        with self.batch():
+            pending = self._batch
+            for name, value in values.items():
+                field = FIELDS[name]
+                if field.read_only:
+                    raise ValueError("{} is read only".format(name))
+                for reg_address, keep, bits in field.to_registers(value):
+                    pending_and, pending_or = pending.get(reg_address, (0xFF, 0))
+                    pending[reg_address] = (pending_and & keep, pending_or & keep | bits)
 
     def and_or_register(self, reg_address: int, and_flag: int, or_flag: int) -> None:
-        regval = self.read_register(reg_address)
-        regval &= and_flag
-        regval |= or_flag
-        self.write_register(reg_address, regval)
+        with self.batch():
+            pending_and, pending_or = self._batch.get(reg_address, (0xFF, 0))
+            self._batch[reg_address] = (pending_and & and_flag & 0xFF, (pending_or & and_flag | or_flag) & 0xFF)
+
+    @contextmanager
+    def batch(self):
+        """
+        Groups register updates. Inside the with block the calls to write_register, write_registers and
+        and_or_register are only recorded and merged per register (the masks are combined, the last write wins).
+        When the outermost block exits without errors the registers are written in address order, using block
+        writes for adjacent registers, except for CONTROL2 which is written first if the hours registers are
+        written too (they are encoded for the new 12h/24h format). The registers whose new value depends on their
+        current content are read first (from the register cache when possible, adjacent registers with a single
+        block read).
+        If the block raises an exception nothing is written. The bus lock is held from the start of the block
+        until the registers are written, so read-modify-write updates are atomic.
+
+        Register reads inside the block return the pending values. EEPROM operations must not be run inside
+        a batch, as they rely on the order of the register accesses.
+
+        Example:
+            with rtc.batch():
+                rtc.enable_timer(enable=True, repeat=True, generate_interrupt=True)
+                rtc.enable_alarm(enable=True, generate_interrupt=True)
+        """
+        with self.locked():
+            if self._batch is not None:
+                # nested batch: the outermost one writes the registers
+                yield self
+                return
+
+            self._batch = {}
+            try:
+                yield self
+                pending = self._batch
+            finally:
+                self._batch = None
+            self._run_as('batch', self._write_pending, pending)
+
+    def _write_pending(self, pending: dict) -> None:
+        values = {}
+        to_read = []
+        for reg_address, (and_flag, or_flag) in pending.items():
+            clear_only = WRITE_ZERO_TO_CLEAR.get(reg_address)
+            if clear_only is not None:
+                # the flags that are kept are written 1 instead of the value read, which could clear a flag raised
+                # in the meantime
+                pending[reg_address] = and_flag, or_flag = and_flag & ~clear_only, or_flag | and_flag & clear_only
+            if not and_flag & ~or_flag:
+                # every bit is set by the pending operations
+                values[reg_address] = or_flag
+                continue
+            cached = self._shadow.get(reg_address) if self.register_cache else None
+            # the cached value can be used only if all the bits that are kept are non volatile
+            if cached is not None and not RV_3028.CACHED_REGISTERS[reg_address] & and_flag & ~or_flag:
+                values[reg_address] = cached & and_flag | or_flag
+            else:
+                to_read.append(reg_address)
+
+        if to_read:
+            current = [0] * 0x40
+            self._read_runs(self._register_runs(sorted(to_read)), current)
+            for reg_address in to_read:
+                and_flag, or_flag = pending[reg_address]
+                values[reg_address] = current[reg_address] & and_flag | or_flag
+
+        # the hours registers are encoded for the pending 12h/24h format (CONTROL2.H12): it is written first
+        if RV_3028.CONTROL2_REGISTER_ADDRESS in values and not _HOURS_REGISTERS.isdisjoint(values):
+            self._write_runs({RV_3028.CONTROL2_REGISTER_ADDRESS: values.pop(RV_3028.CONTROL2_REGISTER_ADDRESS)})
+        self._write_runs(values)
+
+    def _read_runs(self, runs: list, registers: list) -> None:
+        """
+        Reads [start, amount] runs of registers into registers (indexed by address), with a single combined
+        transfer if the bus supports it.
+        """
+        if len(runs) > 1 and self.combined_transfers:
+            results = self._transfer('combined_transfer', [('read', start, amount) for start, amount in runs])
+            for (start, amount), values in zip(runs, results):
+                for reg_address, value in enumerate(values, start):
+                    self._update_shadow(reg_address, value)
+                    pending = self._batch.get(reg_address) if self._batch else None
+                    registers[reg_address] = value & pending[0] | pending[1] if pending is not None else value
+            return
+        for start, amount in runs:
+            if amount > 1:
+                registers[start:start + amount] = self.read_registers(start, amount)
+            else:
+                registers[start] = self.read_register(start)
+
+    def _write_runs(self, values: dict) -> None:
+        """
+        Writes register address -> value, with block writes for adjacent registers and a single combined transfer
+        if the bus supports it.
+        """
+        runs = self._register_runs(sorted(values))
+        if len(runs) > 1 and self._batch is None and self.combined_transfers:
+            self._transfer('combined_transfer', [
+                ('write', start, [values[reg_address] for reg_address in range(start, start + amount)])
+                for start, amount in runs])
+            for reg_address, value in values.items():
+                self._update_shadow(reg_address, value)
+            return
+        for start, amount in runs:
+            if amount > 1:
+                self.write_registers(start, [values[reg_address] for reg_address in range(start, start + amount)])
+            else:
+                self.write_register(start, values[start])
+
+    @staticmethod
+    def _register_runs(reg_addresses: list, max_gap: int = 0) -> list:
+        """
+        :param reg_addresses: sorted register addresses
+        :param max_gap: the maximum amount of missing addresses inside a run (only for reads)
+        :return: a list of [start, amount] runs of consecutive addresses, at most 32 registers long (the maximum
+            size of an smbus block transfer)
+        """
+        runs = []
+        for reg_address in reg_addresses:
+            if runs and reg_address - runs[-1][0] - runs[-1][1] <= max_gap and reg_address - runs[-1][0] < 32:
+                runs[-1][1] = reg_address - runs[-1][0] + 1
+            else:
+                runs.append([reg_address, 1])
+        return runs
+
+    def _update_shadow(self, reg_address: int, value: int) -> None:
+        if self.register_cache and reg_address in RV_3028.CACHED_REGISTERS:
+            self._shadow[reg_address] = value & 0xFF & ~RV_3028._SELF_CLEARING_BITS.get(reg_address, 0)
+
+    def invalidate_register_cache(self, reg_address: int = None) -> None:
+        """
+        Forgets the cached value of a register, or of all the cached registers if reg_address is None.
+        Call this if the device might have been configured by someone else.
+
+        :param reg_address: the register to forget or None
+        :return:
+        """
+        if reg_address is None:
+            self._shadow.clear()
+        else:
+            self._shadow.pop(reg_address, None)
+
+    def sync_register_cache(self) -> None:
+        """
+        Reloads all the cached registers from the device with a single block read.
+        """
+        self.invalidate_register_cache()
+        start = min(RV_3028.CACHED_REGISTERS)
+        self.read_registers(start, max(RV_3028.CACHED_REGISTERS) - start + 1)
+
+    def snapshot(self, start_reg_address: int = 0x00, end_reg_address: int = 0x3F) -> RegisterSnapshot:
+        """
+        Reads consecutive registers with block reads of up to 32 registers (two for the whole register map).
+
+        :param start_reg_address: the address of the first register
+        :param end_reg_address: the address of the last register
+        :return: an immutable copy of the registers
+        """
+        registers = [0] * 0x40
+        runs = [[start, min(32, end_reg_address + 1 - start)]
+                for start in range(start_reg_address, end_reg_address + 1, 32)]
+        with self.locked():
+            self._read_runs(runs, registers)
+        return RegisterSnapshot(registers[start_reg_address:end_reg_address + 1], start_reg_address)
+
+    def apply(self, desired) -> list:
+        """
+        Brings the device to a desired configuration writing only the registers that differ, with block writes
+        for adjacent registers. The registers involved are read first with a single snapshot, so applying a
+        configuration that is already in place costs one block read and no writes (running timers are not
+        restarted).
+
+        Example:
+            rtc.apply({'H12': 0, 'TIMER_VALUE': 5, 'TD': RV_3028.TIMER_FREQ_1Hz, 'TRPT': 1, 'TE': 1, 'TIE': 1})
+
+        :param desired: a dictionary field name (see registers.FIELDS) -> value, or a RegisterSnapshot whose
+            configuration registers (see registers.CONFIGURATION_REGISTERS) are restored
+        :return: the list of (register address, old value, new value) tuples of the registers written
+        """
+        if isinstance(desired, RegisterSnapshot):
+            changes = [(reg_address, 0xFF, desired[reg_address]) for reg_address in CONFIGURATION_REGISTERS
+                       if reg_address in desired]
+        else:
+            for name in desired:
+                if FIELDS[name].read_only:
+                    raise ValueError("{} is read only".format(name))
+            changes = field_changes(desired)
+        if not changes:
+            return []
+
+        with self.locked():
+            live = self.snapshot(changes[0][0], changes[-1][0])
+            values = {reg_address: live[reg_address] & ~mask | bits for reg_address, mask, bits in changes}
+            changed = [reg_address for reg_address in sorted(values) if values[reg_address] != live[reg_address]]
+            # the write_zero_to_clear flags that are not set are written 1, so that a flag raised since the snapshot
+            # is kept
+            masks = {reg_address: mask for reg_address, mask, _ in changes}
+            self._write_runs({reg_address: values[reg_address] | WRITE_ZERO_TO_CLEAR.get(reg_address, 0) &
+                              ~masks[reg_address] for reg_address in changed})
+        return [(reg_address, live[reg_address], values[reg_address]) for reg_address in changed]
 
     def _bcd_to_dec(self, bcd: int) -> int:
         """
         :param bcd: 8 bit value expressed in binary coded decimal
         :return: the value converted in decimal format
         """
-        return (bcd // 0x10 * 10) + (bcd % 0x10)
+        return BCD_TO_DEC[bcd]
 
     def _dec_to_bcd(self, dec: int) -> int:
         """
         :param dec: 8 bit value expressed in decimal
         :return: the value converted in binary coded decimal format
         """
-        return ((dec // 10) << 4) ^ (dec % 10)
+        return DEC_TO_BCD[dec]
 
     def is_using_12h_mode(self) -> bool:
-        return bool(self.read_register(RV_3028.CONTROL2_REGISTER_ADDRESS) & 0x02)
+        return bool(_H12.decode[self.read_register(RV_3028.CONTROL2_REGISTER_ADDRESS)])
 
     def set_12h_format(self, enable_12h_format=True) -> None:
-        and_val = 0xFF if enable_12h_format else ~ 0x02
-        or_val = 0x02 if enable_12h_format else 0
-        self.and_or_register(RV_3028.CONTROL2_REGISTER_ADDRESS, and_val, or_val)
+        self.set_fields(H12=int(enable_12h_format))
+
+    def _read_time_registers(self, amount: int) -> tuple:
+        """
+        Reads the first amount time registers (from SECONDS) and the 12h/24h mode with a single block read: unless
+        CONTROL2 is known without a transfer (see register_cache), the block extends to it.
+
+        :return: a tuple (register values, True if the device is using the 12h mode)
+        """
+        with self.locked():
+            if self._is_known(RV_3028.CONTROL2_REGISTER_ADDRESS):
+                return self.read_registers(RV_3028.SECONDS_REGISTER_ADDRESS, amount), self.is_using_12h_mode()
+            values = self.read_registers(RV_3028.SECONDS_REGISTER_ADDRESS, RV_3028.CONTROL2_REGISTER_ADDRESS + 1)
+        return values[:amount], bool(_H12.decode[values[RV_3028.CONTROL2_REGISTER_ADDRESS]])
 
     def get_time(self) -> dict:
         """
         :return: a dictionary containing the current time (seconds : minutes : hours)
         """
-        keys = ['s', 'm', 'h']
-        values = [self._bcd_to_dec(bcd_byte) for bcd_byte in self.read_registers(RV_3028.SECONDS_REGISTER_ADDRESS, 2)]
-        # reading hour
-        hour_bcd = self.read_register(RV_3028.HOURS_REGISTER_ADDRESS)
-        if self.is_using_12h_mode():
-            # ampm hour value
-            values.append(self._bcd_to_dec(hour_bcd & 0x1F))
-            # period
-            keys.append('period')
-            values.append('pm' if hour_bcd & 0x20 else 'am')
-        else:
-            values.append(self._bcd_to_dec(hour_bcd))
+        return self._decode_time(*self._read_time_registers(3))
 
-        return dict(zip(keys, values))
+    def _decode_time(self, values: list, use_12h_mode: bool) -> dict:
+        seconds, minutes, hours = values[:3]
+        if use_12h_mode:
+            return {'s': _SECONDS.decode[seconds], 'm': _MINUTES.decode[minutes], 'h': _HOURS_12.decode[hours],
+                    'period': 'pm' if _PM.decode[hours] else 'am'}
+        return {'s': _SECONDS.decode[seconds], 'm': _MINUTES.decode[minutes], 'h': _HOURS.decode[hours]}
 
     def set_time(self, hours: int, minutes: int, seconds: int = -1) -> None:
         """
@@ -124,28 +699,37 @@ class RV_3028():
         :param seconds: must be an integer in range 0-59
         :return:
         """
-        hours_bcd = self._dec_to_bcd(hours)
-        if self.is_using_12h_mode():
-            self.set_12h_format(False)
-            self.write_register(RV_3028.HOURS_REGISTER_ADDRESS, hours_bcd)
-            self.set_12h_format(True)
-        else:
-            self.write_register(RV_3028.HOURS_REGISTER_ADDRESS, hours_bcd)
+        fields = self._hour_fields(hours)
+        fields['MINUTES'] = minutes
+        if seconds > -1:
+            fields['SECONDS'] = seconds
+        self.set_fields(**fields)
 
-        minutes_bcd = self._dec_to_bcd(minutes)
-        self.write_register(RV_3028.MINUTES_REGISTER_ADDRESS, minutes_bcd)
+    def _hour_fields(self, hours: int) -> dict:
+        """
+        :param hours: the hours in 24h format
+        :return: the hour fields in the format (12h/24h) the device is using
+        """
+        if self.is_using_12h_mode():
+            return {'HOURS_12': hours % 12 or 12, 'PM': int(hours >= 12)}
+        return {'HOURS': hours}
 
-        if seconds > -1:
-            seconds_bcd = self._dec_to_bcd(seconds)
-            self.write_register(RV_3028.SECONDS_REGISTER_ADDRESS, seconds_bcd)
+    def _encode_hours(self, hours: int) -> int:
+        """
+        :param hours: the hours in 24h format
+        :return: the value of the hours register in the format (12h/24h) the device is using
+        """
+        if self.is_using_12h_mode():
+            return _HOURS_12.encode[hours % 12 or 12] | _PM.encode[hours >= 12]
+        return _HOURS.encode[hours]
 
     def get_date(self) -> dict:
         """
         :return: a dictionary containing the current date (weekday : date : month : year)
         """
-        dec_bytes = [self._bcd_to_dec(bcd_byte) for bcd_byte in
-                     self.read_registers(RV_3028.WEEKDAY_REGISTER_ADDRESS, 4)]
-        return dict(zip(['weekday', 'date', 'month', 'year'], dec_bytes))
+        weekday, date, month, year = self.read_registers(RV_3028.WEEKDAY_REGISTER_ADDRESS, 4)
+        return {'weekday': _WEEKDAY.decode[weekday], 'date': _DATE.decode[date], 'month': _MONTH.decode[month],
+                'year': _YEAR.decode[year]}
 
     def set_date(self, weekday: int, date: int, month: int, year: int) -> None:
         """
@@ -155,18 +739,79 @@ class RV_3028():
         :param year: must be an integer in range 0-99
         :return:
         """
-        self.write_register(RV_3028.WEEKDAY_REGISTER_ADDRESS, self._dec_to_bcd(weekday))
-        self.write_register(RV_3028.DATE_REGISTER_ADDRESS, self._dec_to_bcd(date))
-        self.write_register(RV_3028.MONTH_REGISTER_ADDRESS, self._dec_to_bcd(month))
-        self.write_register(RV_3028.YEAR_REGISTER_ADDRESS, self._dec_to_bcd(year))
+        self.set_fields(WEEKDAY=weekday, DATE=date, MONTH=month, YEAR=year)
 
     def get_datetime(self) -> dict:
         """
         :return: a Dictionary containing the current date and time
         """
-        datetime = self.get_time()
-        datetime.update(self.get_date())
-        return datetime
+        values, use_12h_mode = self._read_time_registers(7)
+        datetime_dict = self._decode_time(values, use_12h_mode)
+        datetime_dict['weekday'] = _WEEKDAY.decode[values[3]]
+        datetime_dict['date'] = _DATE.decode[values[4]]
+        datetime_dict['month'] = _MONTH.decode[values[5]]
+        datetime_dict['year'] = _YEAR.decode[values[6]]
+        return datetime_dict
+
+    def get_datetime_tuple(self) -> tuple:
+        """
+        Reads all the time and date registers (0x00 - 0x06) and the 12h/24h mode with a single block read, so
+        that the returned values are always consistent with each other.
+
+        :return: a tuple (year, month, date, hours, minutes, seconds, weekday). The year is in range 2000-2099
+            and the hours are always in 24h format.
+        """
+        (seconds, minutes, hours, weekday, date, month, year), use_12h_mode = self._read_time_registers(7)
+        if use_12h_mode:
+            hours = _HOURS_12.decode[hours] % 12 + 12 * _PM.decode[hours]
+        else:
+            hours = _HOURS.decode[hours]
+        return (2000 + _YEAR.decode[year], _MONTH.decode[month], _DATE.decode[date], hours, _MINUTES.decode[minutes],
+                _SECONDS.decode[seconds], _WEEKDAY.decode[weekday])
+
+    def get_datetime_object(self) -> datetime.datetime:
+        """
+        :return: the current date and time as a naive datetime.datetime (read with a single block read)
+        """
+        return datetime.datetime(*self.get_datetime_tuple()[:6])
+
+    def get_struct_time(self) -> time.struct_time:
+        """
+        :return: the current date and time as a time.struct_time (read with a single block read).
+            tm_wday is the weekday stored in the device.
+        """
+        year, month, date, hours, minutes, seconds, weekday = self.get_datetime_tuple()
+        yday = datetime.date(year, month, date).timetuple().tm_yday
+        return time.struct_time((year, month, date, hours, minutes, seconds, weekday, yday, -1))
+
+    def set_datetime(self, dt: datetime.datetime = None, align: bool = False) -> None:
+        """
+        Sets the date and time with a single block write of the registers 0x00 - 0x06. The hours are encoded
+        in the format (12h/24h) the device is using. Writing the seconds register resets the sub-second
+        prescaler, so the device starts counting from the second that has been written.
+
+        :param dt: the date and time to set, defaults to datetime.datetime.now(). The year must be in range
+            2000-2099.
+        :param align: if True waits for the next whole second of the source clock and sets the device to that
+            second. If dt is given it is taken as the current reading of the source clock.
+        :return:
+        """
+        start = time.perf_counter()
+        if dt is None:
+            dt = datetime.datetime.now()
+
+        wait = 0
+        if align and dt.microsecond:
+            wait = 1 - dt.microsecond / 1000000
+            dt = dt.replace(microsecond=0) + datetime.timedelta(seconds=1)
+
+        values = [_SECONDS.encode[dt.second], _MINUTES.encode[dt.minute], self._encode_hours(dt.hour),
+                  _WEEKDAY.encode[dt.weekday()], _DATE.encode[dt.day], _MONTH.encode[dt.month],
+                  _YEAR.encode[dt.year % 100]]
+
+        if wait:
+            time.sleep(max(0.0, start + wait - time.perf_counter()))
+        self.write_registers(RV_3028.SECONDS_REGISTER_ADDRESS, values)
 
     def set_minute_alarm(self, minute: int, enable=True) -> None:
         """
@@ -174,8 +819,7 @@ class RV_3028():
         :param enable: if false disables the alarm
         :return:
         """
-        bcd_minute = self._dec_to_bcd(minute) | ((not enable) << 7)
-        self.write_register(RV_3028.MINUTES_ALARM_REGISTER_ADDRESS, bcd_minute)
+        self.set_fields(MINUTES_ALARM=minute, AE_M=int(not enable))
 
     def set_hour_alarm_24h_format(self, hour: int, enable=True) -> None:
         """
@@ -186,8 +830,7 @@ class RV_3028():
         :param enable: if false disables the alarm
         :return:
         """
-        bcd_hour = self._dec_to_bcd(hour) | ((not enable) << 7)
-        self.write_register(RV_3028.HOURS_ALARM_REGISTER_ADDRESS, bcd_hour)
+        self.set_fields(HOURS_ALARM=hour, AE_H=int(not enable))
 
     def set_hour_alarm_12h_format(self, hour: int, pm: bool, enable=True):
         """
@@ -199,8 +842,7 @@ class RV_3028():
         :param enable: if false disables the alarm
         :return:
         """
-        bcd_hour = self._dec_to_bcd(hour) | (pm << 5) | ((not enable) << 7)
-        self.write_register(RV_3028.HOURS_ALARM_REGISTER_ADDRESS, bcd_hour)
+        self.set_fields(HOURS_12_ALARM=hour, PM_ALARM=int(pm), AE_H=int(not enable))
 
     def set_date_alarm(self, date: int, enable=True) -> None:
         """
@@ -210,10 +852,8 @@ class RV_3028():
         :param enable: if false disables the alarm
         :return:
         """
-        # set the WADA bit to 1 for date alarm
-        self.and_or_register(RV_3028.CONTROL2_REGISTER_ADDRESS, 0xFF, 0x20)
-        bcd_date = self._dec_to_bcd(date) | ((not enable) << 7)
-        self.write_register(RV_3028.WEEKDAY_DATE_ALARM_REGISTER_ADDRESS, bcd_date)
+        # the WADA bit selects the date alarm
+        self.set_fields(WADA=1, WEEKDAY_DATE_ALARM=date, AE_WD=int(not enable))
 
     def set_weekday_alarm(self, weekday: int, enable=True) -> None:
         """
@@ -223,10 +863,7 @@ class RV_3028():
         :param enable:
         :return:
         """
-        # set the WADA bit to 0 for weekday alarm
-        self.and_or_register(RV_3028.CONTROL2_REGISTER_ADDRESS, ~0x20, 0)
-        bcd_weekday = self._dec_to_bcd(weekday) | ((not enable) << 7)
-        self.write_register(RV_3028.WEEKDAY_DATE_ALARM_REGISTER_ADDRESS, bcd_weekday)
+        self.set_fields(WADA=0, WEEKDAY_DATE_ALARM=weekday, AE_WD=int(not enable))
 
     def enable_alarm(self, enable: bool, generate_interrupt: bool) -> None:
         """
@@ -236,24 +873,11 @@ class RV_3028():
         :param generate_interrupt: if True the alarm will trigger an interrupt on the INT pin.
         :return:
         """
-        # TODO: replace if else statements with bit operations
-
-        # reset AF bit in STATUS reg
-        self.and_or_register(RV_3028.STATUS_REGISTER_ADDRESS, ~0x04, 0)
-        if enable:
-            if generate_interrupt:
-                # enable AIE bit in CONTROL 2 reg
-                self.and_or_register(RV_3028.CONTROL2_REGISTER_ADDRESS, 0xFF, 0x08)
-            else:
-                # disable AIE bit in CONTROL 2 reg
-                self.and_or_register(RV_3028.CONTROL2_REGISTER_ADDRESS, ~0x08, 0)
-        else:
-            # disable AIE bit in CONTROL 2 reg
-            self.and_or_register(RV_3028.CONTROL2_REGISTER_ADDRESS, ~0x08, 0)
-            # disable all alarm flags
-            self.set_minute_alarm(0, False)
-            self.set_hour_alarm_24h_format(0, False)
-            self.set_date_alarm(0, False)
+        fields = {'AF': 0, 'AIE': int(enable and generate_interrupt)}
+        if not enable:
+            # disable all the alarm comparisons
+            fields.update(MINUTES_ALARM=0, AE_M=1, HOURS_ALARM=0, AE_H=1, WADA=1, WEEKDAY_DATE_ALARM=0, AE_WD=1)
+        self.set_fields(**fields)
 
     def set_timer(self, ticks: int, frequency: int) -> None:
         """
@@ -263,11 +887,7 @@ class RV_3028():
         :param frequency: the frequency of the ticks. Must be one of TIMER_FREQ_X
         :return:
         """
-        value_lsb = ticks & 0xFF
-        value_msb = (ticks >> 8) & 0xFF
-        self.write_register(RV_3028.TIMER_VALUE_0_ADDRESS, value_lsb)
-        self.write_register(RV_3028.TIMER_VALUE_1_ADDRESS, value_msb)
-        self.and_or_register(RV_3028.CONTROL1_REGISTER_ADDRESS, 0x3F << 2 | frequency, frequency)
+        self.set_fields(TIMER_VALUE=ticks, TD=frequency)
 
     def enable_timer(self, enable: bool, repeat: bool, generate_interrupt: bool) -> None:
         """
@@ -278,29 +898,7 @@ class RV_3028():
         :param generate_interrupt: if true an interrupt will be triggered on the INT pin when the timer ends
         :return:
         """
-        # TODO: replace if else statements with bit operations
-        if not enable:
-            # disable TE bit to disable the timer
-            self.and_or_register(RV_3028.CONTROL1_REGISTER_ADDRESS, 0xFB, 0)
-            # disable TIE bit to disable the timer interrupt
-            self.and_or_register(RV_3028.CONTROL2_REGISTER_ADDRESS, 0xEF, 0)
-
-        # reset the TF bit
-        self.and_or_register(RV_3028.STATUS_REGISTER_ADDRESS, 0xF7, 0)
-        # enable/disable TRPT
-        if repeat:
-            self.and_or_register(RV_3028.CONTROL1_REGISTER_ADDRESS, 0xFF, 0x80)
-        else:
-            self.and_or_register(RV_3028.CONTROL1_REGISTER_ADDRESS, 0x7F, 0)
-
-        if enable:
-            # enable/disable interrupt
-            if generate_interrupt:
-                self.and_or_register(RV_3028.CONTROL2_REGISTER_ADDRESS, 0xFF, 0x10)
-            else:
-                self.and_or_register(RV_3028.CONTROL2_REGISTER_ADDRESS, 0xEF, 0)
-            # start timer
-            self.and_or_register(RV_3028.CONTROL1_REGISTER_ADDRESS, 0xFF, 0x04)
+        self.set_fields(TF=0, TRPT=int(repeat), TIE=int(enable and generate_interrupt), TE=int(enable))
 
     def get_timer_status(self) -> int:
         """
@@ -309,8 +907,8 @@ class RV_3028():
 
         :return: an int representing the remaining ticks of the timer or the last ticks set.
         """
-        values = self.read_registers(RV_3028.TIMER_STATUS_0_ADDRESS, 2)
-        return values[1] << 8 | values[0]
+        status_0, status_1 = self.read_registers(RV_3028.TIMER_STATUS_0_ADDRESS, 2)
+        return _TIMER_STATUS_0[status_0] | _TIMER_STATUS_1[status_1]
 
     def set_periodic_time_update(self, second_period=True):
         """
@@ -319,10 +917,7 @@ class RV_3028():
         :param second_period: if True the periodic time update triggers every second. If False it triggers every minute.
         :return:
         """
-        if second_period:
-            self.and_or_register(RV_3028.CONTROL1_REGISTER_ADDRESS, 0xEF, 0)
-        else:
-            self.and_or_register(RV_3028.CONTROL1_REGISTER_ADDRESS, 0xFF, 0x10)
+        self.set_fields(USEL=int(not second_period))
 
     def enable_periodic_time_update_interrupt(self, generate_interrupt=True):
         """
@@ -330,40 +925,139 @@ class RV_3028():
         :param generate_interrupt:
         :return:
         """
-        # TODO: replace if else statements with bit operations
-        if generate_interrupt:
-            self.and_or_register(RV_3028.CONTROL2_REGISTER_ADDRESS, 0xFF, 0x20)
-        else:
-            self.and_or_register(RV_3028.CONTROL2_REGISTER_ADDRESS, 0xDF, 0)
+        self.set_fields(UIE=int(generate_interrupt))
 
     def clear_interrupt_flags(self, clear_timer_flag=True, clear_alarm_flag=True, clear_periodic_time_update_flag=True):
         """
-        Clears the timer and alarm interrupt flags in the status register.
+        Clears the timer and alarm interrupt flags in the status register with a single write, without reading it:
+        the flags are cleared by writing 0 and kept by writing 1, so a flag raised by the device in the meantime is
+        never lost.
 
         :param clear_timer_flag:
         :param clear_alarm_flag:
         :param clear_periodic_time_update_flag:
         :return:
         """
-        mask = 0xFF
-        mask &= 0xF7 if clear_timer_flag else 0xFF
-        mask &= 0xFB if clear_alarm_flag else 0xFF
-        mask &= 0xEF if clear_periodic_time_update_flag else 0xFF
-        self.and_or_register(RV_3028.STATUS_REGISTER_ADDRESS, mask, 0)
+        mask = _TF.encode[clear_timer_flag] | _AF.encode[clear_alarm_flag] | _UF.encode[clear_periodic_time_update_flag]
+        if mask:
+            self.write_register(RV_3028.STATUS_REGISTER_ADDRESS, ~mask & 0xFF)
+
+    def set_interrupt_mask(self, event_interrupt: bool, alarm_interrupt: bool, periodic_countdown_interrupt: bool,
+                           periodic_time_update_interrupt: bool) -> None:
+        """
+        Selects the interrupts that start the clock output on the CLKOUT pin when the clock output is controlled
+        by the interrupts (CLKIE).
+
+        :param event_interrupt: the external event interrupt
+        :param alarm_interrupt: the alarm interrupt
+        :param periodic_countdown_interrupt: the countdown timer interrupt
+        :param periodic_time_update_interrupt: the periodic time update interrupt
+        :return:
+        """
+        self.set_fields(CEIE=int(event_interrupt), CAIE=int(alarm_interrupt), CTIE=int(periodic_countdown_interrupt),
+                        CUIE=int(periodic_time_update_interrupt))
 
-    #def set_interrupt_mask(self, event_interrupt: bool, alarm_interrupt: bool, periodic_countdown_interrupt: bool,
-    #                       periodic_time_update_interrupt: bool) -> None:
-    #    pass
-    #    # TODO: implement interrupt mask
+    def enable_event_timestamp(self, enable: bool = True, rising_edge: bool = False,
+                               event_filter: int = EVENT_FILTER_NONE, overwrite: bool = False,
+                               generate_interrupt: bool = False) -> None:
+        """
+        Configures the time stamp of the external events on the EVI pin. The time stamp registers and the event
+        counter are reset and the EVF flag is cleared.
+
+        :param enable: if True the events are time stamped
+        :param rising_edge: if True the events are the rising edges of EVI, otherwise the falling edges
+        :param event_filter: the sampling period of the EVI filter. Must be one of EVENT_FILTER_X
+        :param overwrite: if True the time stamp registers hold the last event, otherwise the first one
+        :param generate_interrupt: if True an interrupt will be triggered on the INT pin on each event
+        :return:
+        """
+        self.set_fields(EVF=0, TSE=int(enable), EIE=int(enable and generate_interrupt), EHL=int(rising_edge),
+                        ET=event_filter, TSOW=int(overwrite), TSS=0, TSR=1)
 
     def get_unix_time(self) -> int:
         """
         UNIX Time counter is a 32-bit counter. The counter will roll-over to 00000000h when reaching FFFFFFFFh.
+        The counter is read twice (a third time if the two reads differ), so that an increment during the block
+        read can't return a torn value.
+
+        :return: the value of the UNIX Time counter
+        """
+        with self.locked():
+            first = self.read_registers(RV_3028.UNIX_TIME_ADDRESS, 4)
+            second = self.read_registers(RV_3028.UNIX_TIME_ADDRESS, 4)
+            if first != second:
+                # the counter can't increment again within a second
+                second = self.read_registers(RV_3028.UNIX_TIME_ADDRESS, 4)
+        return int.from_bytes(bytes(second), 'little')
+
+    def set_unix_time(self, unix_time: int = None) -> None:
+        """
+        Sets the UNIX Time counter with a single block write.
 
+        :param unix_time: the value of the counter, defaults to the current time of the system (time.time())
         :return:
         """
-        time_bytes = self.read_registers(RV_3028.UNIX_TIME_ADDRESS, 4)
-        return time_bytes[3] << 24 | time_bytes[2] << 16 | time_bytes[1] << 8 | time_bytes[0]
+        if unix_time is None:
+            unix_time = int(time.time())
+        self.set_fields(UNIX_TIME=unix_time & 0xFFFFFFFF)
+
+    def get_unix_timestamp(self, last_edge_ns: int = None, poll_interval: float = 0.005, clock=time.monotonic_ns,
+                           sleep=time.sleep, timeout: float = 1.5) -> float:
+        """
+        Returns the UNIX Time counter with a sub-second fraction, without decoding the calendar registers.
+        The fraction is the time elapsed since the last increment of the counter, which is either given by
+        last_edge_ns or found by polling the counter until it changes (up to one second).
+
+        :param last_edge_ns: the time (according to clock) of the last periodic time update interrupt, with the
+            periodic time update set to one second (e.g. InterruptDispatcher.last_edge_ns). If None, or if it is
+            more than a second old, the counter is polled.
+        :param poll_interval: the interval between two reads of the counter while polling (seconds)
+        :param clock: the monotonic clock (nanoseconds)
+        :param sleep: the function used to sleep between the polls
+        :param timeout: the maximum duration of the polling (seconds). A TimeoutError is raised if the counter
+            doesn't change, e.g. if the oscillator is stopped.
+        :return: the UNIX time (seconds)
+        """
+        if last_edge_ns is not None:
+            now_ns = clock()
+            unix_time = self.get_unix_time()
+            fraction = (now_ns - last_edge_ns) / 1e9
+            if 0 <= fraction < 1:
+                return unix_time + fraction
+
+        unix_time, edge_ns = self.read_unix_time_edge(poll_interval, clock, sleep, timeout)
+        return unix_time + (clock() - edge_ns) / 1e9
+
+    def read_unix_time_edge(self, poll_interval: float = 0.005, clock=time.monotonic_ns, sleep=time.sleep,
+                            timeout: float = 1.5) -> tuple:
+        """
+        Polls the UNIX Time counter (a single block read per poll) until it increments, to find the start of a
+        second of the device: the counter and the seconds register are incremented by the same 1 Hz tick. The edge
+        is located within poll_interval plus the duration of a read.
+
+        :param poll_interval: the interval between two reads of the counter (seconds)
+        :param clock: the monotonic clock (nanoseconds)
+        :param sleep: the function used to sleep between the polls
+        :param timeout: the maximum duration of the polling (seconds). A TimeoutError is raised if the counter
+            doesn't change, e.g. if the oscillator is stopped.
+        :return: the value of the counter after the increment and the time (according to clock) of the increment
+        """
+        first = int.from_bytes(bytes(self.read_registers(RV_3028.UNIX_TIME_ADDRESS, 4)), 'little')
+        after = clock()
+        deadline = after + timeout * 1e9
+        while True:
+            if after >= deadline:
+                raise TimeoutError("the UNIX Time counter didn't change for {} seconds".format(timeout))
+            sleep(poll_interval)
+            previous = after
+            current = int.from_bytes(bytes(self.read_registers(RV_3028.UNIX_TIME_ADDRESS, 4)), 'little')
+            after = clock()
+            if current != first:
+                # the counter changed between the two reads
+                if current != (first + 1) & 0xFFFFFFFF:
+                    # the read was torn by the increment: the counter can't increment again within a second
+                    current = int.from_bytes(bytes(self.read_registers(RV_3028.UNIX_TIME_ADDRESS, 4)), 'little')
+                return current, (previous + after) // 2
 
     def use_eeprom(self, disable_refresh=True) -> None:
         """
@@ -372,32 +1066,40 @@ class RV_3028():
         :param disable_refresh: disables/enables the automatic refresh function
         :return:
         """
-        # TODO: replace if else statement with bit operations
         if disable_refresh:
-            self.and_or_register(RV_3028.CONTROL1_REGISTER_ADDRESS, 0xFF, 0x08)
-            self.write_register(RV_3028.EEPROM_COMMAND_ADDRESS, 0)
+            self.set_fields(EERD=1, EE_COMMAND=0)
         else:
-            self.and_or_register(RV_3028.CONTROL1_REGISTER_ADDRESS, 0xF7, 0)
+            self.set_fields(EERD=0)
+
+    def _start_eeprom_read(self, register_address: int) -> None:
+        # address, data (overwritten by the read) and read a register command (0x22) in a single block write
+        self.set_fields(EE_ADDRESS=register_address, EE_DATA=0, EE_COMMAND=0x22)
+
+    def _start_eeprom_write(self, register_address: int, value: int) -> None:
+        # address, data and write to a register command (0x21) in a single block write: a failed transfer is retried
+        # as a whole, the data is never written without its command
+        self.set_fields(EE_ADDRESS=register_address, EE_DATA=value, EE_COMMAND=0x21)
 
     def read_eeprom_register(self, register_address: int) -> int:
         """
-        Reads an eeprom register and returns its content.
+        Reads an eeprom register and returns its content. Waits for the end of the command with eeprom_wait,
+        raises EEPROMTimeoutError if the device stays busy. The bus lock is held until the end of the command.
         user eeprom address space : [0x00 - 0x2A]
         configuration eeprom address space : [0x30 - 0x37]
 
         :param register_address: the register value
         :return:
         """
-        self.write_register(RV_3028.EEPROM_ADDRESS_ADDRESS, register_address)
-        while self.is_eeprom_busy():
-            continue
-        # read a register -> eeprom data = 0x22
-        self.write_register(RV_3028.EEPROM_COMMAND_ADDRESS, 0x22)
-        return self.read_register(RV_3028.EEPROM_DATA_ADDRESS)
+        with self.locked():
+            self._start_eeprom_read(register_address)
+            self.eeprom_wait.wait(self.is_eeprom_busy, RV_3028.EEPROM_READ_TIME)
+            return self.read_register(RV_3028.EEPROM_DATA_ADDRESS)
 
     def write_eeprom_register(self, register_address: int, value: int) -> None:
         """
-        Writes value to the eeprom register at address register_address.
+        Writes value to the eeprom register at address register_address. Waits for the end of the programming
+        with eeprom_wait, raises EEPROMTimeoutError if the device stays busy. The bus lock is held until the end
+        of the programming.
         user eeprom address space : [0x00 - 0x2A]
         configuration eeprom address space : [0x30 - 0x37]
 
@@ -405,12 +1107,83 @@ class RV_3028():
         :param value: the value to write
         :return:
         """
-        self.write_register(RV_3028.EEPROM_ADDRESS_ADDRESS, register_address)
-        self.write_register(RV_3028.EEPROM_DATA_ADDRESS, value)
-        while self.is_eeprom_busy():
-            continue
-        # write to a register in eeprom = 0x21
-        self.write_register(RV_3028.EEPROM_COMMAND_ADDRESS, 0x21)
+        with self.locked():
+            self._start_eeprom_write(register_address, value)
+            self.eeprom_wait.wait(self.is_eeprom_busy, RV_3028.EEPROM_WRITE_TIME)
+
+    @contextmanager
+    def _eeprom_session(self):
+        """
+        Disables the automatic refresh for the duration of the with block (through use_eeprom) and restores it
+        afterwards if it was enabled.
+        """
+        refresh_was_enabled = not self.get_field('EERD')
+        self.use_eeprom(True)
+        try:
+            yield
+        finally:
+            if refresh_was_enabled:
+                self.use_eeprom(False)
+
+    def read_eeprom(self, start_address: int, length: int) -> bytes:
+        """
+        Reads length consecutive eeprom registers. The automatic refresh is disabled once for the whole read and
+        restored afterwards.
+        user eeprom address space : [0x00 - 0x2A]
+        configuration eeprom address space : [0x30 - 0x37]
+
+        :param start_address: the address of the first eeprom register
+        :param length: the amount of registers to read
+        :return: the content of the registers
+        """
+        with self._eeprom_session():
+            return bytes(self.read_eeprom_register(address) for address in range(start_address, start_address + length))
+
+    def write_eeprom(self, start_address: int, data: bytes) -> int:
+        """
+        Writes data to consecutive eeprom registers. The current content is read first and only the registers
+        that change are programmed, saving time and eeprom write endurance. The automatic refresh is disabled
+        once for the whole write and restored afterwards.
+        user eeprom address space : [0x00 - 0x2A]
+        configuration eeprom address space : [0x30 - 0x37]
+
+        :param start_address: the address of the first eeprom register
+        :param data: the values to write
+        :return: the amount of registers that have actually been programmed
+        """
+        programmed = 0
+        with self._eeprom_session():
+            for address, value in zip(range(start_address, start_address + len(data)), data):
+                if self.read_eeprom_register(address) != value:
+                    self.write_eeprom_register(address, value)
+                    programmed += 1
+        return programmed
 
     def is_eeprom_busy(self) -> bool:
-        return bool(self.read_register(RV_3028.STATUS_REGISTER_ADDRESS) & 0x80)
+        return bool(self.get_field('EEBUSY'))
+
+
+class _Caller(threading.local):
+    method = None
+    '''the outermost public method of the RV_3028 being run by the thread'''
+    deadline = None
+    '''the deadline of the retries of its transfers (see RetryPolicy.deadline)'''
+
+
+def _public_method(function):
+    name = function.__name__
+
+    @functools.wraps(function)
+    def public_method(self, *args, **kwargs):
+        if self.instrumentation is None and self.retry_policy is None:
+            return function(self, *args, **kwargs)
+        return self._run_as(name, function, self, *args, **kwargs)
+    return public_method
+
+
+# the public methods record their name for the instrumentation and start the deadline of the retry policy, except
+# the context managers (batch records its writes itself)
+for _name, _member in list(vars(RV_3028).items()):
+    if isinstance(_member, types.FunctionType) and not _name.startswith('_') and _name not in ('locked', 'batch'):
+        setattr(RV_3028, _name, _public_method(_member))
+del _name, _member
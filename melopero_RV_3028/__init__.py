@@ -4,4 +4,46 @@
 @author: Leonardo La Rocca
 """
 
+import importlib
+
 from melopero_RV_3028.RV_3028 import RV_3028
+from melopero_RV_3028.wait import BusyWait, EEPROMTimeoutError
+from melopero_RV_3028.registers import RegisterSnapshot, diff
+from melopero_RV_3028.transport import I2CRdwrTransport
+from melopero_RV_3028.bus import BusManager, BusLock, I2CBus, bus_manager
+from melopero_RV_3028.errors import CircuitOpenError, DeadlineExceededError, WriteVerificationError
+
+# the optional subsystems are imported on first access, so that importing the package stays cheap
+_LAZY_ATTRIBUTES = {
+    'AsyncRV_3028': 'melopero_RV_3028.AsyncRV_3028',
+    'RetryPolicy': 'melopero_RV_3028.resilience',
+    'CircuitBreaker': 'melopero_RV_3028.resilience',
+    'InterruptDispatcher': 'melopero_RV_3028.interrupts',
+    'FakeInterruptBackend': 'melopero_RV_3028.interrupts',
+    'GpiozeroInterruptBackend': 'melopero_RV_3028.interrupts',
+    'GpioChipInterruptBackend': 'melopero_RV_3028.interrupts',
+    'RV_3028_Simulator': 'melopero_RV_3028.simulator',
+    'VirtualClock': 'melopero_RV_3028.simulator',
+    'BusInstrumentation': 'melopero_RV_3028.instrumentation',
+    'SoftwareClock': 'melopero_RV_3028.software_clock',
+    'Calibration': 'melopero_RV_3028.calibration',
+    'EventCapture': 'melopero_RV_3028.events',
+    'EventTimestamp': 'melopero_RV_3028.events',
+    'ConfigurationEEPROM': 'melopero_RV_3028.eeprom_config',
+    'WakeupScheduler': 'melopero_RV_3028.scheduler',
+    'TimeService': 'melopero_RV_3028.time_service',
+    'TimeServiceClient': 'melopero_RV_3028.time_service',
+}
+
+
+def __getattr__(name: str):
+    module = _LAZY_ATTRIBUTES.get(name)
+    if module is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
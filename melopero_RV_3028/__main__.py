@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+
+Synchronizes the system clock and the RV-3028:
+
+    python -m melopero_RV_3028 systohc           # set the rtc from the system clock
+    python -m melopero_RV_3028 hctosys [--fast]  # set the system clock from the rtc
+    python -m melopero_RV_3028 compare [--window 60]
+    python -m melopero_RV_3028 daemon --direction systohc --interval 60 --tolerance 0.01
+"""
+
+import argparse
+import logging
+import signal
+import sys
+
+from melopero_RV_3028 import clock_sync
+from melopero_RV_3028.RV_3028 import RV_3028
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m melopero_RV_3028",
+                                     description="synchronizes the system clock and the RV-3028")
+    parser.add_argument('--bus', type=int, default=1, help="the i2c bus number")
+    parser.add_argument('--address', type=lambda value: int(value, 0), default=RV_3028.RV_3028_ADDRESS,
+                        help="the i2c address of the device")
+    parser.add_argument('--utc', action='store_true', help="the rtc keeps the UTC time instead of the local time")
+    parser.add_argument('--poll-interval', type=float, default=0.002,
+                        help="interval between two reads while looking for the start of a second (seconds)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('systohc', help="set the rtc from the system clock, at the start of a second")
+    hctosys_parser = commands.add_parser('hctosys', help="set the system clock from the rtc")
+    hctosys_parser.add_argument('--fast', action='store_true',
+                                help="read the rtc once instead of looking for the start of a second (boot)")
+    compare_parser = commands.add_parser('compare', help="print the offset and the drift of the rtc")
+    compare_parser.add_argument('--window', type=float, default=0,
+                                help="measure the drift over this time (seconds), 0 to print only the offset")
+    daemon_parser = commands.add_parser('daemon', help="keep the clocks synchronized")
+    daemon_parser.add_argument('--direction', choices=clock_sync.ClockSyncDaemon.DIRECTIONS, default='systohc',
+                               help="systohc: the rtc follows the system clock, hctosys: the opposite")
+    daemon_parser.add_argument('--interval', type=float, default=60, help="time between two checks (seconds)")
+    daemon_parser.add_argument('--tolerance', type=float, default=0.01,
+                               help="offsets up to this value are not corrected (seconds)")
+    daemon_parser.add_argument('--max-step', type=float, default=None,
+                               help="offsets over this value are not corrected (seconds)")
+    daemon_parser.add_argument('--slew-threshold', type=float, default=0.5,
+                               help="offsets up to this value are slewed, the larger ones stepped (seconds), "
+                                    "0 to always step")
+    daemon_parser.add_argument('--slew-rate', type=float, default=clock_sync.ADJTIME_RATE_PPM,
+                               help="maximum rate of a slew (ppm)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    with RV_3028(args.address, args.bus) as rtc:
+        if args.command == 'systohc':
+            print("rtc set to {}".format(clock_sync.systohc(rtc, args.utc)))
+        elif args.command == 'hctosys':
+            offset = clock_sync.hctosys(rtc, args.utc, precise=not args.fast, poll_interval=args.poll_interval)
+            print("system clock stepped by {:+.6f} s".format(offset))
+        elif args.command == 'compare':
+            if args.window > 0:
+                offset, drift = clock_sync.measure_drift(rtc, args.window, args.utc, args.poll_interval)
+                print("offset {:+.6f} s, drift {:+.2f} ppm".format(offset, drift))
+            else:
+                print("offset {:+.6f} s".format(clock_sync.measure_offset(rtc, args.utc, args.poll_interval)))
+        else:
+            daemon = clock_sync.ClockSyncDaemon(rtc, args.direction, args.interval, args.tolerance, args.max_step,
+                                                args.utc, args.poll_interval, args.slew_threshold or None,
+                                                args.slew_rate)
+            signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+            try:
+                daemon.run()
+            except KeyboardInterrupt:
+                pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
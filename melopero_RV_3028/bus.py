@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from melopero_RV_3028.transport import default_transport
+
+
+class BusLock():
+    """
+    A re-entrant lock that measures how long its users wait for it. The statistics are only updated by the
+    thread that holds the lock.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        """
+        :param clock: the monotonic clock used to measure the waits
+        """
+        self.clock = clock
+        self._lock = threading.RLock()
+        self.acquisitions = 0
+        '''the amount of times the lock has been acquired'''
+        self.contentions = 0
+        '''the amount of times the lock was held by another thread'''
+        self.wait_time = 0.0
+        '''the total time spent waiting for the lock (seconds)'''
+        self.max_wait = 0.0
+        '''the longest wait for the lock (seconds)'''
+
+    def acquire(self) -> float:
+        """
+        Blocks until the lock is acquired.
+
+        :return: the time spent waiting for the lock (seconds), 0.0 if it was free
+        """
+        wait = 0.0
+        if not self._lock.acquire(blocking=False):
+            start = self.clock()
+            self._lock.acquire()
+            wait = self.clock() - start
+            self.contentions += 1
+            self.wait_time += wait
+            self.max_wait = max(self.max_wait, wait)
+        self.acquisitions += 1
+        return wait
+
+    def release(self) -> None:
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+class I2CBus():
+    """
+    A long lived handle to an i2c bus (/dev/i2c-N). The device file is opened on first use and kept open
+    until close() is called. After an OSError the handle can be dropped with reset(), the next access
+    will transparently reopen the bus.
+    """
+
+    def __init__(self, bus_number: int, lock: BusLock = None, transport=default_transport):
+        """
+        :param bus_number: the i2c bus number
+        :param lock: the lock that serializes the transactions on the bus, a new one is created if None
+        :param transport: the function that opens the bus, called with the bus number (see transport.py).
+            Defaults to smbus2.SMBus, or I2CRdwrTransport if smbus2 is not installed.
+        """
+        self.bus_number = bus_number
+        self.lock = lock if lock is not None else BusLock()
+        self.transport = transport
+        self._smbus = None
+        self._users = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self._smbus is not None
+
+    def get(self):
+        """
+        :return: the open transport (an object with the SMBus interface), opening the device file if needed
+        """
+        if self._smbus is None:
+            self._smbus = self.transport(self.bus_number)
+        return self._smbus
+
+    @contextmanager
+    def transaction(self):
+        """
+        Holds the bus lock for the duration of the with block and yields the open transport, so that a
+        sequence of transfers (e.g. a read-modify-write) is not interleaved with the transfers of the other
+        users of the bus. After an OSError the handle is dropped.
+
+        Example:
+            with bus.transaction() as smbus:
+                value = smbus.read_byte_data(0x76, 0xF4)
+                smbus.write_byte_data(0x76, 0xF4, value | 0x03)
+        """
+        with self.lock:
+            try:
+                yield self.get()
+            except OSError:
+                self.reset()
+                raise
+
+    def reset(self) -> None:
+        """
+        Drops the current handle (e.g. after an OSError). The bus will be reopened on the next access.
+        """
+        self.close()
+
+    def close(self) -> None:
+        smbus, self._smbus = self._smbus, None
+        if smbus is not None:
+            try:
+                smbus.close()
+            except OSError:
+                pass
+
+
+class BusManager():
+    """
+    Owns one I2CBus handle and one BusLock per bus number. Every driver that talks to a bus (RV_3028 instances
+    and third-party drivers) should register with the same manager, so that their transactions are serialized
+    by the same lock.
+
+    Example:
+        bus = mp.bus_manager.register(1)
+        with bus.transaction() as smbus:
+            smbus.write_byte_data(0x76, 0xF4, 0x27)
+        mp.bus_manager.unregister(bus)
+    """
+
+    def __init__(self, transport=default_transport):
+        """
+        :param transport: the function that opens the buses, called with the bus number (see transport.py)
+        """
+        self.transport = transport
+        self._buses = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def lock(self, bus_number: int) -> BusLock:
+        """
+        :param bus_number: the i2c bus number
+        :return: the lock of bus bus_number. It stays the same for the whole life of the manager.
+        """
+        with self._lock:
+            lock = self._locks.get(bus_number)
+            if lock is None:
+                lock = self._locks[bus_number] = BusLock()
+            return lock
+
+    def register(self, bus_number: int, transport=None) -> I2CBus:
+        """
+        Returns the I2CBus shared by all the users of bus bus_number. Every call must be matched by a call
+        to unregister.
+
+        :param bus_number: the i2c bus number
+        :param transport: the function that opens the bus, defaults to the transport of the manager. It is only
+            used by the first user, the others share the bus opened by it.
+        :return: the shared I2CBus
+        """
+        lock = self.lock(bus_number)
+        with self._lock:
+            bus = self._buses.get(bus_number)
+            if bus is None:
+                bus = self._buses[bus_number] = I2CBus(bus_number, lock,
+                                                       transport if transport is not None else self.transport)
+            bus._users += 1
+            return bus
+
+    def unregister(self, bus: I2CBus) -> None:
+        """
+        Releases a bus obtained with register. The device file is closed when the last user releases it.
+
+        :param bus: the shared I2CBus
+        """
+        with self._lock:
+            bus._users -= 1
+            if bus._users <= 0:
+                bus.close()
+                if self._buses.get(bus.bus_number) is bus:
+                    del self._buses[bus.bus_number]
+
+
+bus_manager = BusManager()
+'''the manager used by default by RV_3028'''
+
+
+def acquire_shared_bus(bus_number: int) -> I2CBus:
+    """
+    Same as bus_manager.register(bus_number).
+    """
+    return bus_manager.register(bus_number)
+
+
+def release_shared_bus(bus: I2CBus) -> None:
+    """
+    Same as bus_manager.unregister(bus).
+    """
+    bus_manager.unregister(bus)
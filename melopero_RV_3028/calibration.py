@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import json
+import logging
+import os
+import time
+
+from melopero_RV_3028.RV_3028 import RV_3028
+from melopero_RV_3028.registers import FIELDS
+
+logger = logging.getLogger(__name__)
+
+# frequency correction of one step of the EEOffset value (ppm). A positive value slows the clock down.
+OFFSET_STEP_PPM = 0.9537
+
+OFFSET_MIN = -256
+OFFSET_MAX = 255
+
+# maximum wait for an increment of the UNIX Time counter (seconds)
+EDGE_TIMEOUT = 1.5
+
+_EEOFFSET = FIELDS['EEOFFSET']
+
+
+def offset_to_ppm(offset: int) -> float:
+    """
+    :param offset: the EEOffset value
+    :return: the correction applied by the device (ppm)
+    """
+    return offset * OFFSET_STEP_PPM
+
+
+def ppm_to_offset(ppm: float) -> int:
+    """
+    :param ppm: the error of the crystal (ppm, positive if the device runs faster than the reference)
+    :return: the EEOffset value that corrects it
+    """
+    return min(max(round(ppm / OFFSET_STEP_PPM), OFFSET_MIN), OFFSET_MAX)
+
+
+def drift_from_frequency(frequency: float, nominal: float = 32768.0) -> float:
+    """
+    :param frequency: the frequency measured on the CLKOUT pin (Hz)
+    :param nominal: the frequency selected with FD (Hz)
+    :return: the drift of the device (ppm, positive if the device runs faster)
+    """
+    return (frequency - nominal) / nominal * 1e6
+
+
+class Calibration():
+    """
+    Measures the drift of the RTC against a reference clock and trims the frequency offset (EEOffset, configuration
+    EEPROM 0x36 - 0x37). The drift is measured between two increments of the UNIX time counter at the ends of a
+    window, or computed from a CLKOUT frequency measurement (see drift_from_frequency).
+
+    Every measurement is converted into the error of the crystal without correction and kept in history. The
+    offset is computed from the weighted average of the recent errors, so repeated runs converge even with short,
+    noisy windows. The history is saved to history_path if given.
+
+    Example:
+        calibration = Calibration(rtc, history_path="/var/lib/rv3028/calibration.json")
+        calibration.calibrate(window=3600)
+    """
+
+    def __init__(self, rtc: RV_3028, history_path: str = None, history_size: int = 10, poll_interval: float = 0.005,
+                 reference_clock=time.monotonic_ns, sleep=time.sleep):
+        """
+        :param rtc: the device
+        :param history_path: the json file the history is loaded from and saved to, None to keep it in memory
+        :param history_size: the amount of measurements used to compute the offset
+        :param poll_interval: the interval between two reads of the UNIX time counter while looking for its
+            increment (seconds)
+        :param reference_clock: the reference clock (nanoseconds), e.g. time.monotonic_ns or time.time_ns for
+            an NTP disciplined system clock
+        :param sleep: the function used to sleep
+        """
+        self.rtc = rtc
+        self.history_path = history_path
+        self.history_size = history_size
+        self.poll_interval = poll_interval
+        self.reference_clock = reference_clock
+        self.sleep = sleep
+        self.history = []
+        '''measurements: dictionaries with the keys time, window, drift_ppm, offset and error_ppm'''
+        if history_path is not None and os.path.exists(history_path):
+            with open(history_path) as history_file:
+                self.history = json.load(history_file)
+
+    def get_offset(self) -> int:
+        """
+        :return: the EEOffset value in use (configuration RAM)
+        """
+        return _signed(self.rtc.get_field('EEOFFSET'))
+
+    def _unix_edge(self) -> tuple:
+        """
+        :return: the value of the UNIX time counter right after an increment and the reference time of the increment
+        """
+        return self.rtc.read_unix_time_edge(self.poll_interval, self.reference_clock, self.sleep, EDGE_TIMEOUT)
+
+    def measure(self, window: float) -> float:
+        """
+        Measures the drift of the device over window seconds. The result is accurate to about
+        2 * poll_interval / window.
+
+        :param window: the duration of the measurement (seconds)
+        :return: the drift (ppm, positive if the device runs faster than the reference)
+        """
+        start_count, start_ns = self._unix_edge()
+        self.sleep(max(0.0, window - 1))
+        end_count, end_ns = self._unix_edge()
+        reference = (end_ns - start_ns) / 1e9
+        counted = (end_count - start_count) & 0xFFFFFFFF
+        drift = (counted - reference) / reference * 1e6
+        self.add_measurement(drift, reference)
+        return drift
+
+    def add_measurement(self, drift_ppm: float, window: float) -> None:
+        """
+        Adds a measurement taken with the offset in use, e.g. drift_from_frequency(frequency).
+
+        :param drift_ppm: the measured drift (ppm, positive if the device runs faster than the reference)
+        :param window: the duration of the measurement (seconds), used as weight
+        """
+        offset = self.get_offset()
+        self.history.append({'time': time.time(), 'window': window, 'drift_ppm': drift_ppm, 'offset': offset,
+                             'error_ppm': drift_ppm + offset_to_ppm(offset)})
+        del self.history[:-self.history_size]
+        logger.info("drift %+.3f ppm with offset %d", drift_ppm, offset)
+        self._save()
+
+    def estimate_error(self) -> float:
+        """
+        :return: the error of the crystal without correction (ppm), averaged over the history weighted by the
+            duration of the measurements
+        """
+        if not self.history:
+            raise ValueError("no measurements")
+        total = sum(entry['window'] for entry in self.history)
+        return sum(entry['error_ppm'] * entry['window'] for entry in self.history) / total
+
+    def apply(self) -> bool:
+        """
+        Computes the offset from the history and, if it changed, writes it to the configuration EEPROM (only the
+        registers that change are programmed) and to the configuration RAM, so it is used immediately.
+
+        :return: True if the offset has been written
+        """
+        offset = ppm_to_offset(self.estimate_error())
+        changes = _EEOFFSET.to_registers(offset & 0x1FF)
+        eeprom = dict(zip((0x36, 0x37), self.rtc.read_eeprom(0x36, 2)))
+        if _EEOFFSET.from_registers(eeprom) == offset & 0x1FF:
+            logger.info("offset %d already in use", offset)
+            return False
+        for reg_address, keep, bits in changes:
+            eeprom[reg_address] = eeprom[reg_address] & keep | bits
+        self.rtc.write_eeprom(0x36, bytes([eeprom[0x36], eeprom[0x37]]))
+        self.rtc.set_fields(EEOFFSET=offset & 0x1FF)
+        logger.info("offset set to %d (%+.3f ppm)", offset, offset_to_ppm(offset))
+        return True
+
+    def calibrate(self, window: float) -> float:
+        """
+        Measures the drift over window seconds and applies the new offset.
+
+        :param window: the duration of the measurement (seconds)
+        :return: the measured drift (ppm)
+        """
+        drift = self.measure(window)
+        self.apply()
+        return drift
+
+    def _save(self) -> None:
+        if self.history_path is None:
+            return
+        temporary_path = self.history_path + '.tmp'
+        with open(temporary_path, 'w') as history_file:
+            json.dump(self.history, history_file, indent=2)
+        os.replace(temporary_path, self.history_path)
+
+
+def _signed(offset: int) -> int:
+    return offset - 0x200 if offset & 0x100 else offset
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import ctypes
+import ctypes.util
+import datetime
+import logging
+import os
+import threading
+import time
+
+from melopero_RV_3028.RV_3028 import RV_3028
+from melopero_RV_3028.calibration import OFFSET_MAX, OFFSET_MIN, OFFSET_STEP_PPM, _signed
+from melopero_RV_3028.software_clock import read_second_edge
+
+logger = logging.getLogger(__name__)
+
+# rate of the adjtime corrections of the Linux kernel (ppm)
+ADJTIME_RATE_PPM = 500.0
+
+
+class _Timeval(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_usec', ctypes.c_long)]
+
+
+_libc = None
+
+
+def system_now(utc: bool = False) -> datetime.datetime:
+    """
+    :param utc: if True returns the UTC time, otherwise the local time
+    :return: the time of the system clock as a naive datetime.datetime
+    """
+    if utc:
+        return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    return datetime.datetime.now()
+
+
+def to_epoch_ns(dt: datetime.datetime, utc: bool = False) -> int:
+    """
+    :param dt: a naive datetime.datetime in UTC (utc=True) or local time
+    :return: the UNIX time of dt (nanoseconds)
+    """
+    if utc:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return int(dt.timestamp()) * 1000000000 + dt.microsecond * 1000
+
+
+def measure_offset(rtc: RV_3028, utc: bool = False, poll_interval: float = 0.002) -> float:
+    """
+    Finds the start of a second of the RTC (see read_second_edge) and compares it with the system clock.
+
+    :param rtc: the device
+    :param utc: if True the RTC keeps the UTC time, otherwise the local time
+    :param poll_interval: the interval between two reads of the RTC (seconds)
+    :return: the offset RTC - system clock (seconds)
+    """
+    rtc_time, edge_ns = read_second_edge(rtc, poll_interval)
+    system_ns = time.time_ns()
+    rtc_ns = to_epoch_ns(rtc_time, utc) + time.monotonic_ns() - edge_ns
+    return (rtc_ns - system_ns) / 1e9
+
+
+def step_system_clock(offset: float) -> None:
+    """
+    Steps the system clock by offset seconds (needs CAP_SYS_TIME).
+    """
+    time.clock_settime_ns(time.CLOCK_REALTIME, time.time_ns() + int(offset * 1e9))
+
+
+def slew_system_clock(offset: float) -> None:
+    """
+    Slews the system clock by offset seconds with adjtime (needs CAP_SYS_TIME): the kernel runs the clock
+    ADJTIME_RATE_PPM faster or slower until the offset is corrected, so the time never jumps or goes backwards. The
+    adjustment still in progress, if any, is replaced.
+    """
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    delta = _Timeval(*divmod(round(offset * 1e6), 1000000))
+    if _libc.adjtime(ctypes.byref(delta), None) != 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error))
+
+
+def systohc(rtc: RV_3028, utc: bool = False) -> datetime.datetime:
+    """
+    Sets the RTC from the system clock with a single block write, at the start of the next second of the system
+    clock.
+
+    :param rtc: the device
+    :param utc: if True the RTC keeps the UTC time, otherwise the local time
+    :return: the time written to the RTC
+    """
+    now = system_now(utc)
+    rtc.set_datetime(now, align=True)
+    return now.replace(microsecond=0) + datetime.timedelta(seconds=1) if now.microsecond else now
+
+
+def hctosys(rtc: RV_3028, utc: bool = False, precise: bool = True, poll_interval: float = 0.002) -> float:
+    """
+    Sets the system clock (needs CAP_SYS_TIME) from the RTC.
+
+    :param rtc: the device
+    :param utc: if True the RTC keeps the UTC time, otherwise the local time
+    :param precise: if True the start of a second of the RTC is found by polling (up to one second, accurate to a
+        few milliseconds). If False the RTC is read once and the middle of the second is assumed (a few
+        milliseconds, accurate to half a second), for a fast boot.
+    :param poll_interval: the interval between two reads of the RTC (seconds)
+    :return: the step applied to the system clock (seconds)
+    """
+    if precise:
+        offset = measure_offset(rtc, utc, poll_interval)
+    else:
+        rtc_time = datetime.datetime(*rtc.get_datetime_tuple()[:6])
+        offset = (to_epoch_ns(rtc_time, utc) + 500000000 - time.time_ns()) / 1e9
+    step_system_clock(offset)
+    return offset
+
+
+def measure_drift(rtc: RV_3028, window: float, utc: bool = False, poll_interval: float = 0.002) -> tuple:
+    """
+    Measures the offset at the start and at the end of the window.
+
+    :param rtc: the device
+    :param window: the duration of the measurement (seconds)
+    :param utc: if True the RTC keeps the UTC time, otherwise the local time
+    :param poll_interval: the interval between two reads of the RTC (seconds)
+    :return: the final offset RTC - system clock (seconds) and the drift of the RTC relative to the system clock
+        (parts per million, positive if the RTC runs faster)
+    """
+    start = time.monotonic()
+    first = measure_offset(rtc, utc, poll_interval)
+    time.sleep(max(0.0, window - (time.monotonic() - start)))
+    last = measure_offset(rtc, utc, poll_interval)
+    return last, (last - first) / (time.monotonic() - start) * 1e6
+
+
+class ClockSyncDaemon():
+    """
+    Keeps the RTC and the system clock synchronized: every interval seconds the offset is measured and, if it is
+    larger than tolerance, the target clock is corrected (direction 'systohc': the RTC follows the system clock,
+    'hctosys': the system clock follows the RTC). Offsets larger than max_step are logged but not corrected, as
+    they usually mean that the source clock is wrong.
+
+    Offsets up to slew_threshold are slewed, at most slew_rate ppm, so the target clock never jumps: the system
+    clock with adjtime (see slew_system_clock), the RTC by trimming its frequency with the EEOffset value of the
+    configuration RAM (the EEPROM is never written, the calibrated value is restored once the offset is within
+    tolerance or when the daemon stops). Larger offsets are corrected with a step. An offset larger than
+    slew_rate * interval is slewed over several intervals.
+    """
+
+    DIRECTIONS = ('systohc', 'hctosys')
+
+    def __init__(self, rtc: RV_3028, direction: str = 'systohc', interval: float = 60.0, tolerance: float = 0.01,
+                 max_step: float = None, utc: bool = False, poll_interval: float = 0.002,
+                 slew_threshold: float = 0.5, slew_rate: float = ADJTIME_RATE_PPM):
+        """
+        :param rtc: the device
+        :param direction: 'systohc' or 'hctosys'
+        :param interval: the time between two measurements (seconds)
+        :param tolerance: the offsets up to tolerance are not corrected (seconds)
+        :param max_step: the offsets larger than max_step are not corrected (seconds), None for no limit
+        :param utc: if True the RTC keeps the UTC time, otherwise the local time
+        :param poll_interval: the interval between two reads of the RTC while measuring the offset (seconds)
+        :param slew_threshold: the offsets up to slew_threshold are slewed, the larger ones stepped (seconds), None
+            to always step
+        :param slew_rate: the maximum rate of a slew (ppm), at most ADJTIME_RATE_PPM for hctosys and about 244 ppm
+            (the range of EEOffset) for systohc
+        """
+        if direction not in ClockSyncDaemon.DIRECTIONS:
+            raise ValueError("direction must be one of {}".format(ClockSyncDaemon.DIRECTIONS))
+        self.rtc = rtc
+        self.direction = direction
+        self.interval = interval
+        self.tolerance = tolerance
+        self.max_step = max_step
+        self.utc = utc
+        self.poll_interval = poll_interval
+        self.slew_threshold = slew_threshold
+        self.slew_rate = slew_rate
+        self._stop = threading.Event()
+        # the EEOffset value in use before the RTC was slewed, None if it isn't being slewed
+        self._calibrated_offset = None
+        self.corrections = 0
+        self.last_offset = None
+
+    def step(self) -> float:
+        """
+        Measures the offset and corrects it if needed.
+
+        :return: the measured offset RTC - system clock (seconds)
+        """
+        offset = measure_offset(self.rtc, self.utc, self.poll_interval)
+        self.last_offset = offset
+        if abs(offset) <= self.tolerance:
+            logger.debug("offset %+.6f s", offset)
+            self.end_slew()
+        elif self.max_step is not None and abs(offset) > self.max_step:
+            logger.warning("offset %+.6f s over the maximum step, not corrected", offset)
+        elif self.slew_threshold is not None and abs(offset) <= self.slew_threshold:
+            logger.info("offset %+.6f s, slewing %s", offset, self.direction)
+            self._slew(offset)
+            self.corrections += 1
+        else:
+            logger.info("offset %+.6f s, running %s", offset, self.direction)
+            if self.direction == 'systohc':
+                self.end_slew()
+                systohc(self.rtc, self.utc)
+            else:
+                step_system_clock(offset)
+            self.corrections += 1
+        return offset
+
+    def _slew(self, offset: float) -> None:
+        """
+        Corrects up to slew_rate * interval seconds of offset before the next measurement.
+        """
+        limit = self.slew_rate * 1e-6 * self.interval
+        amount = min(max(offset, -limit), limit)
+        if self.direction == 'hctosys':
+            slew_system_clock(amount)
+            return
+        # the RTC is ahead by amount seconds: slow it down by amount / interval (a positive EEOffset slows it down)
+        if self._calibrated_offset is None:
+            self._calibrated_offset = _signed(self.rtc.get_field('EEOFFSET'))
+        trim = self._calibrated_offset + round(amount / self.interval * 1e6 / OFFSET_STEP_PPM)
+        self.rtc.set_fields(EEOFFSET=min(max(trim, OFFSET_MIN), OFFSET_MAX) & 0x1FF)
+
+    def end_slew(self) -> None:
+        """
+        Restores the calibrated frequency of the RTC if it is being slewed.
+        """
+        if self._calibrated_offset is not None:
+            self.rtc.set_fields(EEOFFSET=self._calibrated_offset & 0x1FF)
+            self._calibrated_offset = None
+
+    def run(self) -> None:
+        """
+        Runs until stop() is called.
+        """
+        while not self._stop.is_set():
+            try:
+                self.step()
+            except OSError as error:
+                logger.error("can't access the device: %s", error)
+            self._stop.wait(self.interval)
+        try:
+            self.end_slew()
+        except OSError as error:
+            logger.error("can't restore the frequency offset: %s", error)
+
+    def stop(self) -> None:
+        self._stop.set()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import json
+import logging
+import os
+import time
+from collections import namedtuple
+
+from melopero_RV_3028.RV_3028 import RV_3028
+from melopero_RV_3028.registers import FIELDS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'melopero_RV_3028')
+
+# configuration eeprom 0x30 - 0x37, mirrored in the configuration ram at the same addresses
+CONFIGURATION_START = 0x30
+CONFIGURATION_LENGTH = 8
+# the part of the configuration eeprom that is mirrored: 0x30 - 0x34 hold EEPWE and the eeprom password (EEPW), they
+# are never read, stored in the cache file nor compared
+MIRROR_START = 0x35
+MIRROR_LENGTH = 3
+
+# backup switchover modes (BSM)
+BACKUP_SWITCHOVER_DISABLED = 0
+BACKUP_SWITCHOVER_DIRECT = 1
+BACKUP_SWITCHOVER_LEVEL = 3
+
+TRICKLE_CHARGE_RESISTANCES = (3000, 5000, 9000, 15000)
+'''TCR -> series resistance of the trickle charger (ohm)'''
+CLKOUT_FREQUENCIES = (32768, 8192, 1024, 64, 32, 1, None, 0)
+'''FD -> frequency of the CLKOUT pin (Hz), None for the countdown timer interrupt, 0 for CLKOUT low'''
+
+EEPROMConfiguration = namedtuple('EEPROMConfiguration', [
+    'clkout_enabled', 'clkout_synchronized', 'clkout_frequency', 'por_interrupt', 'offset',
+    'backup_switchover_interrupt', 'backup_switchover_mode', 'trickle_charge', 'trickle_charge_resistance',
+    'fast_edge_detection'])
+'''The decoded configuration eeprom: CLKOE, CLKSY, CLKOUT frequency (Hz, see CLKOUT_FREQUENCIES), PORIE,
+EEOffset (signed), BSIE, BSM, TCE, trickle charge resistance (ohm), FEDE.'''
+
+
+class ConfigurationEEPROM():
+    """
+    A mirror of the configuration eeprom (0x35 - 0x37) persisted in a cache file keyed by bus and address, so
+    that the configuration can be checked at every start without eeprom commands.
+
+    load() reads the configuration ram (the mirror of the eeprom refreshed by the device) with a single block
+    read and compares it with the copy saved in the cache file. If they match, the eeprom content of the cache is
+    used. Otherwise (no cache, another device, configuration changed) the eeprom is read with read_eeprom and the
+    cache is rewritten. A change of the eeprom that is not reflected in the configuration ram is not detected until
+    the next refresh of the device (at power on and, if EERD is 0, every 24 hours) or a call to read().
+
+    EEPWE and the eeprom password (0x30 - 0x34) are left out of the mirror, the cache file is readable by its owner
+    only.
+
+    Example:
+        mirror = ConfigurationEEPROM(rtc)
+        config = mirror.load()
+        if config.backup_switchover_mode != BACKUP_SWITCHOVER_LEVEL:
+            ...
+    """
+
+    def __init__(self, rtc: RV_3028, cache_path: str = None, cache_dir: str = DEFAULT_CACHE_DIR):
+        """
+        :param rtc: the device
+        :param cache_path: the cache file, defaults to a file in cache_dir named after the bus and the address
+        :param cache_dir: the directory of the default cache file
+        """
+        self.rtc = rtc
+        if cache_path is None:
+            cache_path = os.path.join(cache_dir, 'eeprom-{}-0x{:02X}.json'.format(rtc.i2c_bus, rtc.i2c_address))
+        self.cache_path = cache_path
+        self.data = None
+        '''the content of the configuration eeprom from MIRROR_START, None until loaded'''
+        self.from_cache = False
+        '''True if data has been loaded from the cache file'''
+
+    def load(self) -> EEPROMConfiguration:
+        """
+        :return: the configuration eeprom, from the cache file if it is still valid, otherwise from the device
+        """
+        ram = bytes(self.rtc.read_registers(MIRROR_START, MIRROR_LENGTH))
+        cache = self._load_cache()
+        if cache is not None and cache['ram'] == ram:
+            self.data = cache['eeprom']
+            self.from_cache = True
+            return self.configuration
+        logger.info("configuration eeprom cache %s missing or stale, reading the eeprom", self.cache_path)
+        return self.read(ram)
+
+    def read(self, ram: bytes = None) -> EEPROMConfiguration:
+        """
+        Reads the configuration eeprom from the device and updates the cache file.
+
+        :param ram: the content of the configuration ram, read if None
+        :return: the configuration eeprom
+        """
+        if ram is None:
+            ram = bytes(self.rtc.read_registers(MIRROR_START, MIRROR_LENGTH))
+        self.data = bytes(self.rtc.read_eeprom(MIRROR_START, MIRROR_LENGTH))
+        self.from_cache = False
+        self._save_cache(ram)
+        return self.configuration
+
+    def invalidate(self) -> None:
+        """
+        Deletes the cache file, the next load() reads the eeprom.
+        """
+        self.data = None
+        try:
+            os.remove(self.cache_path)
+        except FileNotFoundError:
+            pass
+
+    def get(self, name: str) -> int:
+        """
+        :param name: the name of a field of the configuration eeprom (see registers.FIELDS), e.g. 'BSM' or 'FD'
+        :return: the value of the field
+        """
+        if self.data is None:
+            self.load()
+        field = FIELDS[name]
+        if not all(0 <= register - MIRROR_START < MIRROR_LENGTH for register in field.registers):
+            raise ValueError("{} is not a field of the configuration eeprom mirror".format(name))
+        return field.from_registers(self.data, MIRROR_START)
+
+    @property
+    def configuration(self) -> EEPROMConfiguration:
+        """
+        the decoded configuration eeprom
+        """
+        offset = self.get('EEOFFSET')
+        return EEPROMConfiguration(
+            clkout_enabled=bool(self.get('CLKOE')), clkout_synchronized=bool(self.get('CLKSY')),
+            clkout_frequency=CLKOUT_FREQUENCIES[self.get('FD')], por_interrupt=bool(self.get('PORIE')),
+            offset=offset - 0x200 if offset & 0x100 else offset,
+            backup_switchover_interrupt=bool(self.get('BSIE')), backup_switchover_mode=self.get('BSM'),
+            trickle_charge=bool(self.get('TCE')),
+            trickle_charge_resistance=TRICKLE_CHARGE_RESISTANCES[self.get('TCR')],
+            fast_edge_detection=bool(self.get('FEDE')))
+
+    def _load_cache(self) -> dict:
+        try:
+            with open(self.cache_path) as cache_file:
+                cache = json.load(cache_file)
+            if cache['bus'] != self.rtc.i2c_bus or cache['address'] != self.rtc.i2c_address:
+                return None
+            ram, eeprom = bytes.fromhex(cache['ram']), bytes.fromhex(cache['eeprom'])
+            if len(ram) != MIRROR_LENGTH or len(eeprom) != MIRROR_LENGTH:
+                return None
+            return {'ram': ram, 'eeprom': eeprom}
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            logger.warning("ignoring the configuration eeprom cache %s: %s", self.cache_path, error)
+            return None
+
+    def _save_cache(self, ram: bytes) -> None:
+        cache = {'bus': self.rtc.i2c_bus, 'address': self.rtc.i2c_address, 'time': time.time(),
+                 'ram': ram.hex(), 'eeprom': self.data.hex()}
+        temporary_path = self.cache_path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+            descriptor = os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            os.fchmod(descriptor, 0o600)
+            with os.fdopen(descriptor, 'w') as cache_file:
+                json.dump(cache, cache_file, indent=2)
+            os.replace(temporary_path, self.cache_path)
+        except OSError as error:
+            logger.warning("can't save the configuration eeprom cache %s: %s", self.cache_path, error)
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+
+class CircuitOpenError(OSError):
+    """
+    Raised without accessing the bus while the circuit breaker is open.
+    """
+
+
+class DeadlineExceededError(TimeoutError):
+    """
+    Raised when a call is still failing at its deadline (see resilience.RetryPolicy.timeout).
+    """
+
+
+class WriteVerificationError(OSError):
+    """
+    Raised when the registers read back after a write differ from the values written.
+    """
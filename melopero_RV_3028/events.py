@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import asyncio
+import datetime
+import threading
+import time
+from collections import namedtuple
+
+from melopero_RV_3028.RV_3028 import RV_3028
+from melopero_RV_3028.AsyncRV_3028 import get_bus_executor
+from melopero_RV_3028.interrupts import InterruptDispatcher
+from melopero_RV_3028.registers import FIELDS
+
+EventTimestamp = namedtuple('EventTimestamp', ['timestamp', 'count', 'missed'])
+'''An event read from the time stamp registers: the time of the event (datetime.datetime, one second resolution),
+the value of the event counter and the amount of events since the previous read that have no time stamp.'''
+
+# the burst read covers STATUS (EVF), CONTROL2 (12h mode) and the time stamp block
+_BURST_START = RV_3028.STATUS_REGISTER_ADDRESS
+_BURST_LENGTH = 0x1A - _BURST_START + 1
+
+_EVF = FIELDS['EVF'].masks()[0][1]
+_TSR = FIELDS['TSR'].masks()[0][1]
+_H12 = FIELDS['H12']
+_COUNT_TS = FIELDS['COUNT_TS']
+_SECONDS_TS = FIELDS['SECONDS_TS']
+_MINUTES_TS = FIELDS['MINUTES_TS']
+_HOURS_TS = FIELDS['HOURS_TS']
+_DATE_TS = FIELDS['DATE_TS']
+_MONTH_TS = FIELDS['MONTH_TS']
+_YEAR_TS = FIELDS['YEAR_TS']
+_HOURS_12 = FIELDS['HOURS_12']
+_PM = FIELDS['PM']
+
+# the counter stops at 255: in overwrite mode it is reset before getting there
+_COUNT_RESET_THRESHOLD = 0xF0
+
+
+class EventCapture():
+    """
+    Time stamps the external events on the EVI pin with the RTC, so the time of a pulse doesn't depend on the
+    latency of the software. The device keeps a single time stamp (the first event since the last reset or, in
+    overwrite mode, the last event) and counts the events.
+
+    Each read() is a single block read of the STATUS register, the event counter and the time stamp registers,
+    followed by a single write clearing EVF. The events between two reads are detected from the counter and
+    reported as missed. In first event mode the time stamp registers and the counter are reset after each event
+    (one more write), so the next event can be captured; the events that occur between the read and the reset
+    are lost without being counted.
+
+    Example:
+        capture = EventCapture(rtc, rising_edge=True)
+        capture.start()
+        for event in capture.events():
+            print(event.timestamp, event.missed)
+    """
+
+    def __init__(self, rtc: RV_3028, rising_edge: bool = False, event_filter: int = RV_3028.EVENT_FILTER_NONE,
+                 overwrite: bool = False, poll_interval: float = 0.01, sleep=time.sleep):
+        """
+        :param rtc: the device
+        :param rising_edge: if True the events are the rising edges of EVI, otherwise the falling edges
+        :param event_filter: the sampling period of the EVI filter. Must be one of RV_3028.EVENT_FILTER_X
+        :param overwrite: if True each read returns the last event, otherwise the first one since the previous read
+        :param poll_interval: the interval between two reads while waiting for an event (seconds). If the capture
+            is attached to an InterruptDispatcher the device is read only after an event interrupt.
+        :param sleep: the function used to sleep between the polls
+        """
+        self.rtc = rtc
+        self.rising_edge = rising_edge
+        self.event_filter = event_filter
+        self.overwrite = overwrite
+        self.poll_interval = poll_interval
+        self.sleep = sleep
+        self._last_count = 0
+        self._dispatcher = None
+        self._signal = threading.Event()
+
+        self.events_read = 0
+        '''the amount of events returned by read()'''
+        self.missed = 0
+        '''the total amount of events without time stamp'''
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self, generate_interrupt: bool = None) -> None:
+        """
+        Enables the time stamp function (the time stamp registers and the counter are reset).
+
+        :param generate_interrupt: if True the events trigger an interrupt on the INT pin. Defaults to True if the
+            capture is attached to an InterruptDispatcher.
+        """
+        if generate_interrupt is None:
+            generate_interrupt = self._dispatcher is not None
+        self.rtc.enable_event_timestamp(True, self.rising_edge, self.event_filter, self.overwrite, generate_interrupt)
+        self._last_count = 0
+
+    def stop(self) -> None:
+        """
+        Disables the time stamp function and the event interrupt.
+        """
+        self.rtc.set_fields(TSE=0, EIE=0)
+
+    def read(self) -> EventTimestamp:
+        """
+        :return: the event captured since the previous read, None if there is none
+        """
+        with self.rtc.batch():
+            values = self.rtc.read_registers(_BURST_START, _BURST_LENGTH)
+            status = values[0]
+            if status & _EVF:
+                # writing 1 leaves the other flags unchanged, even if they have been raised since the read
+                self.rtc.write_register(RV_3028.STATUS_REGISTER_ADDRESS, ~_EVF & 0xFF)
+
+            count = _COUNT_TS.from_registers(values, _BURST_START)
+            # a counter lower than the last one has been reset by someone else
+            new_events = count - self._last_count if count >= self._last_count else count
+            if new_events <= 0:
+                return None
+            if not self.overwrite or count >= _COUNT_RESET_THRESHOLD:
+                # EVENT_CONTROL is part of the burst: no read-modify-write
+                self.rtc.write_register(RV_3028.EVENT_CONTROL_ADDRESS,
+                                        values[RV_3028.EVENT_CONTROL_ADDRESS - _BURST_START] | _TSR)
+                self._last_count = 0
+            else:
+                self._last_count = count
+
+        event = EventTimestamp(self._decode_timestamp(values), count, new_events - 1)
+        self.events_read += 1
+        self.missed += event.missed
+        return event
+
+    @staticmethod
+    def _decode_timestamp(values: list) -> datetime.datetime:
+        hours_register = values[_HOURS_TS.registers[0] - _BURST_START]
+        if _H12.from_registers(values, _BURST_START):
+            hours = _HOURS_12.decode[hours_register] % 12 + 12 * _PM.decode[hours_register]
+        else:
+            hours = _HOURS_TS.decode[hours_register]
+        return datetime.datetime(2000 + _YEAR_TS.from_registers(values, _BURST_START),
+                                 _MONTH_TS.from_registers(values, _BURST_START),
+                                 _DATE_TS.from_registers(values, _BURST_START), hours,
+                                 _MINUTES_TS.from_registers(values, _BURST_START),
+                                 _SECONDS_TS.from_registers(values, _BURST_START))
+
+    def _poll_due(self) -> bool:
+        if self._dispatcher is None:
+            return True
+        if not self._signal.is_set():
+            return False
+        self._signal.clear()
+        return True
+
+    def events(self, timeout: float = None):
+        """
+        Generator of the captured events.
+
+        :param timeout: the generator stops if no event is captured for timeout seconds, None to run forever
+        """
+        idle = 0.0
+        while timeout is None or idle < timeout:
+            event = self.read() if self._poll_due() else None
+            if event is not None:
+                idle = 0.0
+                yield event
+                continue
+            if self._dispatcher is not None:
+                self._signal.wait(self.poll_interval)
+            else:
+                self.sleep(self.poll_interval)
+            idle += self.poll_interval
+
+    async def events_async(self, timeout: float = None):
+        """
+        Asynchronous generator of the captured events. The reads run on the executor of the i2c bus (see
+        AsyncRV_3028), the waits happen on the event loop.
+
+        :param timeout: the generator stops if no event is captured for timeout seconds, None to run forever
+        """
+        loop = asyncio.get_running_loop()
+        executor = get_bus_executor(self.rtc.i2c_bus)
+        idle = 0.0
+        while timeout is None or idle < timeout:
+            event = await loop.run_in_executor(executor, self.read) if self._poll_due() else None
+            if event is not None:
+                idle = 0.0
+                yield event
+                continue
+            await asyncio.sleep(self.poll_interval)
+            idle += self.poll_interval
+
+    # event interrupt
+
+    def attach(self, dispatcher: InterruptDispatcher) -> None:
+        """
+        Reads the device only after an event interrupt handled by dispatcher, instead of polling. Call start()
+        after attach() to enable the event interrupt.
+
+        :param dispatcher: the interrupt dispatcher of the device
+        """
+        self.detach()
+        self._dispatcher = dispatcher
+        self._signal.set()
+        dispatcher.add_handler(InterruptDispatcher.EVENT, self._on_event)
+
+    def detach(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.remove_handler(InterruptDispatcher.EVENT, self._on_event)
+            self._dispatcher = None
+
+    def _on_event(self, source: int) -> None:
+        self._signal.set()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import logging
+import time
+from bisect import bisect_left
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+class BusInstrumentation():
+    """
+    Collects statistics about the bus transfers of an RV_3028: transfers per operation and register, transfers
+    per high level method, OSErrors, retries, circuit breaker trips, fixed bucket latency histograms per operation
+    and the waits for the bus lock. The statistics can be
+    exported in the Prometheus text format. With trace=True every transfer is also logged (DEBUG level) on the
+    melopero_RV_3028.instrumentation logger.
+
+    Example:
+        rtc.instrumentation = BusInstrumentation()
+        ...
+        print(rtc.instrumentation.export_prometheus())
+
+    When RV_3028.instrumentation is None (the default) the transfers are not measured at all.
+    """
+
+    # upper bounds of the latency histogram buckets (seconds)
+    LATENCY_BUCKETS = (0.00005, 0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1)
+
+    def __init__(self, trace: bool = False, clock=time.perf_counter, prefix: str = "rv3028"):
+        """
+        :param trace: if True every transfer is logged
+        :param clock: the monotonic clock used to time the transfers
+        :param prefix: the prefix of the exported metric names
+        """
+        self.trace = trace
+        self.clock = clock
+        self.prefix = prefix
+        self.transfers = Counter()
+        '''(operation, register) -> amount of transfers'''
+        self.methods = Counter()
+        '''high level method -> amount of transfers'''
+        self.errors = Counter()
+        '''(operation, register) -> amount of OSErrors'''
+        self.retries = Counter()
+        '''(operation, register) -> amount of retries (see RetryPolicy)'''
+        self.circuit_trips = 0
+        '''the amount of times the circuit breaker has opened'''
+        self.histograms = {}
+        '''operation -> [bucket counts (the last one is +Inf), sum of the latencies, count]'''
+        self.lock_waits = Counter()
+        '''high level method -> amount of times the bus lock was held by another thread'''
+        self.lock_wait_histogram = self._new_histogram()
+        '''[bucket counts (the last one is +Inf), sum of the waits, count] of the waits for the bus lock'''
+
+    def reset(self) -> None:
+        self.transfers.clear()
+        self.methods.clear()
+        self.errors.clear()
+        self.retries.clear()
+        self.circuit_trips = 0
+        self.histograms.clear()
+        self.lock_waits.clear()
+        self.lock_wait_histogram = self._new_histogram()
+
+    def _new_histogram(self) -> list:
+        return [[0] * (len(self.LATENCY_BUCKETS) + 1), 0.0, 0]
+
+    def _observe(self, histogram: list, duration: float) -> None:
+        histogram[0][bisect_left(self.LATENCY_BUCKETS, duration)] += 1
+        histogram[1] += duration
+        histogram[2] += 1
+
+    def measure(self, rtc, transfer, operation: str, *args):
+        """
+        Runs transfer(operation, *args) and records it. Called by RV_3028._transfer.
+        """
+        start = self.clock()
+        try:
+            result = transfer(operation, *args)
+        except OSError as error:
+            self._record(rtc, operation, args, self.clock() - start, error)
+            raise
+        self._record(rtc, operation, args, self.clock() - start, result)
+        return result
+
+    def _record(self, rtc, operation: str, args: tuple, duration: float, result) -> None:
+        key = (operation, _first_register(args))
+        register = key[1]
+        self.transfers[key] += 1
+        method = rtc._caller.method
+        self.methods[method] += 1
+        if isinstance(result, OSError):
+            self.errors[key] += 1
+
+        histogram = self.histograms.get(operation)
+        if histogram is None:
+            histogram = self.histograms[operation] = self._new_histogram()
+        self._observe(histogram, duration)
+
+        if self.trace:
+            logger.debug("%s 0x%02X %s %s -> %r (%.1f us)", method, register, operation, list(args[1:]), result,
+                         duration * 1e6)
+
+    def record_retry(self, rtc, operation: str, args: tuple) -> None:
+        """
+        Records a transfer that is attempted again after a failure. Called by RV_3028._transfer.
+        """
+        self.retries[(operation, _first_register(args))] += 1
+
+    def record_circuit_trip(self, rtc) -> None:
+        """
+        Records the opening of the circuit breaker. Called by RV_3028._transfer.
+        """
+        self.circuit_trips += 1
+
+    def record_lock_wait(self, rtc, wait: float) -> None:
+        """
+        Records a wait for the bus lock (the lock was held by another thread). Called by RV_3028.locked.
+        """
+        method = rtc._caller.method
+        self.lock_waits[method] += 1
+        self._observe(self.lock_wait_histogram, wait)
+        if self.trace:
+            logger.debug("%s waited %.1f us for the bus lock", method, wait * 1e6)
+
+    def export_prometheus(self) -> str:
+        """
+        :return: the statistics in the Prometheus text exposition format
+        """
+        prefix = self.prefix
+        lines = ["# HELP {}_i2c_transfers_total i2c transfers by operation and register".format(prefix),
+                 "# TYPE {}_i2c_transfers_total counter".format(prefix)]
+        for (operation, register), count in sorted(self.transfers.items()):
+            lines.append('{}_i2c_transfers_total{{operation="{}",register="0x{:02X}"}} {}'.format(
+                prefix, operation, register, count))
+
+        lines += ["# HELP {}_i2c_method_transfers_total i2c transfers by driver method".format(prefix),
+                  "# TYPE {}_i2c_method_transfers_total counter".format(prefix)]
+        for method, count in sorted(self.methods.items(), key=lambda item: str(item[0])):
+            lines.append('{}_i2c_method_transfers_total{{method="{}"}} {}'.format(prefix, method, count))
+
+        lines += ["# HELP {}_i2c_errors_total i2c transfers that raised an OSError".format(prefix),
+                  "# TYPE {}_i2c_errors_total counter".format(prefix)]
+        for (operation, register), count in sorted(self.errors.items()):
+            lines.append('{}_i2c_errors_total{{operation="{}",register="0x{:02X}"}} {}'.format(
+                prefix, operation, register, count))
+
+        lines += ["# HELP {}_i2c_retries_total i2c transfers attempted again after a failure".format(prefix),
+                  "# TYPE {}_i2c_retries_total counter".format(prefix)]
+        for (operation, register), count in sorted(self.retries.items()):
+            lines.append('{}_i2c_retries_total{{operation="{}",register="0x{:02X}"}} {}'.format(
+                prefix, operation, register, count))
+
+        lines += ["# HELP {}_i2c_circuit_trips_total times the circuit breaker has opened".format(prefix),
+                  "# TYPE {}_i2c_circuit_trips_total counter".format(prefix),
+                  "{}_i2c_circuit_trips_total {}".format(prefix, self.circuit_trips)]
+
+        lines += ["# HELP {}_i2c_transfer_seconds i2c transfer latency".format(prefix),
+                  "# TYPE {}_i2c_transfer_seconds histogram".format(prefix)]
+        for operation, histogram in sorted(self.histograms.items()):
+            lines += self._export_histogram('{}_i2c_transfer_seconds'.format(prefix),
+                                            'operation="{}",'.format(operation), histogram)
+
+        lines += ["# HELP {}_i2c_lock_contentions_total waits for the bus lock by driver method".format(prefix),
+                  "# TYPE {}_i2c_lock_contentions_total counter".format(prefix)]
+        for method, count in sorted(self.lock_waits.items(), key=lambda item: str(item[0])):
+            lines.append('{}_i2c_lock_contentions_total{{method="{}"}} {}'.format(prefix, method, count))
+
+        lines += ["# HELP {}_i2c_lock_wait_seconds time spent waiting for the bus lock".format(prefix),
+                  "# TYPE {}_i2c_lock_wait_seconds histogram".format(prefix)]
+        lines += self._export_histogram('{}_i2c_lock_wait_seconds'.format(prefix), '', self.lock_wait_histogram)
+        return "\n".join(lines) + "\n"
+
+    def _export_histogram(self, name: str, labels: str, histogram: list) -> list:
+        buckets, total, count = histogram
+        lines = []
+        cumulative = 0
+        for bound, bucket in zip(self.LATENCY_BUCKETS + ('+Inf',), buckets):
+            cumulative += bucket
+            lines.append('{}_bucket{{{}le="{}"}} {}'.format(name, labels, bound, cumulative))
+        labels = '{{{}}}'.format(labels.rstrip(',')) if labels else ''
+        lines.append('{}_sum{} {}'.format(name, labels, total))
+        lines.append('{}_count{} {}'.format(name, labels, count))
+        return lines
+
+
+def _first_register(args: tuple) -> int:
+    """
+    :return: the register of a transfer, the first register of a combined transfer
+    """
+    return args[0] if isinstance(args[0], int) else args[0][0][1]
+
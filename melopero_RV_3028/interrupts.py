@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import logging
+import threading
+import time
+
+from melopero_RV_3028.RV_3028 import RV_3028
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyStats():
+    """
+    Running statistics of the delay between an INT edge and the call of its handlers (nanoseconds).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.last = None
+
+    def add(self, latency_ns: int) -> None:
+        self.count += 1
+        self.total += latency_ns
+        self.last = latency_ns
+        if self.min is None or latency_ns < self.min:
+            self.min = latency_ns
+        if self.max is None or latency_ns > self.max:
+            self.max = latency_ns
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else None
+
+
+class InterruptDispatcher():
+    """
+    Routes the interrupts of the INT pin to per source handlers. On each falling edge of the INT pin the STATUS
+    register is read once, the flags of the sources that have a handler are cleared with a single write and
+    the handlers are called with the source as argument.
+
+    The flags of the sources without handlers are left untouched. Note that the INT pin stays low while a flag
+    of an enabled interrupt is set, so every enabled source should have a handler.
+
+    Example:
+        dispatcher = InterruptDispatcher(rtc, GpiozeroInterruptBackend("GPIO4"))
+        dispatcher.add_handler(InterruptDispatcher.TIMER, lambda source: print("Timer: beep beep"))
+        dispatcher.start()
+    """
+
+    # interrupt sources, the values are the flags in the STATUS register
+    EVENT = 0x02
+    ALARM = 0x04
+    TIMER = 0x08
+    PERIODIC_TIME_UPDATE = 0x10
+
+    SOURCES = (TIMER, ALARM, PERIODIC_TIME_UPDATE, EVENT)
+
+    def __init__(self, rtc: RV_3028, backend, clock=time.monotonic_ns):
+        """
+        :param rtc: the device
+        :param backend: the gpio backend that listens to the INT pin (see *InterruptBackend)
+        :param clock: the clock used to measure the latency, must be the clock of the backend edge timestamps
+        """
+        self.rtc = rtc
+        self.backend = backend
+        self.clock = clock
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._pending = False
+
+        self.edges = 0
+        '''the amount of edges received'''
+        self.missed_edges = 0
+        '''the edges received while a dispatch was running, they are coalesced into a single extra dispatch'''
+        self.spurious_edges = 0
+        '''the edges for which no flag was set'''
+        self.latency = LatencyStats()
+        '''edge to handler latency'''
+        self.last_edge_ns = None
+        '''the time (according to clock) of the edge being dispatched or of the last dispatched edge'''
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def add_handler(self, source: int, handler) -> None:
+        """
+        :param source: one of EVENT, ALARM, TIMER, PERIODIC_TIME_UPDATE
+        :param handler: a function called with the source as argument
+        :return:
+        """
+        self._handlers.setdefault(source, []).append(handler)
+
+    def remove_handler(self, source: int, handler) -> None:
+        handlers = self._handlers.get(source, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+    def start(self) -> None:
+        self.backend.start(self.on_edge)
+
+    def stop(self) -> None:
+        self.backend.stop()
+
+    def on_edge(self, timestamp_ns: int = None) -> None:
+        """
+        Called by the backend on each falling edge of the INT pin.
+
+        :param timestamp_ns: the time of the edge according to clock, defaults to now
+        :return:
+        """
+        if timestamp_ns is None:
+            timestamp_ns = self.clock()
+        self.edges += 1
+
+        self._pending = True
+        while self._pending:
+            if not self._lock.acquire(blocking=False):
+                # the running dispatch will read the STATUS register again
+                self.missed_edges += 1
+                return
+            try:
+                self._pending = False
+                # the time of coalesced edges is unknown, the start of their dispatch is used
+                self.last_edge_ns = timestamp_ns if timestamp_ns is not None else self.clock()
+                self._dispatch(timestamp_ns)
+            finally:
+                self._lock.release()
+            # the latency of coalesced edges is not measured
+            timestamp_ns = None
+
+    def _dispatch(self, timestamp_ns: int) -> None:
+        status = self.rtc.read_register(RV_3028.STATUS_REGISTER_ADDRESS)
+        fired = [source for source in InterruptDispatcher.SOURCES if status & source]
+        if not fired:
+            self.spurious_edges += 1
+            return
+
+        handled = 0
+        for source in fired:
+            if self._handlers.get(source):
+                handled |= source
+        if handled:
+            # the flags are cleared by writing 0 and left unchanged by writing 1: the flags raised since the read
+            # are kept
+            self.rtc.write_register(RV_3028.STATUS_REGISTER_ADDRESS, ~handled & 0xFF)
+
+        for source in fired:
+            for handler in list(self._handlers.get(source, [])):
+                if timestamp_ns is not None:
+                    self.latency.add(self.clock() - timestamp_ns)
+                    timestamp_ns = None
+                try:
+                    handler(source)
+                except Exception:
+                    logger.exception("interrupt handler %r failed", handler)
+
+
+class FakeInterruptBackend():
+    """
+    Backend without hardware, the edges are generated by calling trigger().
+    """
+
+    def __init__(self):
+        self._callback = None
+
+    def start(self, callback) -> None:
+        self._callback = callback
+
+    def stop(self) -> None:
+        self._callback = None
+
+    def trigger(self, timestamp_ns: int = None) -> None:
+        if self._callback is not None:
+            self._callback(timestamp_ns)
+
+
+class GpiozeroInterruptBackend():
+    """
+    Backend based on gpiozero (the INT pin is active low and pulled up on the breakout).
+    """
+
+    def __init__(self, pin="GPIO4"):
+        self.pin = pin
+        self._button = None
+
+    def start(self, callback) -> None:
+        import gpiozero
+        self._button = gpiozero.Button(self.pin, pull_up=None, active_state=False)
+        self._button.when_pressed = lambda: callback(time.monotonic_ns())
+
+    def stop(self) -> None:
+        if self._button is not None:
+            self._button.close()
+            self._button = None
+
+
+class GpioChipInterruptBackend():
+    """
+    Backend based on the Linux gpiochip character device (through the libgpiod v2 python bindings). The edge
+    timestamps are taken by the kernel, so the measured latency includes the scheduling of the python thread.
+    """
+
+    def __init__(self, line: int = 4, chip: str = "/dev/gpiochip0", consumer: str = "rv-3028"):
+        self.line = line
+        self.chip = chip
+        self.consumer = consumer
+        self._request = None
+        self._thread = None
+        self._running = False
+
+    def start(self, callback) -> None:
+        import gpiod
+        from gpiod.line import Edge
+
+        self._request = gpiod.request_lines(self.chip, consumer=self.consumer,
+                                            config={self.line: gpiod.LineSettings(edge_detection=Edge.FALLING)})
+        self._running = True
+        self._thread = threading.Thread(target=self._run, args=(callback,), daemon=True)
+        self._thread.start()
+
+    def _run(self, callback) -> None:
+        while self._running:
+            if self._request.wait_edge_events(0.1):
+                for event in self._request.read_edge_events():
+                    callback(event.timestamp_ns)
+
+    def stop(self) -> None:
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._request is not None:
+            self._request.release()
+            self._request = None
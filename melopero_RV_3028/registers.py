@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+
+Declarative map of the RV-3028 registers (0x00 - 0x3F, the configuration EEPROM is mirrored at 0x30 - 0x37) and of
+their bit fields. The encoders and decoders of the fields are compiled into lookup tables at import.
+"""
+
+REGISTERS = {
+    0x00: 'SECONDS',
+    0x01: 'MINUTES',
+    0x02: 'HOURS',
+    0x03: 'WEEKDAY',
+    0x04: 'DATE',
+    0x05: 'MONTH',
+    0x06: 'YEAR',
+    0x07: 'MINUTES_ALARM',
+    0x08: 'HOURS_ALARM',
+    0x09: 'WEEKDAY_DATE_ALARM',
+    0x0A: 'TIMER_VALUE_0',
+    0x0B: 'TIMER_VALUE_1',
+    0x0C: 'TIMER_STATUS_0',
+    0x0D: 'TIMER_STATUS_1',
+    0x0E: 'STATUS',
+    0x0F: 'CONTROL1',
+    0x10: 'CONTROL2',
+    0x11: 'GP_BITS',
+    0x12: 'CLOCK_INTERRUPT_MASK',
+    0x13: 'EVENT_CONTROL',
+    0x14: 'COUNT_TS',
+    0x15: 'SECONDS_TS',
+    0x16: 'MINUTES_TS',
+    0x17: 'HOURS_TS',
+    0x18: 'DATE_TS',
+    0x19: 'MONTH_TS',
+    0x1A: 'YEAR_TS',
+    0x1B: 'UNIX_TIME_0',
+    0x1C: 'UNIX_TIME_1',
+    0x1D: 'UNIX_TIME_2',
+    0x1E: 'UNIX_TIME_3',
+    0x1F: 'USER_RAM1',
+    0x20: 'USER_RAM2',
+    0x21: 'PASSWORD_0',
+    0x22: 'PASSWORD_1',
+    0x23: 'PASSWORD_2',
+    0x24: 'PASSWORD_3',
+    0x25: 'EE_ADDRESS',
+    0x26: 'EE_DATA',
+    0x27: 'EE_COMMAND',
+    0x28: 'ID',
+    0x30: 'EEPROM_PW_ENABLE',
+    0x31: 'EEPROM_PASSWORD_0',
+    0x32: 'EEPROM_PASSWORD_1',
+    0x33: 'EEPROM_PASSWORD_2',
+    0x34: 'EEPROM_PASSWORD_3',
+    0x35: 'EEPROM_CLKOUT',
+    0x36: 'EEPROM_OFFSET',
+    0x37: 'EEPROM_BACKUP',
+}
+'''register address -> register name'''
+
+# BCD <-> decimal lookup tables
+BCD_TO_DEC = tuple((bcd >> 4) * 10 + (bcd & 0x0F) for bcd in range(256))
+DEC_TO_BCD = tuple((dec // 10) << 4 | dec % 10 for dec in range(100))
+
+
+class Field():
+    """
+    A bit field of the register map. Fields wider than a register (e.g. TIMER_VALUE, UNIX_TIME) are made of parts,
+    (register, shift, width) tuples listed from the least significant one.
+
+    decode and encode are the lookup tables of the single register fields: decode[register value] is the value of
+    the field and encode[field value] are the bits of the register. part_decode holds a lookup table per part:
+    part_decode[i][register value] are the bits of the field stored in the register of part i.
+
+    The write_zero_to_clear fields (the STATUS flags) are cleared by writing 0 and kept by writing 1, so they are
+    never written back with the value read from the device (see WRITE_ZERO_TO_CLEAR).
+    """
+
+    __slots__ = ('name', 'parts', 'bcd', 'read_only', 'write_zero_to_clear', 'registers', 'max_value', 'decode',
+                 'encode', 'part_decode', 'keep')
+
+    def __init__(self, name: str, parts: tuple, bcd: bool = False, read_only: bool = False,
+                 write_zero_to_clear: bool = False):
+        self.name = name
+        self.parts = tuple(parts)
+        self.bcd = bcd
+        self.read_only = read_only
+        self.write_zero_to_clear = write_zero_to_clear
+        self.registers = tuple(register for register, _, _ in self.parts)
+        width = sum(part_width for _, _, part_width in self.parts)
+        if bcd:
+            # every nibble holds a digit, the most significant one can be narrower
+            self.max_value = min((1 << width) - 1 >> 4, 9) * 10 + 9 if width > 4 else min((1 << width) - 1, 9)
+        else:
+            self.max_value = (1 << width) - 1
+
+        # bits of the other fields, kept when the field is written (see _compile_keep_masks)
+        self.keep = tuple(~((1 << width) - 1 << shift) & 0xFF for _, shift, width in self.parts)
+        self.decode = self.encode = None
+        self.part_decode = []
+        offset = 0
+        for _, shift, width in self.parts:
+            self.part_decode.append(tuple((value >> shift & (1 << width) - 1) << offset for value in range(256)))
+            offset += width
+        self.part_decode = tuple(self.part_decode)
+        if len(self.parts) == 1:
+            _, shift, width = self.parts[0]
+            mask = (1 << width) - 1
+            if bcd:
+                self.decode = tuple(BCD_TO_DEC[value >> shift & mask] for value in range(256))
+                self.encode = tuple(DEC_TO_BCD[value] << shift for value in range(self.max_value + 1))
+            else:
+                self.decode = tuple(value >> shift & mask for value in range(256))
+                self.encode = tuple(value << shift for value in range(self.max_value + 1))
+
+    def masks(self) -> list:
+        """
+        :return: a list of (register, mask of the field bits) tuples
+        """
+        return [(register, (1 << width) - 1 << shift) for register, shift, width in self.parts]
+
+    def to_registers(self, value: int) -> list:
+        """
+        :param value: the value of the field
+        :return: a list of (register, mask of the bits to keep, field bits) tuples
+        """
+        if not 0 <= value <= self.max_value:
+            raise ValueError("{} must be in range 0-{}, got {}".format(self.name, self.max_value, value))
+        if self.encode is not None:
+            return [(self.registers[0], self.keep[0], self.encode[value])]
+        changes = []
+        for (register, shift, width), keep in zip(self.parts, self.keep):
+            changes.append((register, keep, (value & (1 << width) - 1) << shift))
+            value >>= width
+        return changes
+
+    def from_registers(self, values, start: int = 0) -> int:
+        """
+        :param values: the register values, values[register address - start] must be the value of each register
+            of the field
+        :param start: the address of the first register in values
+        :return: the value of the field
+        """
+        if self.decode is not None:
+            return self.decode[values[self.registers[0] - start]]
+        value = 0
+        for register, table in zip(self.registers, self.part_decode):
+            value |= table[values[register - start]]
+        return value
+
+
+def _field(name: str, register: int, shift: int = 0, width: int = 8, **kwargs) -> Field:
+    return Field(name, [(register, shift, width)], **kwargs)
+
+
+def _flag(name: str, register: int, bit: int, **kwargs) -> Field:
+    return Field(name, [(register, bit, 1)], **kwargs)
+
+
+FIELDS = {field.name: field for field in (
+    # clock
+    _field('SECONDS', 0x00, 0, 7, bcd=True),
+    _field('MINUTES', 0x01, 0, 7, bcd=True),
+    # hours in 24h mode
+    _field('HOURS', 0x02, 0, 6, bcd=True),
+    # hours in 12h mode (1-12)
+    _field('HOURS_12', 0x02, 0, 5, bcd=True),
+    # period in 12h mode
+    _flag('PM', 0x02, 5),
+    _field('WEEKDAY', 0x03, 0, 3),
+    _field('DATE', 0x04, 0, 6, bcd=True),
+    _field('MONTH', 0x05, 0, 5, bcd=True),
+    _field('YEAR', 0x06, 0, 8, bcd=True),
+    # alarm, the AE_ bits disable the comparison when set
+    _flag('AE_M', 0x07, 7),
+    _field('MINUTES_ALARM', 0x07, 0, 7, bcd=True),
+    _flag('AE_H', 0x08, 7),
+    _field('HOURS_ALARM', 0x08, 0, 6, bcd=True),
+    _field('HOURS_12_ALARM', 0x08, 0, 5, bcd=True),
+    _flag('PM_ALARM', 0x08, 5),
+    _flag('AE_WD', 0x09, 7),
+    _field('WEEKDAY_DATE_ALARM', 0x09, 0, 6, bcd=True),
+    # countdown timer
+    Field('TIMER_VALUE', [(0x0A, 0, 8), (0x0B, 0, 4)]),
+    Field('TIMER_STATUS', [(0x0C, 0, 8), (0x0D, 0, 4)], read_only=True),
+    # status
+    _flag('EEBUSY', 0x0E, 7, read_only=True),
+    _flag('CLKF', 0x0E, 6, write_zero_to_clear=True),
+    _flag('BSF', 0x0E, 5, write_zero_to_clear=True),
+    _flag('UF', 0x0E, 4, write_zero_to_clear=True),
+    _flag('TF', 0x0E, 3, write_zero_to_clear=True),
+    _flag('AF', 0x0E, 2, write_zero_to_clear=True),
+    _flag('EVF', 0x0E, 1, write_zero_to_clear=True),
+    _flag('PORF', 0x0E, 0, write_zero_to_clear=True),
+    # control 1
+    _flag('TRPT', 0x0F, 7),
+    _flag('WADA', 0x0F, 5),
+    _flag('USEL', 0x0F, 4),
+    _flag('EERD', 0x0F, 3),
+    _flag('TE', 0x0F, 2),
+    _field('TD', 0x0F, 0, 2),
+    # control 2
+    _flag('TSE', 0x10, 7),
+    _flag('CLKIE', 0x10, 6),
+    _flag('UIE', 0x10, 5),
+    _flag('TIE', 0x10, 4),
+    _flag('AIE', 0x10, 3),
+    _flag('EIE', 0x10, 2),
+    # the 12_24 bit: 12h mode when set
+    _flag('H12', 0x10, 1),
+    _flag('RESET', 0x10, 0),
+    _field('GP', 0x11, 0, 7),
+    # clock interrupt mask
+    _flag('CEIE', 0x12, 3),
+    _flag('CAIE', 0x12, 2),
+    _flag('CTIE', 0x12, 1),
+    _flag('CUIE', 0x12, 0),
+    # event control
+    _flag('EHL', 0x13, 6),
+    _field('ET', 0x13, 4, 2),
+    _flag('TSR', 0x13, 2),
+    _flag('TSOW', 0x13, 1),
+    _flag('TSS', 0x13, 0),
+    # time stamp
+    _field('COUNT_TS', 0x14, read_only=True),
+    _field('SECONDS_TS', 0x15, 0, 7, bcd=True, read_only=True),
+    _field('MINUTES_TS', 0x16, 0, 7, bcd=True, read_only=True),
+    _field('HOURS_TS', 0x17, 0, 6, bcd=True, read_only=True),
+    _field('DATE_TS', 0x18, 0, 6, bcd=True, read_only=True),
+    _field('MONTH_TS', 0x19, 0, 5, bcd=True, read_only=True),
+    _field('YEAR_TS', 0x1A, 0, 8, bcd=True, read_only=True),
+    Field('UNIX_TIME', [(0x1B, 0, 8), (0x1C, 0, 8), (0x1D, 0, 8), (0x1E, 0, 8)]),
+    _field('USER_RAM1', 0x1F),
+    _field('USER_RAM2', 0x20),
+    Field('PASSWORD', [(0x21, 0, 8), (0x22, 0, 8), (0x23, 0, 8), (0x24, 0, 8)]),
+    # eeprom access
+    _field('EE_ADDRESS', 0x25),
+    _field('EE_DATA', 0x26),
+    _field('EE_COMMAND', 0x27),
+    _field('HID', 0x28, 4, 4, read_only=True),
+    _field('VID', 0x28, 0, 4, read_only=True),
+    # configuration eeprom (ram mirror)
+    _field('EEPWE', 0x30),
+    Field('EEPW', [(0x31, 0, 8), (0x32, 0, 8), (0x33, 0, 8), (0x34, 0, 8)]),
+    _flag('CLKOE', 0x35, 7),
+    _flag('CLKSY', 0x35, 6),
+    _flag('PORIE', 0x35, 3),
+    _field('FD', 0x35, 0, 3),
+    # frequency offset correction, 9 bit two's complement
+    Field('EEOFFSET', [(0x37, 7, 1), (0x36, 0, 8)]),
+    _flag('BSIE', 0x37, 6),
+    _flag('TCE', 0x37, 5),
+    _flag('FEDE', 0x37, 4),
+    _field('BSM', 0x37, 2, 2),
+    _field('TCR', 0x37, 0, 2),
+)}
+'''field name -> Field'''
+
+
+def _compile_keep_masks() -> None:
+    # the bits that don't belong to any writable field are reserved or read only: writing a field doesn't need to
+    # preserve them, so a write covering all the fields of a register doesn't need to read it first
+    used = {}
+    for field in FIELDS.values():
+        if not field.read_only:
+            for register, mask in field.masks():
+                used[register] = used.get(register, 0) | mask
+    for field in FIELDS.values():
+        field.keep = tuple(keep & used.get(register, 0) for register, keep in zip(field.registers, field.keep))
+
+
+_compile_keep_masks()
+
+
+def _write_zero_to_clear_masks() -> dict:
+    masks = {}
+    for field in FIELDS.values():
+        if field.write_zero_to_clear:
+            for register, mask in field.masks():
+                masks[register] = masks.get(register, 0) | mask
+    return masks
+
+
+WRITE_ZERO_TO_CLEAR = _write_zero_to_clear_masks()
+'''register address -> the bits of its write_zero_to_clear fields. Writing 1 to them keeps their value, so they are
+written 1 instead of being read first when other bits of the register change.'''
+
+CONFIGURATION_REGISTERS = tuple(range(0x07, 0x0C)) + tuple(range(0x0F, 0x14)) + (0x1F, 0x20) + tuple(range(0x35, 0x38))
+'''the registers that hold the configuration (alarm, timer value, control, event control, user ram, configuration
+ram): the device doesn't change them and they are compared by RV_3028.apply. The time, the flags, the time stamp, the
+UNIX time, the passwords and the eeprom access registers are excluded.'''
+
+
+class RegisterSnapshot():
+    """
+    An immutable copy of consecutive registers (see RV_3028.snapshot), backed by a bytes object.
+
+    Example:
+        snapshot = rtc.snapshot()
+        print(snapshot[0x0F], snapshot.get('TIMER_VALUE'))
+        desired = snapshot.replace(TE=1, TIMER_VALUE=5)
+    """
+
+    __slots__ = ('start', 'data')
+
+    def __init__(self, data: bytes, start: int = 0):
+        """
+        :param data: the register values
+        :param start: the address of the first register
+        """
+        self.start = start
+        self.data = bytes(data)
+
+    @property
+    def end(self) -> int:
+        """
+        the address of the last register
+        """
+        return self.start + len(self.data) - 1
+
+    def __contains__(self, reg_address: int) -> bool:
+        return 0 <= reg_address - self.start < len(self.data)
+
+    def __getitem__(self, reg_address: int) -> int:
+        if reg_address not in self:
+            raise KeyError("register 0x{:02X} not in the snapshot".format(reg_address))
+        return self.data[reg_address - self.start]
+
+    def __iter__(self):
+        return iter(range(self.start, self.start + len(self.data)))
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __bytes__(self) -> bytes:
+        return self.data
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, RegisterSnapshot) and self.start == other.start and self.data == other.data
+
+    def __hash__(self) -> int:
+        return hash((self.start, self.data))
+
+    def __repr__(self) -> str:
+        return "RegisterSnapshot(start=0x{:02X}, data={})".format(self.start, self.data.hex())
+
+    def get(self, name: str) -> int:
+        """
+        :param name: the name of a field of the register map (see FIELDS)
+        :return: the value of the field
+        """
+        field = FIELDS[name]
+        for register in field.registers:
+            if register not in self:
+                raise KeyError("register 0x{:02X} of {} not in the snapshot".format(register, name))
+        return field.from_registers(self.data, self.start)
+
+    def fields(self, *names) -> dict:
+        """
+        :param names: the names of fields of the register map, all the fields in the snapshot if empty
+        :return: a dictionary field name -> value
+        """
+        if not names:
+            names = [name for name, field in FIELDS.items() if all(register in self for register in field.registers)]
+        return {name: self.get(name) for name in names}
+
+    def replace(self, **values) -> 'RegisterSnapshot':
+        """
+        :param values: field name (see FIELDS) -> value
+        :return: a copy of the snapshot with the fields set to the values
+        """
+        data = bytearray(self.data)
+        for register, mask, bits in field_changes(values):
+            if register not in self:
+                raise KeyError("register 0x{:02X} not in the snapshot".format(register))
+            data[register - self.start] = data[register - self.start] & ~mask | bits
+        return RegisterSnapshot(data, self.start)
+
+
+def field_changes(values: dict) -> list:
+    """
+    :param values: field name (see FIELDS) -> value
+    :return: a list of (register address, mask of the bits set, bits) tuples, one per register in address order.
+        The reserved bits are not part of the masks.
+    """
+    changes = {}
+    for name, value in values.items():
+        field = FIELDS[name]
+        for (register, mask), (_, _, bits) in zip(field.masks(), field.to_registers(value)):
+            changed_mask, changed_bits = changes.get(register, (0, 0))
+            changes[register] = (changed_mask | mask, changed_bits & ~mask | bits)
+    return [(register, mask, bits) for register, (mask, bits) in sorted(changes.items())]
+
+
+def diff(a: RegisterSnapshot, b: RegisterSnapshot, registers=None) -> list:
+    """
+    :param a: a snapshot
+    :param b: another snapshot
+    :param registers: the addresses of the registers to compare, e.g. CONFIGURATION_REGISTERS. None to compare all
+        the registers in both snapshots.
+    :return: a list of (register address, value in a, value in b) tuples of the registers that differ, in address
+        order
+    """
+    if registers is None:
+        registers = range(max(a.start, b.start), min(a.end, b.end) + 1)
+    return [(register, a[register], b[register]) for register in sorted(registers)
+            if register in a and register in b and a[register] != b[register]]
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import logging
+import random
+import threading
+import time
+
+# the exceptions are defined in errors so that the driver can raise them without importing this module
+from melopero_RV_3028.errors import CircuitOpenError, DeadlineExceededError, WriteVerificationError  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+
+class RetryPolicy():
+    """
+    Retries the bus transfers that raise an OSError, sleeping between the attempts with an exponentially growing,
+    jittered delay. Each call of a public method of the driver has a deadline, timeout seconds after the call
+    starts, shared by all its transfers: when a retry would start after it, a DeadlineExceededError is raised. The
+    deadline is only checked before a retry, so it never stops a call whose transfers don't fail. The transfers are
+    retried as a whole and the register writes of the driver are absolute values, so retrying them is safe.
+
+    Example:
+        rtc.retry_policy = RetryPolicy(attempts=4, timeout=0.05)
+    """
+
+    def __init__(self, attempts: int = 3, delay: float = 0.001, backoff: float = 2.0, max_delay: float = 0.02,
+                 jitter: float = 0.5, timeout: float = 0.1, sleep=time.sleep, clock=time.monotonic,
+                 random=random.random):
+        """
+        :param attempts: the maximum amount of attempts of a transfer (1 for no retries)
+        :param delay: the delay before the first retry (seconds)
+        :param backoff: the factor the delay is multiplied by after every retry
+        :param max_delay: the maximum delay between two attempts (seconds)
+        :param jitter: the fraction of each delay that is randomized, so that the drivers sharing a bus don't retry
+            in lockstep: a delay d becomes a random value between d * (1 - jitter) and d
+        :param timeout: the time after the start of a call after which its transfers are not retried anymore
+            (seconds), None for no deadline
+        :param sleep: the function used to sleep
+        :param clock: the monotonic clock used to measure the deadline
+        :param random: the function returning random values in [0, 1) used for the jitter
+        """
+        self.attempts = attempts
+        self.delay = delay
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.timeout = timeout
+        self.sleep = sleep
+        self.clock = clock
+        self.random = random
+
+        self.retries = 0
+        '''the amount of transfers that have been attempted again'''
+        self.failures = 0
+        '''the amount of transfers that failed after all the attempts'''
+        self.deadlines_exceeded = 0
+        '''the amount of failed transfers that have not been retried because of their deadline'''
+
+    def deadline(self) -> float:
+        """
+        :return: the deadline of a call starting now, according to clock, None if there is no timeout
+        """
+        return None if self.timeout is None else self.clock() + self.timeout
+
+    def _delays(self):
+        delay = self.delay
+        while True:
+            yield delay * (1 - self.jitter * self.random())
+            delay = min(delay * self.backoff, self.max_delay)
+
+    def call(self, function, deadline: float = None, on_retry=None):
+        """
+        :param function: the function to run (without arguments)
+        :param deadline: the time (according to clock) after which no retry is started, None for no deadline
+        :param on_retry: a function called with the error before every retry
+        :return: the return value of function
+        """
+        delays = self._delays()
+        attempt = 1
+        while True:
+            try:
+                return function()
+            except CircuitOpenError:
+                raise
+            except OSError as error:
+                if attempt >= self.attempts:
+                    self.failures += 1
+                    raise
+                delay = next(delays)
+                if deadline is not None and self.clock() + delay >= deadline:
+                    self.deadlines_exceeded += 1
+                    raise DeadlineExceededError("still failing at the deadline: {}".format(error)) from error
+                self.retries += 1
+                logger.debug("bus transfer failed (%s), attempt %d of %d in %.1f ms", error, attempt + 1,
+                             self.attempts, delay * 1000)
+                if on_retry is not None:
+                    on_retry(error)
+                self.sleep(delay)
+                attempt += 1
+
+
+class CircuitBreaker():
+    """
+    Fails fast when the device keeps failing, so that a dead RTC doesn't stall its callers: after
+    failure_threshold consecutive failed transfers the circuit opens and every transfer raises a CircuitOpenError
+    without accessing the bus. After reset_timeout seconds a single transfer is let through (half open): if it
+    succeeds the circuit closes, otherwise it opens again.
+
+    Example:
+        rtc.circuit_breaker = CircuitBreaker(failure_threshold=5, reset_timeout=10)
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 5.0, clock=time.monotonic):
+        """
+        :param failure_threshold: the amount of consecutive failures that opens the circuit
+        :param reset_timeout: the time the circuit stays open before a transfer is tried again (seconds)
+        :param clock: the monotonic clock used to measure reset_timeout
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._state = CircuitBreaker.CLOSED
+        self._opened_at = None
+        self._consecutive_failures = 0
+
+        self.trips = 0
+        '''the amount of times the circuit has opened'''
+        self.rejected = 0
+        '''the amount of transfers rejected while the circuit was open'''
+
+    @property
+    def state(self) -> str:
+        """
+        CLOSED, OPEN or HALF_OPEN
+        """
+        with self._lock:
+            if self._state == CircuitBreaker.OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                return CircuitBreaker.HALF_OPEN
+            return self._state
+
+    def check(self) -> None:
+        """
+        Called before every transfer. Raises a CircuitOpenError if the circuit is open.
+        """
+        with self._lock:
+            if self._state == CircuitBreaker.CLOSED:
+                return
+            if self._state == CircuitBreaker.OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                # let a single transfer through
+                self._state = CircuitBreaker.HALF_OPEN
+                return
+            self.rejected += 1
+            raise CircuitOpenError("the circuit breaker is open after {} consecutive failures".format(
+                self._consecutive_failures))
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != CircuitBreaker.CLOSED:
+                logger.info("circuit breaker closed")
+            self._state = CircuitBreaker.CLOSED
+            self._consecutive_failures = 0
+
+    def record_failure(self) -> bool:
+        """
+        :return: True if the failure opened the circuit
+        """
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._state == CircuitBreaker.HALF_OPEN or (
+                    self._state == CircuitBreaker.CLOSED and self._consecutive_failures >= self.failure_threshold):
+                self._state = CircuitBreaker.OPEN
+                self._opened_at = self.clock()
+                self.trips += 1
+                logger.warning("circuit breaker open after %d consecutive failures", self._consecutive_failures)
+                return True
+            return False
+
+    def reset(self) -> None:
+        """
+        Closes the circuit.
+        """
+        self.record_success()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import datetime
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from melopero_RV_3028.RV_3028 import RV_3028
+from melopero_RV_3028.interrupts import InterruptDispatcher
+
+logger = logging.getLogger(__name__)
+
+# countdown timer clocks from the coarsest: (TD value, period in seconds)
+TIMER_PERIODS = (
+    (RV_3028.TIMER_FREQ_1_60Hz, 60.0),
+    (RV_3028.TIMER_FREQ_1Hz, 1.0),
+    (RV_3028.TIMER_FREQ_64Hz, 1 / 64),
+    (RV_3028.TIMER_FREQ_4096Hz, 1 / 4096),
+)
+MAX_TICKS = 0xFFF
+
+# the alarm fires at the start of a minute: it is set at least ALARM_MARGIN seconds before the deadline and the
+# countdown timer covers the rest
+ALARM_MARGIN = 120.0
+# the alarm compares date, hours and minutes: it is never set more than 27 days ahead
+MAX_ALARM_HORIZON = 27 * 24 * 3600.0
+
+
+def plan_timer(delay: float, precision: float) -> tuple:
+    """
+    Picks the coarsest countdown timer clock that reaches delay with the requested precision. If the clocks precise
+    enough can't count that far, an intermediate countdown on a coarser clock ends before the deadline and the rest
+    is planned again when it expires.
+
+    :param delay: the time to the deadline (seconds)
+    :param precision: the maximum error of the wakeup (seconds). The countdown ends within one period of the clock.
+    :return: (TD value, ticks, final) where final is False for an intermediate countdown, or None if the delay
+        is beyond the range of the timer
+    """
+    for index, (frequency, period) in enumerate(TIMER_PERIODS):
+        if delay / period > MAX_TICKS:
+            continue
+        if period <= precision or index == len(TIMER_PERIODS) - 1:
+            return frequency, max(1, min(MAX_TICKS, round(delay / period))), True
+        # the countdown ends between one and two periods before the deadline
+        ticks = int(delay / period) - 1
+        if ticks >= 1:
+            return frequency, ticks, False
+    return None
+
+
+class Wakeup():
+    """
+    A scheduled wakeup, returned by WakeupScheduler.schedule. Pass it to WakeupScheduler.cancel to cancel it.
+    """
+
+    __slots__ = ('deadline', 'precision', 'callback', 'cancelled')
+
+    def __init__(self, deadline: float, precision: float, callback):
+        self.deadline = deadline
+        self.precision = precision
+        self.callback = callback
+        self.cancelled = False
+
+
+class WakeupScheduler():
+    """
+    Multiplexes any amount of wakeups on the countdown timer and the alarm of the device. The wakeups are kept in a
+    heap and only the nearest one is programmed into the device, with the coarsest timer clock that meets its
+    precision (fewer interrupts, lower consumption). Deadlines beyond the range of the timer (68 hours) are reached
+    with the alarm, then with the timer.
+
+    Every interrupt of the timer or of the alarm must call on_interrupt, e.g. through an InterruptDispatcher (see
+    attach). The callbacks of the due wakeups are run and the next one is programmed: with a dispatcher clearing the
+    flags, re-arming the timer costs five transfers in the default configuration (three writes and the two reads of
+    their read-modify-write), only two or three writes with the register cache enabled (register_cache=True). A
+    wakeup runs within its precision, possibly early.
+
+    The deadlines refer to clock (time.monotonic by default, VirtualClock.monotonic with the simulator).
+
+    Example:
+        scheduler = WakeupScheduler(rtc)
+        scheduler.attach(dispatcher)
+        scheduler.schedule(90, lambda: print("90 seconds"), precision=1)
+        scheduler.schedule(0.5, lambda: print("half a second"), precision=0.02)
+    """
+
+    def __init__(self, rtc: RV_3028, precision: float = 1.0, clock=time.monotonic):
+        """
+        :param rtc: the device. The scheduler owns its countdown timer and its alarm.
+        :param precision: the default maximum error of the wakeups (seconds)
+        :param clock: the clock of the deadlines (seconds)
+        """
+        self.rtc = rtc
+        self.precision = precision
+        self.clock = clock
+        self._heap = []
+        self._sequence = itertools.count()
+        self._lock = threading.RLock()
+        self._dispatcher = None
+
+        self.armed = None
+        '''what is programmed into the device: ('timer', TD value, ticks, final), ('alarm', datetime) or None'''
+        self.armed_deadline = None
+        '''the deadline the device has been programmed for'''
+        self.interrupts = 0
+        '''the amount of interrupts handled'''
+
+    def __len__(self) -> int:
+        return sum(1 for _, _, wakeup in self._heap if not wakeup.cancelled)
+
+    def schedule(self, delay: float, callback, precision: float = None) -> Wakeup:
+        """
+        :param delay: the time to the wakeup (seconds)
+        :param callback: the function called (without arguments) at the wakeup
+        :param precision: the maximum error of the wakeup (seconds), defaults to the precision of the scheduler
+        :return: the wakeup
+        """
+        return self.schedule_at(self.clock() + delay, callback, precision)
+
+    def schedule_at(self, deadline: float, callback, precision: float = None) -> Wakeup:
+        """
+        :param deadline: the time of the wakeup according to clock (seconds)
+        :param callback: the function called (without arguments) at the wakeup
+        :param precision: the maximum error of the wakeup (seconds), defaults to the precision of the scheduler
+        :return: the wakeup
+        """
+        wakeup = Wakeup(deadline, self.precision if precision is None else precision, callback)
+        with self._lock:
+            heapq.heappush(self._heap, (deadline, next(self._sequence), wakeup))
+            rearm = self.armed_deadline is None or deadline < self.armed_deadline
+        if rearm:
+            self.run_pending()
+        return wakeup
+
+    def cancel(self, wakeup: Wakeup) -> None:
+        with self._lock:
+            wakeup.cancelled = True
+            rearm = wakeup.deadline == self.armed_deadline
+        if rearm:
+            self.run_pending()
+
+    @property
+    def next_deadline(self) -> float:
+        """
+        the deadline of the nearest wakeup, None if there are no wakeups
+        """
+        with self._lock:
+            self._drop_cancelled()
+            return self._heap[0][0] if self._heap else None
+
+    def _drop_cancelled(self) -> None:
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+
+    def on_interrupt(self, source: int = None) -> None:
+        """
+        Called on every interrupt of the countdown timer or of the alarm.
+        """
+        self.interrupts += 1
+        self.run_pending()
+
+    def run_pending(self) -> int:
+        """
+        Runs the callbacks of the due wakeups and programs the device for the next one.
+
+        :return: the amount of callbacks run
+        """
+        with self._lock:
+            now = self.clock()
+            due = []
+            self._drop_cancelled()
+            while self._heap and self._heap[0][0] <= now + self._heap[0][2].precision:
+                wakeup = heapq.heappop(self._heap)[2]
+                if not wakeup.cancelled:
+                    due.append(wakeup)
+                self._drop_cancelled()
+            self._arm(now)
+
+        for wakeup in due:
+            try:
+                wakeup.callback()
+            except Exception:
+                logger.exception("wakeup callback %r failed", wakeup.callback)
+        return len(due)
+
+    def _arm(self, now: float) -> None:
+        if not self._heap:
+            self._disarm()
+            return
+        deadline, _, first = self._heap[0]
+        # the device must not wake up later than any wakeup allows
+        latest = min(wakeup.deadline + wakeup.precision for _, _, wakeup in self._heap if not wakeup.cancelled)
+        precision = max(0.0, min(first.precision, latest - deadline))
+        delay = deadline - now
+        plan = plan_timer(delay, precision)
+        if plan is not None:
+            self._arm_timer(*plan)
+        else:
+            self._arm_alarm(min(delay, MAX_ALARM_HORIZON) - ALARM_MARGIN)
+        self.armed_deadline = deadline
+
+    def _arm_timer(self, frequency: int, ticks: int, final: bool) -> None:
+        fields = {'TIMER_VALUE': ticks, 'TD': frequency, 'TRPT': 0, 'TIE': 1, 'TE': 1}
+        if self.armed is not None and self.armed[0] == 'alarm':
+            fields['AIE'] = 0
+        if self._dispatcher is None:
+            # without a dispatcher nobody else clears the flag
+            fields['TF'] = 0
+        with self.rtc.locked():
+            if self.armed is None or self.armed[0] == 'timer':
+                # the countdown restarts only when TE goes from 0 to 1; TE is already 0 after the alarm, unknown
+                # before the first wakeup
+                self.rtc.set_fields(TE=0)
+            self.rtc.set_fields(**fields)
+        self.armed = ('timer', frequency, ticks, final)
+        logger.debug("timer armed: %d ticks of clock %d", ticks, frequency)
+
+    def _arm_alarm(self, delay: float) -> None:
+        alarm = datetime.datetime(*self.rtc.get_datetime_tuple()[:6]) + datetime.timedelta(seconds=delay)
+        alarm = alarm.replace(second=0)
+        fields = {'AE_M': 0, 'MINUTES_ALARM': alarm.minute, 'AE_H': 0, 'AE_WD': 0, 'WEEKDAY_DATE_ALARM': alarm.day,
+                  'WADA': 1, 'AIE': 1}
+        if self.rtc.is_using_12h_mode():
+            fields.update(HOURS_12_ALARM=alarm.hour % 12 or 12, PM_ALARM=int(alarm.hour >= 12))
+        else:
+            fields['HOURS_ALARM'] = alarm.hour
+        if self.armed is not None and self.armed[0] == 'timer':
+            fields.update(TE=0, TIE=0)
+        if self._dispatcher is None:
+            fields['AF'] = 0
+        self.rtc.set_fields(**fields)
+        self.armed = ('alarm', alarm)
+        logger.debug("alarm armed: %s", alarm)
+
+    def _disarm(self) -> None:
+        if self.armed is not None:
+            if self.armed[0] == 'timer':
+                self.rtc.set_fields(TE=0, TIE=0)
+            else:
+                self.rtc.set_fields(AIE=0)
+        self.armed = self.armed_deadline = None
+
+    # interrupts
+
+    def attach(self, dispatcher: InterruptDispatcher) -> None:
+        """
+        Calls on_interrupt on every timer and alarm interrupt handled by dispatcher.
+
+        :param dispatcher: the interrupt dispatcher of the device
+        """
+        self.detach()
+        self._dispatcher = dispatcher
+        dispatcher.add_handler(InterruptDispatcher.TIMER, self.on_interrupt)
+        dispatcher.add_handler(InterruptDispatcher.ALARM, self.on_interrupt)
+
+    def detach(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.remove_handler(InterruptDispatcher.TIMER, self.on_interrupt)
+            self._dispatcher.remove_handler(InterruptDispatcher.ALARM, self.on_interrupt)
+            self._dispatcher = None
@@ -0,0 +1,534 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import calendar
+import datetime
+import errno
+from collections import namedtuple
+
+from melopero_RV_3028.RV_3028 import RV_3028
+
+Transaction = namedtuple('Transaction', ['time', 'operation', 'register', 'data', 'parts'], defaults=((),))
+'''A bus transaction recorded by the simulator: the virtual time, the SMBus method, the register and the bytes.
+For a combined transfer parts are the kinds ('read' or 'write') of its operations.'''
+
+# bytes on the wire (address and register bytes included) for each SMBus operation, excluding the data bytes
+_OVERHEAD_BYTES = {
+    'read_byte_data': 3,
+    'write_byte_data': 2,
+    'read_i2c_block_data': 3,
+    'write_i2c_block_data': 2,
+}
+
+
+def transaction_bytes(operation: str, length: int, parts: tuple = ()) -> int:
+    """
+    :param operation: the name of the SMBus method
+    :param length: the amount of data bytes
+    :param parts: the kinds of the operations of a combined transfer
+    :return: the amount of bytes on the wire (address bytes, register byte and data)
+    """
+    if parts:
+        return sum(_OVERHEAD_BYTES['read_i2c_block_data' if kind == 'read' else 'write_i2c_block_data']
+                   for kind in parts) + length
+    return _OVERHEAD_BYTES[operation] + length
+
+
+def transaction_duration(operation: str, length: int, bus_frequency: int, parts: tuple = ()) -> float:
+    """
+    :param operation: the name of the SMBus method
+    :param length: the amount of data bytes
+    :param bus_frequency: the SCL frequency (Hz)
+    :param parts: the kinds of the operations of a combined transfer
+    :return: the time the transaction occupies the bus (seconds). Every byte takes 9 clock cycles, plus start,
+        repeated start and stop conditions.
+    """
+    if parts:
+        # a start, a repeated start before every other message, a stop
+        conditions = sum(2 if kind == 'read' else 1 for kind in parts) + 1
+    else:
+        conditions = 3 if operation.startswith('read') else 2
+    return (transaction_bytes(operation, length, parts) * 9 + conditions) / bus_frequency
+
+
+class VirtualClock():
+    """
+    A monotonic clock that only moves when advance() (or sleep()) is called. Compatible with the functions of
+    the time module, so it can be injected wherever the driver takes a clock or a sleep function.
+    """
+
+    def __init__(self, start: float = 0.0):
+        self._now = start
+        self._listeners = []
+
+    def add_listener(self, listener) -> None:
+        """
+        :param listener: a function called with no arguments every time the clock moves
+        """
+        self._listeners.append(listener)
+
+    def monotonic(self) -> float:
+        return self._now
+
+    def monotonic_ns(self) -> int:
+        return int(self._now * 1000000000)
+
+    def perf_counter(self) -> float:
+        return self._now
+
+    def advance(self, seconds: float) -> None:
+        if seconds < 0:
+            raise ValueError("the clock can't go back")
+        self._now += seconds
+        for listener in self._listeners:
+            listener()
+
+    def sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            self.advance(seconds)
+
+
+class RV_3028_Simulator():
+    """
+    In-memory model of an RV-3028 with the SMBus interface, to be used as the bus of an RV_3028:
+
+        sim = RV_3028_Simulator()
+        rtc = RV_3028(bus=sim)
+        sim.clock.advance(5)
+
+    The model runs on a VirtualClock and covers the time and date registers (24h and 12h mode), the alarm,
+    the countdown timer with its four frequencies, the periodic time update, the STATUS flags and the INT pin,
+    the UNIX time counter, the event timestamp, the user RAM and the user and configuration EEPROM with its
+    command register and EEBusy timing. Every transaction is recorded in transactions.
+
+    The flags are set once per advance: advance the clock in steps shorter than the interrupt periods to see
+    every interrupt.
+    """
+
+    TIMER_PERIODS = {
+        RV_3028.TIMER_FREQ_4096Hz: 1 / 4096,
+        RV_3028.TIMER_FREQ_64Hz: 1 / 64,
+        RV_3028.TIMER_FREQ_1Hz: 1,
+        RV_3028.TIMER_FREQ_1_60Hz: 60,
+    }
+
+    # configuration eeprom content at delivery (CLKOUT, offset, backup)
+    DEFAULT_CONFIGURATION = {0x35: 0xC0, 0x36: 0x00, 0x37: 0x10}
+
+    ID = 0x30
+
+    # duration of the eeprom commands
+    EEPROM_READ_TIME = 0.0005
+    EEPROM_WRITE_TIME = 0.010
+    EEPROM_UPDATE_TIME = 0.063
+
+    # frequency correction of one step of the EEOffset value
+    OFFSET_STEP_PPM = 0.9537
+
+    def __init__(self, clock: VirtualClock = None, start: datetime.datetime = datetime.datetime(2000, 1, 1),
+                 address: int = RV_3028.RV_3028_ADDRESS, bus_frequency: int = None, record: bool = True,
+                 frequency_error: float = 0.0, combined_transfers: bool = False):
+        """
+        :param clock: the virtual clock, a new one is created if None
+        :param start: the date and time of the device at power on
+        :param address: the i2c address the simulator answers to
+        :param bus_frequency: if not None every transaction advances the clock by its duration on a bus clocked at
+            bus_frequency Hz
+        :param record: if True every transaction is appended to transactions
+        :param frequency_error: the error of the crystal (ppm, positive if the device runs faster than the clock).
+            The EEOffset correction of the configuration registers is subtracted from it.
+        :param combined_transfers: if True the simulator offers combined_transfer, like transport.I2CRdwrTransport
+        """
+        self.clock = clock if clock is not None else VirtualClock()
+        self.address = address
+        self.bus_frequency = bus_frequency
+        self.record = record
+        self.frequency_error = frequency_error
+        self.supports_combined_transfers = combined_transfers
+        self.transactions = []
+        self.interrupt_listeners = []
+        '''functions called with the virtual time (ns) on each falling edge of the INT pin'''
+        self.int_asserted = False
+
+        self._ram = bytearray(0x40)
+        self._ram[0x28] = RV_3028_Simulator.ID
+        # alarms disabled
+        self._ram[0x07:0x0A] = b'\x80\x80\x80'
+        self._eeprom = bytearray(0x38)
+        for address, value in RV_3028_Simulator.DEFAULT_CONFIGURATION.items():
+            self._eeprom[address] = value
+        self._ram[0x30:0x38] = self._eeprom[0x30:0x38]
+        # power on reset flag
+        self._status = 0x01
+        self._eeprom_busy_until = 0.0
+
+        self._time = [start.second, start.minute, start.hour, start.weekday(), start.day, start.month,
+                      start.year % 100]
+        self._unix = 0
+        self._second_start = self.clock.monotonic()
+
+        self._timer_running = False
+        self._timer_remaining = 0
+        self._timer_reference = 0.0
+
+        self._edge_pending = False
+        self._delivering = False
+        self.clock.add_listener(self._on_clock_advance)
+
+    # SMBus interface
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        pass
+
+    def read_byte_data(self, i2c_addr: int, register: int) -> int:
+        return self._transaction('read_byte_data', i2c_addr, register, 1)[0]
+
+    def write_byte_data(self, i2c_addr: int, register: int, value: int) -> None:
+        self._transaction('write_byte_data', i2c_addr, register, [value])
+
+    def read_i2c_block_data(self, i2c_addr: int, register: int, length: int) -> list:
+        return self._transaction('read_i2c_block_data', i2c_addr, register, length)
+
+    def write_i2c_block_data(self, i2c_addr: int, register: int, data: list) -> None:
+        self._transaction('write_i2c_block_data', i2c_addr, register, list(data))
+
+    def combined_transfer(self, i2c_addr: int, operations: list) -> list:
+        """
+        Runs ('read', register, length) and ('write', register, values) operations in a single transaction, see
+        transport.I2CRdwrTransport.combined_transfer.
+        """
+        if not self.supports_combined_transfers:
+            raise OSError(errno.EOPNOTSUPP, "combined transfers not enabled")
+        if i2c_addr != self.address:
+            raise OSError(errno.EREMOTEIO, "no device at address 0x{:02X}".format(i2c_addr))
+        parts = tuple(kind for kind, _, _ in operations)
+        length = sum(payload if kind == 'read' else len(payload) for kind, _, payload in operations)
+        if self.bus_frequency:
+            delivering, self._delivering = self._delivering, True
+            self.clock.sleep(transaction_duration('combined_transfer', length, self.bus_frequency, parts))
+            self._delivering = delivering
+        self._update()
+
+        results = []
+        data = []
+        for kind, register, payload in operations:
+            if kind == 'read':
+                values = [self._read(reg) for reg in range(register, register + payload)]
+                results.append(values)
+            else:
+                values = [value & 0xFF for value in payload]
+                for reg, value in enumerate(values, register):
+                    self._write(reg, value)
+                self._update_interrupt_pin()
+                results.append(None)
+            data += values
+
+        if self.record:
+            self.transactions.append(Transaction(self.clock.monotonic(), 'combined_transfer', operations[0][1],
+                                                 bytes(data), parts))
+        self._deliver_edges()
+        return results
+
+    def _transaction(self, operation: str, i2c_addr: int, register: int, data):
+        if i2c_addr != self.address:
+            raise OSError(errno.EREMOTEIO, "no device at address 0x{:02X}".format(i2c_addr))
+        length = data if isinstance(data, int) else len(data)
+        if self.bus_frequency:
+            # the interrupt listeners must not run in the middle of the transaction
+            delivering, self._delivering = self._delivering, True
+            self.clock.sleep(transaction_duration(operation, length, self.bus_frequency))
+            self._delivering = delivering
+        self._update()
+
+        if isinstance(data, int):
+            data = [self._read(reg) for reg in range(register, register + length)]
+        else:
+            for reg, value in enumerate(data, register):
+                self._write(reg, value & 0xFF)
+            self._update_interrupt_pin()
+
+        if self.record:
+            self.transactions.append(Transaction(self.clock.monotonic(), operation, register, bytes(data)))
+        self._deliver_edges()
+        return data
+
+    # test helpers
+
+    def reset_transactions(self) -> None:
+        self.transactions.clear()
+
+    def get_datetime(self) -> datetime.datetime:
+        """
+        :return: the date and time of the device (not recorded as a transaction)
+        """
+        self._update()
+        return self._as_datetime()
+
+    @property
+    def eeprom(self) -> bytearray:
+        """the content of the eeprom (user eeprom 0x00 - 0x2A, configuration eeprom 0x30 - 0x37)"""
+        return self._eeprom
+
+    def trigger_event(self) -> None:
+        """
+        Simulates an external event on the EVI pin: if the time stamp function is enabled (TSE) the event
+        counter is incremented and the time stamp registers are updated (first event or, with TSOW, last event).
+        The EVF flag is set.
+        """
+        self._update()
+        if self._ram[RV_3028.CONTROL2_REGISTER_ADDRESS] & 0x80:
+            count = self._ram[0x14]
+            if count < 0xFF:
+                self._ram[0x14] = count + 1
+            if count == 0 or self._ram[0x13] & 0x02:
+                seconds, minutes, hours, _, date, month, year = self._time
+                self._ram[0x15:0x1B] = bytes((_dec_to_bcd(seconds), _dec_to_bcd(minutes), self._hours_register(hours),
+                                              _dec_to_bcd(date), _dec_to_bcd(month), _dec_to_bcd(year)))
+        self._status |= 0x02
+        self._update_interrupt_pin()
+        self._deliver_edges()
+
+    def raise_flags(self, flags: int) -> None:
+        """
+        Raises STATUS flags as if their events had happened (e.g. 0x08, the TF flag), asserting the INT pin if their
+        interrupt is enabled. The event counter and the time stamp registers are not changed, see trigger_event.
+
+        :param flags: the mask of the flags to raise (bits 0 - 6 of the STATUS register)
+        """
+        self._update()
+        self._status |= flags & 0x7F
+        self._update_interrupt_pin()
+        self._deliver_edges()
+
+    # registers
+
+    def _read(self, register: int) -> int:
+        if register <= RV_3028.YEAR_REGISTER_ADDRESS:
+            value = self._time[register]
+            if register == RV_3028.HOURS_REGISTER_ADDRESS:
+                return self._hours_register(value)
+            return _dec_to_bcd(value)
+        if register == RV_3028.STATUS_REGISTER_ADDRESS:
+            busy = 0x80 if self.clock.monotonic() < self._eeprom_busy_until else 0
+            return self._status | busy
+        if register in (RV_3028.TIMER_STATUS_0_ADDRESS, RV_3028.TIMER_STATUS_1_ADDRESS):
+            return (self._timer_remaining >> (8 * (register - RV_3028.TIMER_STATUS_0_ADDRESS))) & 0xFF
+        if RV_3028.UNIX_TIME_ADDRESS <= register < RV_3028.UNIX_TIME_ADDRESS + 4:
+            return (self._unix >> (8 * (register - RV_3028.UNIX_TIME_ADDRESS))) & 0xFF
+        if register < len(self._ram):
+            return self._ram[register]
+        return 0
+
+    def _write(self, register: int, value: int) -> None:
+        now = self.clock.monotonic()
+        if register <= RV_3028.YEAR_REGISTER_ADDRESS:
+            if register == RV_3028.HOURS_REGISTER_ADDRESS:
+                if self._ram[RV_3028.CONTROL2_REGISTER_ADDRESS] & 0x02:
+                    value = _bcd_to_dec(value & 0x1F) % 12 + (12 if value & 0x20 else 0)
+                else:
+                    value = _bcd_to_dec(value & 0x3F)
+            else:
+                value = _bcd_to_dec(value)
+            self._time[register] = value
+            if register == RV_3028.SECONDS_REGISTER_ADDRESS:
+                # writing the seconds resets the prescaler
+                self._second_start = now
+        elif register == RV_3028.STATUS_REGISTER_ADDRESS:
+            # flags can only be cleared, EEBusy is read only
+            self._status &= value | 0x80
+        elif RV_3028.UNIX_TIME_ADDRESS <= register < RV_3028.UNIX_TIME_ADDRESS + 4:
+            shift = 8 * (register - RV_3028.UNIX_TIME_ADDRESS)
+            self._unix = self._unix & ~(0xFF << shift) | value << shift
+        elif register in (RV_3028.TIMER_STATUS_0_ADDRESS, RV_3028.TIMER_STATUS_1_ADDRESS, 0x14, 0x15, 0x16,
+                          0x17, 0x18, 0x19, 0x1A, 0x28):
+            # read only
+            pass
+        elif register == RV_3028.CONTROL1_REGISTER_ADDRESS:
+            old = self._ram[register]
+            self._ram[register] = value
+            if value & 0x04 and not old & 0x04:
+                self._start_timer(now)
+            elif not value & 0x04:
+                self._timer_running = False
+        elif register == RV_3028.CONTROL2_REGISTER_ADDRESS:
+            if value & 0x01:
+                # RESET: prescaler reset, the bit clears itself
+                self._second_start = now
+            self._ram[register] = value & 0xFE
+        elif register == 0x13:
+            if value & 0x04:
+                # TSR: reset the time stamp registers, the bit clears itself
+                self._ram[0x14:0x1B] = bytes(7)
+            self._ram[register] = value & 0xFB
+        elif register == RV_3028.EEPROM_COMMAND_ADDRESS:
+            self._ram[register] = value
+            self._eeprom_command(value, now)
+        elif register < len(self._ram):
+            self._ram[register] = value
+
+    def _hours_register(self, hours: int) -> int:
+        if self._ram[RV_3028.CONTROL2_REGISTER_ADDRESS] & 0x02:
+            return _dec_to_bcd(hours % 12 or 12) | (0x20 if hours >= 12 else 0)
+        return _dec_to_bcd(hours)
+
+    def _eeprom_command(self, command: int, now: float) -> None:
+        if now < self._eeprom_busy_until:
+            # the device ignores commands while busy
+            return
+        address = self._ram[RV_3028.EEPROM_ADDRESS_ADDRESS]
+        if command == 0x21:
+            if address < len(self._eeprom):
+                self._eeprom[address] = self._ram[RV_3028.EEPROM_DATA_ADDRESS]
+            self._eeprom_busy_until = now + RV_3028_Simulator.EEPROM_WRITE_TIME
+        elif command == 0x22:
+            self._ram[RV_3028.EEPROM_DATA_ADDRESS] = self._eeprom[address] if address < len(self._eeprom) else 0
+            self._eeprom_busy_until = now + RV_3028_Simulator.EEPROM_READ_TIME
+        elif command == 0x11:
+            # update: configuration ram -> eeprom
+            self._eeprom[0x30:0x38] = self._ram[0x30:0x38]
+            self._eeprom_busy_until = now + RV_3028_Simulator.EEPROM_UPDATE_TIME
+        elif command == 0x12:
+            # refresh: eeprom -> configuration ram
+            self._ram[0x30:0x38] = self._eeprom[0x30:0x38]
+            self._eeprom_busy_until = now + RV_3028_Simulator.EEPROM_READ_TIME
+
+    # time keeping
+
+    def _on_clock_advance(self) -> None:
+        self._update()
+        self._deliver_edges()
+
+    def _update(self) -> None:
+        now = self.clock.monotonic()
+        rate = self._rate()
+        elapsed = int((now - self._second_start) * rate)
+        if elapsed > 0:
+            self._second_start += elapsed / rate
+            self._advance_seconds(elapsed)
+        if self._timer_running:
+            self._update_timer(now)
+        self._update_interrupt_pin()
+
+    def _rate(self) -> float:
+        """
+        :return: the seconds counted by the device per second of the clock
+        """
+        offset = self._ram[0x36] << 1 | self._ram[0x37] >> 7
+        if offset & 0x100:
+            offset -= 0x200
+        return 1 + (self.frequency_error - offset * RV_3028_Simulator.OFFSET_STEP_PPM) * 1e-6
+
+    def _as_datetime(self) -> datetime.datetime:
+        seconds, minutes, hours, _, date, month, year = self._time
+        year += 2000
+        month = min(max(month, 1), 12)
+        date = min(max(date, 1), calendar.monthrange(year, month)[1])
+        return datetime.datetime(year, month, date, min(hours, 23), min(minutes, 59), min(seconds, 59))
+
+    def _advance_seconds(self, elapsed: int) -> None:
+        old = self._as_datetime()
+        new = old + datetime.timedelta(seconds=elapsed)
+        if new.year > 2099:
+            new = new.replace(year=new.year - 100)
+        weekday = (self._time[3] + (new.date() - old.date()).days) % 7
+        self._time = [new.second, new.minute, new.hour, weekday, new.day, new.month, new.year % 100]
+        self._unix = (self._unix + elapsed) & 0xFFFFFFFF
+
+        minutes_crossed = (old.second + elapsed) // 60
+        # periodic time update: every second or, with USEL, every minute
+        if not self._ram[RV_3028.CONTROL1_REGISTER_ADDRESS] & 0x10 or minutes_crossed:
+            self._status |= 0x10
+        if minutes_crossed and self._alarm_enabled():
+            minute = old.replace(second=0) + datetime.timedelta(minutes=1)
+            while minute <= new:
+                if self._alarm_matches(minute, (self._time[3] - (new.date() - minute.date()).days) % 7):
+                    self._status |= 0x04
+                    break
+                minute += datetime.timedelta(minutes=1)
+
+    def _alarm_enabled(self) -> bool:
+        return any(not self._ram[register] & 0x80 for register in (0x07, 0x08, 0x09))
+
+    def _alarm_matches(self, moment: datetime.datetime, weekday: int) -> bool:
+        minute_alarm, hour_alarm, day_alarm = self._ram[0x07:0x0A]
+        if not minute_alarm & 0x80 and _bcd_to_dec(minute_alarm & 0x7F) != moment.minute:
+            return False
+        if not hour_alarm & 0x80:
+            if self._ram[RV_3028.CONTROL2_REGISTER_ADDRESS] & 0x02:
+                hour = _bcd_to_dec(hour_alarm & 0x1F) % 12 + (12 if hour_alarm & 0x20 else 0)
+            else:
+                hour = _bcd_to_dec(hour_alarm & 0x3F)
+            if hour != moment.hour:
+                return False
+        if not day_alarm & 0x80:
+            # WADA selects the date alarm
+            day = moment.day if self._ram[RV_3028.CONTROL1_REGISTER_ADDRESS] & 0x20 else weekday
+            if _bcd_to_dec(day_alarm & 0x3F) != day:
+                return False
+        return True
+
+    def _start_timer(self, now: float) -> None:
+        value = (self._ram[RV_3028.TIMER_VALUE_1_ADDRESS] & 0x0F) << 8 | self._ram[RV_3028.TIMER_VALUE_0_ADDRESS]
+        self._timer_remaining = value
+        self._timer_reference = now
+        self._timer_running = value > 0
+
+    def _update_timer(self, now: float) -> None:
+        control1 = self._ram[RV_3028.CONTROL1_REGISTER_ADDRESS]
+        period = RV_3028_Simulator.TIMER_PERIODS[control1 & 0x03]
+        ticks = int((now - self._timer_reference) / period)
+        if ticks <= 0:
+            return
+        self._timer_reference += ticks * period
+        if ticks < self._timer_remaining:
+            self._timer_remaining -= ticks
+            return
+
+        self._status |= 0x08
+        reload = (self._ram[RV_3028.TIMER_VALUE_1_ADDRESS] & 0x0F) << 8 | self._ram[RV_3028.TIMER_VALUE_0_ADDRESS]
+        if control1 & 0x80 and reload:
+            self._timer_remaining = reload - (ticks - self._timer_remaining) % reload
+        else:
+            self._timer_remaining = 0
+            self._timer_running = False
+
+    # interrupt pin
+
+    def _update_interrupt_pin(self) -> None:
+        control2 = self._ram[RV_3028.CONTROL2_REGISTER_ADDRESS]
+        status = self._status
+        asserted = bool(status & 0x08 and control2 & 0x10 or status & 0x04 and control2 & 0x08 or
+                        status & 0x10 and control2 & 0x20 or status & 0x02 and control2 & 0x04)
+        if asserted and not self.int_asserted:
+            self._edge_pending = True
+        self.int_asserted = asserted
+
+    def _deliver_edges(self) -> None:
+        # listeners are called outside of the transactions, they can access the device
+        if self._delivering:
+            return
+        self._delivering = True
+        try:
+            while self._edge_pending:
+                self._edge_pending = False
+                for listener in list(self.interrupt_listeners):
+                    listener(self.clock.monotonic_ns())
+        finally:
+            self._delivering = False
+
+
+def _bcd_to_dec(bcd: int) -> int:
+    return (bcd // 0x10 * 10) + (bcd % 0x10)
+
+
+def _dec_to_bcd(dec: int) -> int:
+    return ((dec // 10) << 4) ^ (dec % 10)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import datetime
+import logging
+import threading
+import time
+
+from melopero_RV_3028.RV_3028 import RV_3028
+from melopero_RV_3028.interrupts import InterruptDispatcher
+
+logger = logging.getLogger(__name__)
+
+
+def read_second_edge(rtc: RV_3028, poll_interval: float = 0.005, clock=time.monotonic_ns, sleep=time.sleep,
+                     timeout: float = 1.5) -> tuple:
+    """
+    Finds the start of a second of the RTC (see RV_3028.read_unix_time_edge) and reads the time once after it.
+    The edge is located within poll_interval plus the duration of a read.
+
+    :param rtc: the device
+    :param poll_interval: the interval between two reads (seconds)
+    :param clock: the monotonic clock (nanoseconds)
+    :param sleep: the function used to sleep between the reads
+    :param timeout: the maximum duration of the polling (seconds). A TimeoutError is raised if the time doesn't
+        change, e.g. if the oscillator is stopped.
+    :return: the time of the RTC at the edge (datetime.datetime) and the monotonic time of the edge
+    """
+    edge_ns = rtc.read_unix_time_edge(poll_interval, clock, sleep, timeout)[1]
+    return datetime.datetime(*rtc.get_datetime_tuple()[:6]), edge_ns
+
+
+class SoftwareClock():
+    """
+    A clock that reads the RTC once and then extrapolates its time with a monotonic clock, so that now() doesn't
+    access the bus. The RTC is read again every resync_interval seconds (started by the first call of now() after
+    the interval) or on every periodic time update interrupt if the clock is attached to an InterruptDispatcher.
+    At each aligned resync the offset between the extrapolated time and the RTC is measured.
+
+    now() is lock-free: the anchor (RTC time, monotonic time) is published with a single reference swap, so
+    concurrent readers always see a consistent pair without taking a lock. With align=True the polling for the start
+    of a second runs on a background thread, started by the first reader that takes the spawn lock (without
+    blocking), and now() keeps returning the extrapolated time meanwhile. After a failed resync the next one is
+    attempted retry_backoff seconds later. now() only reads the RTC itself (a single block read) when there is no
+    anchor yet or when it is older than max_staleness.
+
+    Example:
+        clock = SoftwareClock(rtc, resync_interval=60)
+        stamp = clock.now()
+    """
+
+    def __init__(self, rtc: RV_3028, resync_interval: float = 60.0, max_staleness: float = None, align: bool = True,
+                 poll_interval: float = 0.005, on_resync=None, clock=time.monotonic_ns, sleep=time.sleep,
+                 retry_backoff: float = 5.0):
+        """
+        :param rtc: the device
+        :param resync_interval: the age (seconds) after which now() reads the RTC again, None to resync only
+            on the periodic time update interrupts
+        :param max_staleness: the maximum age (seconds) of the anchor. While the RTC is being read again now()
+            returns the extrapolated time, unless the anchor is older than max_staleness, then it reads the RTC
+            once. None for no bound.
+        :param align: if True the polling resyncs wait (on a background thread) for the seconds register to
+            change, so the anchor is taken at the start of a second (within poll_interval). If False the RTC is
+            read once and the extrapolated time can be up to one second behind.
+        :param poll_interval: the interval between two reads of the RTC while waiting for the next second
+        :param on_resync: a function called with (offset, drift_ppm) after every resync, see offset and drift_ppm
+        :param clock: the monotonic clock (nanoseconds)
+        :param sleep: the function used to sleep between the polls
+        :param retry_backoff: the time (seconds) waited after a failed resync before now() starts the next one
+        """
+        self.rtc = rtc
+        self.resync_interval = resync_interval
+        self.max_staleness = max_staleness
+        self.align = align
+        self.poll_interval = poll_interval
+        self.on_resync = on_resync
+        self.clock = clock
+        self.sleep = sleep
+        self.retry_backoff = retry_backoff
+        self._anchor = None
+        # the last aligned anchor, the reference of the offset measurements
+        self._reference = None
+        self._resync_lock = threading.Lock()
+        # held while a background resync runs: taken without blocking by the reader starting it, released by the
+        # background thread
+        self._spawn_lock = threading.Lock()
+        # the monotonic time before which now() doesn't start a resync, after a failed one
+        self._retry_ns = 0
+        self._dispatcher = None
+
+        self.resyncs = 0
+        '''the amount of times the RTC has been read'''
+        self.offset = None
+        '''RTC time - extrapolated time at the last resync (seconds), positive if the RTC runs faster'''
+        self.drift_ppm = None
+        '''offset divided by the time elapsed since the previous resync (parts per million)'''
+
+    @property
+    def age(self) -> float:
+        """
+        the time elapsed since the last resync (seconds), None if the RTC has never been read
+        """
+        anchor = self._anchor
+        return None if anchor is None else (self.clock() - anchor[1]) / 1e9
+
+    def now(self) -> datetime.datetime:
+        """
+        :return: the current time of the RTC extrapolated with the monotonic clock
+        """
+        anchor = self._anchor
+        now_ns = self.clock()
+        if anchor is None or (self.resync_interval is not None and
+                              now_ns - anchor[1] >= self.resync_interval * 1e9):
+            anchor = self._resync_if_stale(anchor, now_ns)
+            now_ns = self.clock()
+        return anchor[0] + datetime.timedelta(microseconds=(now_ns - anchor[1]) // 1000)
+
+    def _resync_if_stale(self, anchor: tuple, now_ns: int) -> tuple:
+        must_wait = anchor is None or (self.max_staleness is not None and
+                                       now_ns - anchor[1] >= self.max_staleness * 1e9)
+        if not must_wait and now_ns < self._retry_ns:
+            # backing off after a failed resync
+            return anchor
+        if self.align and self._spawn_lock.acquire(blocking=False):
+            try:
+                threading.Thread(target=self._background_resync, name='rv3028-clock-resync', daemon=True).start()
+            except BaseException:
+                self._spawn_lock.release()
+                raise
+        if self.align and not must_wait:
+            return anchor
+        if not self._resync_lock.acquire(blocking=must_wait):
+            # another thread is reading the RTC
+            return anchor
+        try:
+            if self._anchor is not anchor:
+                # resynced by another thread while waiting
+                return self._anchor
+            try:
+                rtc_time, monotonic_ns = self._read_rtc(align=False)
+            except OSError as error:
+                if must_wait:
+                    raise
+                self._resync_failed(error)
+                return anchor
+            # a single read: with align the background resync aligns the anchor
+            return self._set_anchor(rtc_time, monotonic_ns, measure=not self.align)
+        finally:
+            self._resync_lock.release()
+
+    def _background_resync(self) -> None:
+        try:
+            self.resync()
+        except OSError as error:
+            self._resync_failed(error)
+        finally:
+            self._spawn_lock.release()
+
+    def _resync_failed(self, error: OSError) -> None:
+        self._retry_ns = self.clock() + int(self.retry_backoff * 1e9)
+        logger.warning("software clock resync failed, next attempt in %s s: %s", self.retry_backoff, error)
+
+    def resync(self) -> datetime.datetime:
+        """
+        Reads the RTC now (waiting for the start of a second if align is True).
+
+        :return: the time read from the RTC
+        """
+        rtc_time, monotonic_ns = self._read_rtc(self.align)
+        with self._resync_lock:
+            return self._set_anchor(rtc_time, monotonic_ns)[0]
+
+    def _read_rtc(self, align: bool) -> tuple:
+        """
+        :param align: if True waits for the start of a second
+        :return: the time of the RTC and the monotonic time it refers to
+        """
+        if align:
+            return read_second_edge(self.rtc, self.poll_interval, self.clock, self.sleep)
+        before = self.clock()
+        rtc_time = datetime.datetime(*self.rtc.get_datetime_tuple()[:6])
+        return rtc_time, (before + self.clock()) // 2
+
+    def _set_anchor(self, rtc_time: datetime.datetime, monotonic_ns: int, measure: bool = True) -> tuple:
+        """
+        :param measure: if True the offset is measured against the previous measured anchor and the anchor becomes
+            the reference of the next measurement (only for the aligned anchors)
+        """
+        anchor = (rtc_time, monotonic_ns)
+        self._anchor = anchor
+        self.resyncs += 1
+        if not measure:
+            return anchor
+        previous, self._reference = self._reference, anchor
+        if previous is not None and monotonic_ns > previous[1]:
+            elapsed_ns = monotonic_ns - previous[1]
+            extrapolated = previous[0] + datetime.timedelta(microseconds=elapsed_ns // 1000)
+            self.offset = (rtc_time - extrapolated).total_seconds()
+            self.drift_ppm = self.offset / (elapsed_ns / 1e9) * 1e6
+            logger.debug("resync: offset %.6f s, drift %.1f ppm", self.offset, self.drift_ppm)
+            if self.on_resync is not None:
+                self.on_resync(self.offset, self.drift_ppm)
+        return anchor
+
+    # periodic time update interrupt
+
+    def attach(self, dispatcher: InterruptDispatcher) -> None:
+        """
+        Resyncs on every periodic time update interrupt handled by dispatcher. The interrupt fires at the start
+        of a second, so the anchor is taken at the time of the edge without polling. The periodic time update
+        interrupt must be enabled (see RV_3028.enable_periodic_time_update_interrupt) and the dispatcher clock
+        must be the clock of this object.
+
+        :param dispatcher: the interrupt dispatcher of the device
+        """
+        self.detach()
+        self._dispatcher = dispatcher
+        dispatcher.add_handler(InterruptDispatcher.PERIODIC_TIME_UPDATE, self._on_time_update)
+
+    def detach(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.remove_handler(InterruptDispatcher.PERIODIC_TIME_UPDATE, self._on_time_update)
+            self._dispatcher = None
+
+    def _on_time_update(self, source: int) -> None:
+        edge_ns = self._dispatcher.last_edge_ns if self._dispatcher is not None else None
+        with self._resync_lock:
+            rtc_time = datetime.datetime(*self.rtc.get_datetime_tuple()[:6])
+            self._set_anchor(rtc_time, edge_ns if edge_ns is not None else self.clock())
@@ -0,0 +1,564 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+
+Host-wide time service: a single owner process reads the RTC and publishes the time in a shared memory segment,
+the other processes read it from there with TimeServiceClient and send the other operations to the owner over a
+Unix socket.
+"""
+
+import datetime
+import inspect
+import json
+import logging
+import mmap
+import os
+import socket
+import socketserver
+import struct
+import tempfile
+import threading
+import time
+
+from melopero_RV_3028.RV_3028 import RV_3028
+from melopero_RV_3028.registers import FIELDS
+from melopero_RV_3028.software_clock import read_second_edge
+from melopero_RV_3028.errors import CircuitOpenError, DeadlineExceededError, WriteVerificationError
+from melopero_RV_3028.wait import EEPROMTimeoutError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RUNTIME_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+# the segment: a sequence number, odd while the owner is writing, followed by the anchor: monotonic time (ns) of
+# the anchor, UNIX Time counter, pid of the owner, year, month, date, hours, minutes, seconds, weekday, 12h mode
+_SEQUENCE = struct.Struct('<Q')
+_ANCHOR = struct.Struct('<qIIHBBBBBBB')
+SEGMENT_SIZE = _SEQUENCE.size + _ANCHOR.size
+
+# attempts of a reader to get a consistent copy of the anchor before giving up
+_MAX_READ_ATTEMPTS = 10000
+
+REMOTE_METHODS = frozenset((
+    'read_register', 'read_registers', 'write_register', 'write_registers', 'get_field', 'get_fields', 'set_fields',
+    'and_or_register', 'sync_register_cache', 'set_12h_format', 'set_time', 'set_date', 'set_datetime',
+    'set_minute_alarm', 'set_hour_alarm_24h_format', 'set_hour_alarm_12h_format', 'set_date_alarm',
+    'set_weekday_alarm', 'enable_alarm', 'set_timer', 'enable_timer', 'get_timer_status', 'set_periodic_time_update',
+    'enable_periodic_time_update_interrupt', 'clear_interrupt_flags', 'set_interrupt_mask',
+    'enable_event_timestamp', 'set_unix_time', 'use_eeprom', 'read_eeprom_register', 'write_eeprom_register',
+    'read_eeprom', 'write_eeprom', 'is_eeprom_busy'))
+'''the methods of RV_3028 that TimeServiceClient runs in the owner process'''
+
+# after these calls the time has changed: the owner reads the RTC again
+_TIME_METHODS = frozenset(('set_12h_format', 'set_time', 'set_date', 'set_datetime', 'set_unix_time'))
+# after these calls the RTC is read again only if they have written the time registers or changed H12
+_REGISTER_METHODS = frozenset(('write_register', 'write_registers', 'set_fields', 'and_or_register'))
+# time and date, UNIX Time counter
+_TIME_REGISTERS = frozenset(list(range(0x00, 0x07)) + list(range(0x1B, 0x1F)))
+
+_REMOTE_ERRORS = {error.__name__: error for error in (
+    ValueError, TypeError, KeyError, IndexError, OSError, TimeoutError, EEPROMTimeoutError, CircuitOpenError,
+    DeadlineExceededError, WriteVerificationError)}
+
+
+def default_paths(i2c_bus: int, i2c_addr: int, runtime_dir: str = DEFAULT_RUNTIME_DIR) -> tuple:
+    """
+    :param i2c_bus: the i2c bus number of the device
+    :param i2c_addr: the i2c address of the device
+    :param runtime_dir: the directory of the segment and of the socket
+    :return: the paths of the shared memory segment and of the Unix socket of the service of the device
+    """
+    name = os.path.join(runtime_dir, 'melopero_RV_3028-{}-0x{:02X}'.format(i2c_bus, i2c_addr))
+    return name + '.time', name + '.sock'
+
+
+def _encode(value):
+    if isinstance(value, datetime.datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, (bytes, bytearray)):
+        return {'__bytes__': bytes(value).hex()}
+    raise TypeError("can't send {!r} to the time service".format(value))
+
+
+def _decode(value: dict):
+    if '__datetime__' in value:
+        return datetime.datetime.fromisoformat(value['__datetime__'])
+    if '__bytes__' in value:
+        return bytes.fromhex(value['__bytes__'])
+    return value
+
+
+def _dumps(message: dict) -> bytes:
+    return json.dumps(message, default=_encode).encode() + b'\n'
+
+
+def _loads(line: bytes) -> dict:
+    return json.loads(line.decode(), object_hook=_decode)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def setup(self):
+        super().setup()
+        with self.server.connections_lock:
+            self.server.connections.add(self.connection)
+
+    def finish(self):
+        with self.server.connections_lock:
+            self.server.connections.discard(self.connection)
+        super().finish()
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = _loads(line)
+                reply = {'result': self.server.service.call(request['method'], *request.get('args', ()),
+                                                            **request.get('kwargs', {}))}
+            except Exception as error:
+                reply = {'error': type(error).__name__, 'message': str(error)}
+            try:
+                self.wfile.write(_dumps(reply))
+            except TypeError as error:
+                self.wfile.write(_dumps({'error': 'TypeError', 'message': str(error)}))
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, service):
+        super().__init__(socket_path, _RequestHandler)
+        self.service = service
+        self.connections = set()
+        self.connections_lock = threading.Lock()
+
+    def close_connections(self) -> None:
+        with self.connections_lock:
+            for connection in self.connections:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+class TimeService():
+    """
+    The owner of the RTC on the host. It reads the RTC every resync_interval seconds, at the start of a second
+    (see software_clock.read_second_edge), and publishes the time read with the monotonic time of the edge in a
+    shared memory segment. The readers (TimeServiceClient) extrapolate the time from this anchor with their own
+    monotonic clock, which is the same for all the processes: reading the time is a memory read, and the bus
+    traffic doesn't depend on the amount of processes.
+
+    The segment is written seqlock-style: the sequence number is odd while the anchor is being written, and a reader
+    retries if the sequence number was odd or has changed during its copy. Readers never block the owner nor each
+    other.
+
+    The other operations of the clients (REMOTE_METHODS) are received on a Unix socket and run under the bus lock
+    of the device, one at a time, so their read-modify-write sequences never interleave. The RTC is read again after
+    the operations that change the time (the time or UNIX Time registers, or the 12h/24h format).
+
+    Example:
+        with TimeService(RV_3028()) as service:
+            service.serve_forever()
+    """
+
+    def __init__(self, rtc: RV_3028, shm_path: str = None, socket_path: str = None,
+                 runtime_dir: str = DEFAULT_RUNTIME_DIR, resync_interval: float = 60.0, align: bool = True,
+                 poll_interval: float = 0.005, clock=time.monotonic_ns, sleep=time.sleep):
+        """
+        :param rtc: the device
+        :param shm_path: the shared memory segment, defaults to a file in runtime_dir (see default_paths)
+        :param socket_path: the Unix socket, defaults to a file in runtime_dir (see default_paths)
+        :param runtime_dir: the directory of the default segment and socket
+        :param resync_interval: the interval between two reads of the RTC (seconds)
+        :param align: if True the RTC is read at the start of a second (polling every poll_interval), otherwise
+            it is read once and the published time can be up to one second behind
+        :param poll_interval: the interval between two reads of the RTC while waiting for the next second
+        :param clock: the monotonic clock (nanoseconds), must be the clock of the clients
+        :param sleep: the function used to sleep between the polls
+        """
+        default_shm_path, default_socket_path = default_paths(rtc.i2c_bus, rtc.i2c_address, runtime_dir)
+        self.rtc = rtc
+        self.shm_path = shm_path or default_shm_path
+        self.socket_path = socket_path or default_socket_path
+        self.resync_interval = resync_interval
+        self.align = align
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.sleep = sleep
+        self._segment = None
+        self._sequence = 0
+        self._resync_lock = threading.Lock()
+        self._server = None
+        self._stop = threading.Event()
+        self._resync_thread = None
+
+        self.resyncs = 0
+        '''the amount of times the RTC has been read'''
+        self.calls = 0
+        '''the amount of operations run for the clients'''
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self) -> None:
+        """
+        Creates the segment, publishes the time, starts reading the RTC every resync_interval and listening on the
+        socket (in background threads).
+        """
+        self._check_not_running()
+        fd = os.open(self.shm_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, SEGMENT_SIZE)
+            self._segment = mmap.mmap(fd, SEGMENT_SIZE)
+        finally:
+            os.close(fd)
+        self._sequence = 0
+        self.resync()
+
+        self._stop.clear()
+        self._server = _Server(self.socket_path, self)
+        threading.Thread(target=self._server.serve_forever, name='rv3028-time-service', daemon=True).start()
+        self._resync_thread = threading.Thread(target=self._resync_loop, name='rv3028-time-resync', daemon=True)
+        self._resync_thread.start()
+        logger.info("time service of bus %d address 0x%02X: %s, %s", self.rtc.i2c_bus, self.rtc.i2c_address,
+                    self.shm_path, self.socket_path)
+
+    def _check_not_running(self) -> None:
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except OSError:
+            # left behind by an owner that is gone
+            os.remove(self.socket_path)
+        else:
+            raise OSError("a time service is already listening on {}".format(self.socket_path))
+        finally:
+            probe.close()
+
+    def serve_forever(self) -> None:
+        """
+        Blocks until stop() is called (e.g. from a signal handler).
+        """
+        self._stop.wait()
+
+    def stop(self) -> None:
+        """
+        Stops the threads, closes the connections of the clients and removes the socket. The segment is left in
+        place: the clients keep extrapolating the last published time.
+        """
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.close_connections()
+            self._server.server_close()
+            self._server = None
+            try:
+                os.remove(self.socket_path)
+            except FileNotFoundError:
+                pass
+        if self._resync_thread is not None:
+            self._resync_thread.join()
+            self._resync_thread = None
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def _resync_loop(self) -> None:
+        while not self._stop.wait(self.resync_interval):
+            try:
+                self.resync()
+            except OSError as error:
+                logger.warning("time service resync failed: %s", error)
+
+    def resync(self) -> datetime.datetime:
+        """
+        Reads the RTC now and publishes the time read. The bus lock is only held during each read, the other
+        drivers on the bus are not stalled while waiting for the start of the second.
+
+        :return: the time read from the RTC
+        """
+        with self._resync_lock:
+            if self.align:
+                rtc_time, anchor_ns = read_second_edge(self.rtc, self.poll_interval, self.clock, self.sleep)
+            else:
+                before = self.clock()
+                rtc_time = datetime.datetime(*self.rtc.get_datetime_tuple()[:6])
+                anchor_ns = (before + self.clock()) // 2
+            # read within the second of the anchor
+            with self.rtc.locked():
+                weekday = self.rtc.get_field('WEEKDAY')
+                unix_time = self.rtc.get_unix_time()
+                use_12h_mode = self.rtc.is_using_12h_mode()
+            self.publish(rtc_time, anchor_ns, unix_time, weekday, use_12h_mode)
+            self.resyncs += 1
+        return rtc_time
+
+    def publish(self, rtc_time: datetime.datetime, anchor_ns: int, unix_time: int, weekday: int,
+                use_12h_mode: bool) -> None:
+        """
+        Writes an anchor to the segment.
+
+        :param rtc_time: the time of the RTC at anchor_ns
+        :param anchor_ns: the monotonic time of the anchor (nanoseconds)
+        :param unix_time: the UNIX Time counter at anchor_ns
+        :param weekday: the weekday register at anchor_ns
+        :param use_12h_mode: True if the device is using the 12h format
+        """
+        segment = self._segment
+        _SEQUENCE.pack_into(segment, 0, self._sequence + 1)
+        _ANCHOR.pack_into(segment, _SEQUENCE.size, anchor_ns, unix_time, os.getpid(), rtc_time.year, rtc_time.month,
+                          rtc_time.day, rtc_time.hour, rtc_time.minute, rtc_time.second, weekday, use_12h_mode)
+        self._sequence += 2
+        _SEQUENCE.pack_into(segment, 0, self._sequence)
+
+    def call(self, method: str, *args, **kwargs):
+        """
+        Runs a method of the device for a client.
+
+        :param method: the name of the method, must be in REMOTE_METHODS
+        :return: the return value of the method
+        """
+        if method not in REMOTE_METHODS:
+            raise ValueError("{} can't be called through the time service".format(method))
+        function = getattr(self.rtc, method)
+        written = self._written_registers(method, function, args, kwargs)
+        with self.rtc.locked():
+            use_12h_mode = self.rtc.is_using_12h_mode() if RV_3028.CONTROL2_REGISTER_ADDRESS in written else None
+            result = function(*args, **kwargs)
+            changed = method in _TIME_METHODS or not _TIME_REGISTERS.isdisjoint(written) or (
+                use_12h_mode is not None and self.rtc.is_using_12h_mode() != use_12h_mode)
+            self.calls += 1
+        if changed:
+            self.resync()
+        return result
+
+    @staticmethod
+    def _written_registers(method: str, function, args: tuple, kwargs: dict) -> set:
+        """
+        :return: the registers written by a call of one of _REGISTER_METHODS, an empty set for the other methods
+        """
+        if method not in _REGISTER_METHODS:
+            return set()
+        if method == 'set_fields':
+            return {reg_address for name in kwargs for reg_address in FIELDS[name].registers}
+        arguments = inspect.signature(function).bind(*args, **kwargs).arguments
+        if method == 'write_registers':
+            start = arguments['start_reg_address']
+            return set(range(start, start + len(arguments['values'])))
+        return {arguments['reg_address']}
+
+
+class TimeServiceClient():
+    """
+    The read API of RV_3028 served by the TimeService of the device: the time is extrapolated from the anchor
+    published by the owner, without bus access and without locks. The methods in REMOTE_METHODS (e.g. set_datetime,
+    set_fields, read_eeprom) are sent to the owner, which runs them one at a time. Their arguments and results are
+    sent as JSON (datetime.datetime and bytes are supported).
+
+    The time is as precise as the anchor: within poll_interval of the owner if it reads the RTC aligned to the
+    second. Between two resyncs the time follows the monotonic clock of the host (see age).
+
+    Example:
+        rtc = TimeServiceClient(i2c_bus=1)
+        print(rtc.get_datetime_object())
+        rtc.set_datetime(datetime.datetime.now(), align=True)
+    """
+
+    def __init__(self, i2c_addr=RV_3028.RV_3028_ADDRESS, i2c_bus=1, shm_path: str = None, socket_path: str = None,
+                 runtime_dir: str = DEFAULT_RUNTIME_DIR, timeout: float = 5.0, clock=time.monotonic_ns):
+        """
+        :param i2c_addr: the i2c address of the device
+        :param i2c_bus: the i2c bus number
+        :param shm_path: the shared memory segment of the service, defaults to a file in runtime_dir
+        :param socket_path: the Unix socket of the service, defaults to a file in runtime_dir
+        :param runtime_dir: the directory of the default segment and socket
+        :param timeout: the timeout of the operations sent to the owner (seconds)
+        :param clock: the monotonic clock (nanoseconds), must be the clock of the owner
+        """
+        default_shm_path, default_socket_path = default_paths(i2c_bus, i2c_addr, runtime_dir)
+        self.i2c_address = i2c_addr
+        self.i2c_bus = i2c_bus
+        self.shm_path = shm_path or default_shm_path
+        self.socket_path = socket_path or default_socket_path
+        self.timeout = timeout
+        self.clock = clock
+        with open(self.shm_path, 'rb') as segment_file:
+            self._segment = mmap.mmap(segment_file.fileno(), SEGMENT_SIZE, access=mmap.ACCESS_READ)
+        self._socket = None
+        self._socket_file = None
+        self._socket_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        with self._socket_lock:
+            self._disconnect()
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    # time, read from the segment
+
+    def _read_anchor(self) -> tuple:
+        segment = self._segment
+        for _ in range(_MAX_READ_ATTEMPTS):
+            sequence = _SEQUENCE.unpack_from(segment)[0]
+            if sequence & 1 or sequence == 0:
+                continue
+            anchor = _ANCHOR.unpack_from(segment, _SEQUENCE.size)
+            if _SEQUENCE.unpack_from(segment)[0] == sequence:
+                return anchor
+        raise TimeoutError("no consistent time in {}".format(self.shm_path))
+
+    def _now(self) -> tuple:
+        """
+        :return: the extrapolated time of the RTC (datetime.datetime), the UNIX Time counter, the weekday and the
+            12h mode flag
+        """
+        anchor_ns, unix_time, _, year, month, date, hours, minutes, seconds, weekday, use_12h_mode = \
+            self._read_anchor()
+        elapsed = datetime.timedelta(microseconds=(self.clock() - anchor_ns) // 1000)
+        anchor_time = datetime.datetime(year, month, date, hours, minutes, seconds)
+        now = anchor_time + elapsed
+        weekday = (weekday + (now.date() - anchor_time.date()).days) % 7
+        return now, unix_time + int(elapsed.total_seconds()), weekday, bool(use_12h_mode)
+
+    @property
+    def age(self) -> float:
+        """
+        the time elapsed since the owner last read the RTC (seconds)
+        """
+        return (self.clock() - self._read_anchor()[0]) / 1e9
+
+    @property
+    def owner_pid(self) -> int:
+        """
+        the pid of the process that published the time
+        """
+        return self._read_anchor()[2]
+
+    def is_using_12h_mode(self) -> bool:
+        return bool(self._read_anchor()[10])
+
+    def get_time(self) -> dict:
+        """
+        :return: a dictionary containing the current time (seconds : minutes : hours)
+        """
+        now, _, _, use_12h_mode = self._now()
+        return self._time_dict(now, use_12h_mode)
+
+    @staticmethod
+    def _time_dict(now: datetime.datetime, use_12h_mode: bool) -> dict:
+        if use_12h_mode:
+            return {'s': now.second, 'm': now.minute, 'h': now.hour % 12 or 12,
+                    'period': 'pm' if now.hour >= 12 else 'am'}
+        return {'s': now.second, 'm': now.minute, 'h': now.hour}
+
+    def get_date(self) -> dict:
+        """
+        :return: a dictionary containing the current date (weekday : date : month : year)
+        """
+        now, _, weekday, _ = self._now()
+        return {'weekday': weekday, 'date': now.day, 'month': now.month, 'year': now.year % 100}
+
+    def get_datetime(self) -> dict:
+        """
+        :return: a Dictionary containing the current date and time
+        """
+        now, _, weekday, use_12h_mode = self._now()
+        datetime_dict = self._time_dict(now, use_12h_mode)
+        datetime_dict.update(weekday=weekday, date=now.day, month=now.month, year=now.year % 100)
+        return datetime_dict
+
+    def get_datetime_tuple(self) -> tuple:
+        """
+        :return: a tuple (year, month, date, hours, minutes, seconds, weekday). The hours are always in 24h format.
+        """
+        now, _, weekday, _ = self._now()
+        return now.year, now.month, now.day, now.hour, now.minute, now.second, weekday
+
+    def get_datetime_object(self) -> datetime.datetime:
+        """
+        :return: the current date and time as a naive datetime.datetime, with the extrapolated microseconds
+        """
+        return self._now()[0]
+
+    def get_struct_time(self) -> time.struct_time:
+        """
+        :return: the current date and time as a time.struct_time. tm_wday is the weekday stored in the device.
+        """
+        now, _, weekday, _ = self._now()
+        return time.struct_time((now.year, now.month, now.day, now.hour, now.minute, now.second, weekday,
+                                 now.timetuple().tm_yday, -1))
+
+    def get_unix_time(self) -> int:
+        """
+        :return: the value of the UNIX Time counter
+        """
+        return self._now()[1] & 0xFFFFFFFF
+
+    # operations, sent to the owner
+
+    def call(self, method: str, *args, **kwargs):
+        """
+        Runs a method of the device in the owner process.
+
+        :param method: the name of the method, must be in REMOTE_METHODS
+        :return: the return value of the method (tuples are returned as lists)
+        """
+        request = _dumps({'method': method, 'args': args, 'kwargs': kwargs})
+        with self._socket_lock:
+            try:
+                self._send(request)
+            except OSError:
+                # not delivered (e.g. the owner has been restarted): connect again once. A request that may have
+                # been delivered is never sent again, it could run twice.
+                self._disconnect()
+                self._send(request)
+            try:
+                line = self._socket_file.readline()
+            except OSError:
+                # a late reply would be taken for the reply of the next request
+                self._disconnect()
+                raise
+            if not line:
+                self._disconnect()
+                raise ConnectionResetError("the time service closed the connection")
+        reply = _loads(line)
+        if 'error' in reply:
+            raise _REMOTE_ERRORS.get(reply['error'], RuntimeError)(reply['message'])
+        return reply['result']
+
+    def _send(self, request: bytes) -> None:
+        if self._socket is None:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                connection.settimeout(self.timeout)
+                connection.connect(self.socket_path)
+            except OSError:
+                connection.close()
+                raise
+            self._socket, self._socket_file = connection, connection.makefile('rb')
+        self._socket.sendall(request)
+
+    def _disconnect(self) -> None:
+        if self._socket is not None:
+            self._socket_file.close()
+            self._socket.close()
+            self._socket = self._socket_file = None
+
+    def __getattr__(self, name: str):
+        if name in REMOTE_METHODS:
+            return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+        raise AttributeError("{!r} object has no attribute {!r}".format(type(self).__name__, name))
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+
+Transports: the objects that carry the transfers of RV_3028 to /dev/i2c-N. A transport has the SMBus interface used
+by the driver (read_byte_data, write_byte_data, read_i2c_block_data, write_i2c_block_data, close) and, if it can
+run several transfers in a single transaction with repeated starts, a combined_transfer method and a true
+supports_combined_transfers attribute.
+"""
+
+import ctypes
+import fcntl
+import os
+
+# linux/i2c-dev.h and linux/i2c.h
+I2C_FUNCS = 0x0705
+I2C_RDWR = 0x0707
+I2C_M_RD = 0x0001
+I2C_FUNC_I2C = 0x00000001
+
+# the kernel accepts up to 42 messages per I2C_RDWR call
+MAX_MESSAGES = 42
+# register byte + 32 data bytes (the maximum size of an SMBus block transfer)
+MAX_MESSAGE_LENGTH = 33
+
+
+def open_smbus(bus_number: int):
+    """
+    :param bus_number: the i2c bus number
+    :return: an open smbus2.SMBus. smbus2 is imported on first use.
+    """
+    from smbus2 import SMBus
+    return SMBus(bus_number)
+
+
+def supports_combined_transfers(bus) -> bool:
+    """
+    :param bus: a transport or any object with the SMBus interface
+    :return: True if bus can run several transfers in a single transaction (see combined_transfer)
+    """
+    return bool(getattr(bus, 'supports_combined_transfers', False))
+
+
+class _I2CMessage(ctypes.Structure):
+    _fields_ = [('addr', ctypes.c_uint16), ('flags', ctypes.c_uint16), ('len', ctypes.c_uint16),
+                ('buf', ctypes.POINTER(ctypes.c_uint8))]
+
+
+class _I2CRdwrData(ctypes.Structure):
+    _fields_ = [('msgs', ctypes.POINTER(_I2CMessage)), ('nmsgs', ctypes.c_uint32)]
+
+
+class I2CRdwrTransport():
+    """
+    Talks to /dev/i2c-N with the I2C_RDWR ioctl. Every transfer is a single syscall, and combined_transfer runs
+    several register reads and writes in one syscall, with repeated starts between the messages. The message
+    descriptors and their buffers are allocated once and reused: the callers must serialize the transfers (the
+    bus lock of RV_3028 does).
+
+    Example:
+        rtc = RV_3028(transport=I2CRdwrTransport)
+    """
+
+    def __init__(self, bus_number: int):
+        """
+        :param bus_number: the i2c bus number
+        """
+        self.bus_number = bus_number
+        self.fd = os.open('/dev/i2c-{}'.format(bus_number), os.O_RDWR)
+        functions = ctypes.c_ulong()
+        try:
+            fcntl.ioctl(self.fd, I2C_FUNCS, functions)
+        except OSError:
+            functions.value = 0
+        self.functions = functions.value
+        '''the I2C_FUNC_* flags of the adapter'''
+        self.supports_combined_transfers = bool(self.functions & I2C_FUNC_I2C)
+        '''True if the adapter supports plain i2c messages (I2C_RDWR)'''
+
+        self._buffers = [(ctypes.c_uint8 * MAX_MESSAGE_LENGTH)() for _ in range(MAX_MESSAGES)]
+        self._messages = (_I2CMessage * MAX_MESSAGES)()
+        for message, buffer in zip(self._messages, self._buffers):
+            message.buf = ctypes.cast(buffer, ctypes.POINTER(ctypes.c_uint8))
+        self._data = _I2CRdwrData(self._messages, 0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        fd, self.fd = self.fd, None
+        if fd is not None:
+            os.close(fd)
+
+    # SMBus interface
+
+    def read_byte_data(self, i2c_addr: int, register: int) -> int:
+        return self.combined_transfer(i2c_addr, [('read', register, 1)])[0][0]
+
+    def write_byte_data(self, i2c_addr: int, register: int, value: int) -> None:
+        self.combined_transfer(i2c_addr, [('write', register, [value])])
+
+    def read_i2c_block_data(self, i2c_addr: int, register: int, length: int) -> list:
+        return self.combined_transfer(i2c_addr, [('read', register, length)])[0]
+
+    def write_i2c_block_data(self, i2c_addr: int, register: int, data: list) -> None:
+        self.combined_transfer(i2c_addr, [('write', register, data)])
+
+    def combined_transfer(self, i2c_addr: int, operations: list) -> list:
+        """
+        Runs the operations in a single transaction (one ioctl, or one per MAX_MESSAGES messages).
+
+        :param i2c_addr: the i2c address of the device
+        :param operations: ('read', register, length) and ('write', register, values) tuples, with at most 32
+            bytes each. A read takes two messages (register write and read), a write one.
+        :return: the list of the results of the operations: the values read, None for the writes
+        """
+        if self.fd is None:
+            raise OSError("the transport is closed")
+        results = [None] * len(operations)
+        reads = []
+        count = 0
+        for index, (kind, register, payload) in enumerate(operations):
+            length = payload if kind == 'read' else len(payload)
+            if length + 1 > MAX_MESSAGE_LENGTH:
+                raise ValueError("at most {} bytes per transfer, got {}".format(MAX_MESSAGE_LENGTH - 1, length))
+            needed = 2 if kind == 'read' else 1
+            if count + needed > MAX_MESSAGES:
+                self._flush(count, reads, results)
+                count = 0
+                reads = []
+
+            message, buffer = self._messages[count], self._buffers[count]
+            message.addr, message.flags = i2c_addr, 0
+            buffer[0] = register
+            if kind == 'read':
+                message.len = 1
+                count += 1
+                message, buffer = self._messages[count], self._buffers[count]
+                message.addr, message.flags, message.len = i2c_addr, I2C_M_RD, length
+                reads.append((index, buffer, length))
+            elif kind == 'write':
+                message.len = length + 1
+                buffer[1:length + 1] = [value & 0xFF for value in payload]
+            else:
+                raise ValueError("unknown operation {!r}".format(kind))
+            count += 1
+        if count:
+            self._flush(count, reads, results)
+        return results
+
+    def _flush(self, count: int, reads: list, results: list) -> None:
+        self._data.nmsgs = count
+        fcntl.ioctl(self.fd, I2C_RDWR, self._data)
+        for index, buffer, length in reads:
+            results[index] = buffer[:length]
+
+
+def default_transport(bus_number: int):
+    """
+    :param bus_number: the i2c bus number
+    :return: an open smbus2.SMBus if smbus2 is installed, otherwise an I2CRdwrTransport
+    """
+    try:
+        return open_smbus(bus_number)
+    except ImportError:
+        return I2CRdwrTransport(bus_number)
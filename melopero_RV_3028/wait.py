@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import time
+
+
+class EEPROMTimeoutError(TimeoutError):
+    """
+    Raised when the device is still busy (EEBusy set) after the wait timeout.
+    """
+
+
+class BusyWait():
+    """
+    Waits for the device to clear a busy condition without spinning: sleeps for an initial delay (the expected
+    duration of the operation), then polls with an exponentially growing interval until the condition clears.
+    If the condition is still set after timeout seconds an EEPROMTimeoutError is raised.
+    """
+
+    def __init__(self, poll_interval: float = 0.0005, backoff: float = 2.0, max_poll_interval: float = 0.005,
+                 timeout: float = 0.1, sleep=time.sleep, clock=time.monotonic):
+        """
+        :param poll_interval: the first interval between two polls (seconds)
+        :param backoff: the factor the poll interval is multiplied by after every poll
+        :param max_poll_interval: the maximum interval between two polls (seconds)
+        :param timeout: the maximum total wait (seconds), including the initial delay
+        :param sleep: the function used to sleep
+        :param clock: the monotonic clock used to measure the timeout
+        """
+        self.poll_interval = poll_interval
+        self.backoff = backoff
+        self.max_poll_interval = max_poll_interval
+        self.timeout = timeout
+        self.sleep = sleep
+        self.clock = clock
+
+    def _intervals(self, initial_delay: float):
+        yield initial_delay
+        interval = self.poll_interval
+        while True:
+            yield interval
+            interval = min(interval * self.backoff, self.max_poll_interval)
+
+    def wait(self, is_busy, initial_delay: float = 0.0) -> None:
+        """
+        :param is_busy: a function returning True while the device is busy
+        :param initial_delay: the time to sleep before the first poll (seconds)
+        :return:
+        """
+        deadline = self.clock() + self.timeout
+        for interval in self._intervals(initial_delay):
+            if interval > 0:
+                self.sleep(interval)
+            if not is_busy():
+                return
+            if self.clock() >= deadline:
+                raise EEPROMTimeoutError("the device is still busy after {} seconds".format(self.timeout))
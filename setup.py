@@ -14,5 +14,5 @@ setup(
     author='Leonardo La Rocca',
     author_email='info@melopero.com',
     description='A module to easily access the RV-3028 rtc features.',
-    install_requires=["smbus2>=0.4"]
+    extras_require={'smbus2': ["smbus2>=0.4"]}
 )
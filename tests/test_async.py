@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import asyncio
+import threading
+
+from melopero_RV_3028 import RV_3028, RV_3028_Simulator, AsyncRV_3028, BusyWait
+
+
+def _rtc() -> RV_3028:
+    simulator = RV_3028_Simulator()
+    rtc = RV_3028(bus=simulator)
+    rtc.eeprom_wait = BusyWait(sleep=simulator.clock.sleep, clock=simulator.clock.monotonic)
+    return rtc
+
+
+def test_eeprom_round_trip():
+    async def main(rtc):
+        await rtc.write_eeprom(0x00, b"hello")
+        return await rtc.read_eeprom(0x00, 5), await rtc.read_eeprom_register(0x01)
+
+    assert asyncio.run(main(AsyncRV_3028(rtc=_rtc()))) == (b"hello", ord("e"))
+
+
+def test_an_eeprom_register_read_is_never_interleaved_with_other_transfers():
+    rtc = _rtc()
+    rtc.write_eeprom_register(0x00, 0x42)
+    stop = threading.Event()
+
+    def overwrite_the_data_register():
+        while not stop.is_set():
+            rtc.write_register(RV_3028.EEPROM_DATA_ADDRESS, 0xAA)
+
+    async def main():
+        artc = AsyncRV_3028(rtc=rtc)
+        return [await artc.read_eeprom_register(0x00) for _ in range(20)]
+
+    thread = threading.Thread(target=overwrite_the_data_register)
+    thread.start()
+    try:
+        values = asyncio.run(main())
+    finally:
+        stop.set()
+        thread.join()
+    assert values == [0x42] * 20
@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+from melopero_RV_3028 import RV_3028, RV_3028_Simulator
+
+
+def test_batch_writes_h12_before_the_hours():
+    rtc = RV_3028(bus=RV_3028_Simulator())
+    with rtc.batch():
+        rtc.set_12h_format(True)
+        rtc.set_time(15, 0, 0)
+    assert rtc.get_datetime_tuple()[3] == 15
+    assert rtc.get_time() == {'s': 0, 'm': 0, 'h': 3, 'period': 'pm'}
+
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import pytest
+
+from melopero_RV_3028 import RV_3028, RV_3028_Simulator, BusyWait, Calibration
+from melopero_RV_3028.calibration import offset_to_ppm, ppm_to_offset
+
+
+def _calibration(history_path: str = None, frequency_error: float = 20.0):
+    simulator = RV_3028_Simulator(frequency_error=frequency_error)
+    rtc = RV_3028(bus=simulator)
+    rtc.eeprom_wait = BusyWait(sleep=simulator.clock.sleep, clock=simulator.clock.monotonic)
+    return simulator, Calibration(rtc, history_path, reference_clock=simulator.clock.monotonic_ns,
+                                  sleep=simulator.clock.sleep)
+
+
+def test_ppm_conversions():
+    assert ppm_to_offset(offset_to_ppm(21)) == 21
+    assert ppm_to_offset(-1000) == -256
+    assert ppm_to_offset(1000) == 255
+
+
+def test_calibrate_measures_the_drift_and_corrects_it():
+    simulator, calibration = _calibration()
+
+    # accurate to 2 * poll_interval / window
+    assert calibration.calibrate(window=10000) == pytest.approx(20, abs=1)
+
+    offset = round(20 / 0.9537)
+    assert calibration.get_offset() == offset
+    # EEOffset bits 8 - 1 in 0x36, bit 0 in bit 7 of 0x37
+    assert (simulator.eeprom[0x36], simulator.eeprom[0x37] >> 7) == (offset >> 1, offset & 1)
+    assert calibration.get_offset() == ppm_to_offset(calibration.estimate_error())
+    assert calibration.measure(window=10000) == pytest.approx(0, abs=1)
+    # the offset doesn't change: the eeprom isn't written again
+    assert not calibration.apply()
+
+
+def test_the_history_is_saved_and_loaded(tmp_path):
+    history_path = str(tmp_path / 'calibration.json')
+    _, calibration = _calibration(history_path)
+    calibration.add_measurement(drift_ppm=10.0, window=100)
+    calibration.add_measurement(drift_ppm=13.0, window=200)
+
+    _, reloaded = _calibration(history_path)
+
+    assert reloaded.history == calibration.history
+    assert reloaded.estimate_error() == pytest.approx(12.0)
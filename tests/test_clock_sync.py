@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import datetime
+
+import pytest
+
+from melopero_RV_3028 import RV_3028, RV_3028_Simulator, BusyWait, clock_sync
+from melopero_RV_3028.calibration import _signed
+
+
+class _Corrections():
+    """
+    Replaces the system clock and the offset measurement of clock_sync, recording the corrections.
+    """
+
+    def __init__(self, monkeypatch, offset: float):
+        self.offset = offset
+        self.calls = []
+        monkeypatch.setattr(clock_sync, 'measure_offset', lambda rtc, utc, poll_interval: self.offset)
+        for name in ('slew_system_clock', 'step_system_clock', 'systohc'):
+            monkeypatch.setattr(clock_sync, name, lambda *args, name=name: self.calls.append((name, args[-1])))
+
+
+@pytest.mark.parametrize('offset, expected', [
+    (0.005, []),
+    (0.02, [('slew_system_clock', 0.02)]),
+    (-0.2, [('slew_system_clock', -0.03)]),
+    (0.6, [('step_system_clock', 0.6)]),
+])
+def test_hctosys_slews_up_to_the_threshold_at_the_slew_rate(monkeypatch, offset, expected):
+    corrections = _Corrections(monkeypatch, offset)
+    daemon = clock_sync.ClockSyncDaemon(RV_3028(bus=RV_3028_Simulator()), 'hctosys', interval=60)
+
+    daemon.step()
+
+    assert [(name, pytest.approx(value)) for name, value in corrections.calls] == expected
+
+
+def test_systohc_slews_with_the_frequency_offset_and_restores_it(monkeypatch):
+    corrections = _Corrections(monkeypatch, 0.02)
+    simulator = RV_3028_Simulator(start=datetime.datetime(2024, 1, 1))
+    rtc = RV_3028(bus=simulator)
+    rtc.eeprom_wait = BusyWait(sleep=simulator.clock.sleep, clock=simulator.clock.monotonic)
+    rtc.set_fields(EEOFFSET=10)
+    eeprom = rtc.read_eeprom(0x36, 2)
+    daemon = clock_sync.ClockSyncDaemon(rtc, 'systohc', interval=100, slew_rate=300)
+
+    daemon.step()
+    # 20 ms over 100 s: 200 ppm slower
+    assert _signed(rtc.get_field('EEOFFSET')) == 10 + round(200 / 0.9537)
+    simulator.clock.advance(100)
+    assert rtc.get_datetime_tuple()[:6] == (2024, 1, 1, 0, 1, 39)
+
+    corrections.offset = 0.0
+    daemon.step()
+    assert rtc.get_field('EEOFFSET') == 10
+    assert rtc.read_eeprom(0x36, 2) == eeprom
+    assert corrections.calls == []
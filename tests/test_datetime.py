@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import datetime
+import time
+
+import pytest
+
+from melopero_RV_3028 import RV_3028, RV_3028_Simulator
+
+
+@pytest.mark.parametrize('register_cache', [False, True])
+@pytest.mark.parametrize('use_12h_mode', [False, True])
+def test_get_datetime_takes_a_single_transfer(register_cache, use_12h_mode):
+    simulator = RV_3028_Simulator(start=datetime.datetime(2020, 7, 26, 14, 16, 42))
+    rtc = RV_3028(bus=simulator, register_cache=register_cache)
+    rtc.set_12h_format(use_12h_mode)
+    simulator.reset_transactions()
+
+    assert rtc.get_datetime_object() == datetime.datetime(2020, 7, 26, 14, 16, 42)
+    assert len(simulator.transactions) == 1
+    expected = {'s': 42, 'm': 16, 'h': 2, 'period': 'pm'} if use_12h_mode else {'s': 42, 'm': 16, 'h': 14}
+    assert rtc.get_time() == expected
+    assert len(simulator.transactions) == 2
+    expected.update(weekday=6, date=26, month=7, year=20)
+    assert rtc.get_datetime() == expected
+    assert len(simulator.transactions) == 3
+
+
+def test_set_datetime_round_trip():
+    simulator = RV_3028_Simulator()
+    rtc = RV_3028(bus=simulator)
+    rtc.set_12h_format(True)
+
+    rtc.set_datetime(datetime.datetime(2024, 2, 29, 23, 59, 58))
+
+    assert rtc.get_datetime_tuple() == (2024, 2, 29, 23, 59, 58, 3)
+    simulator.clock.advance(2)
+    assert rtc.get_datetime_object() == datetime.datetime(2024, 3, 1, 0, 0, 0)
+
+
+def test_set_datetime_aligns_to_the_next_second(monkeypatch):
+    simulator = RV_3028_Simulator()
+    rtc = RV_3028(bus=simulator)
+    monkeypatch.setattr(time, 'perf_counter', simulator.clock.perf_counter)
+    monkeypatch.setattr(time, 'sleep', simulator.clock.sleep)
+
+    rtc.set_datetime(datetime.datetime(2024, 2, 28, 23, 59, 58, 750000), align=True)
+
+    assert simulator.clock.monotonic() == pytest.approx(0.25)
+    assert simulator.transactions[-1].data == bytes([0x59, 0x59, 0x23, 0x02, 0x28, 0x02, 0x24])
+    simulator.clock.advance(0.999)
+    assert simulator.get_datetime() == datetime.datetime(2024, 2, 28, 23, 59, 59)
+    simulator.clock.advance(0.002)
+    assert simulator.get_datetime() == datetime.datetime(2024, 2, 29, 0, 0, 0)
+
+    rtc.set_datetime(datetime.datetime(2024, 3, 1), align=True)
+    assert simulator.clock.monotonic() == pytest.approx(1.251)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+from melopero_RV_3028 import RV_3028, RV_3028_Simulator, BusyWait
+
+_WRITE_COMMAND = 0x21
+
+
+def _rtc():
+    simulator = RV_3028_Simulator()
+    rtc = RV_3028(bus=simulator)
+    rtc.eeprom_wait = BusyWait(sleep=simulator.clock.sleep, clock=simulator.clock.monotonic)
+    return simulator, rtc
+
+
+def _programmed(simulator: RV_3028_Simulator) -> int:
+    # the command is the last byte of the address, data, command block write
+    return sum(1 for t in simulator.transactions if t.operation.startswith('write') and
+               t.register + len(t.data) - 1 == RV_3028.EEPROM_COMMAND_ADDRESS and t.data[-1] == _WRITE_COMMAND)
+
+
+def test_write_eeprom_programs_only_the_registers_that_change():
+    simulator, rtc = _rtc()
+    simulator.eeprom[0x00:0x05] = b"hallo"
+
+    assert rtc.write_eeprom(0x00, b"hello") == 1
+
+    assert _programmed(simulator) == 1
+    assert bytes(simulator.eeprom[0x00:0x05]) == b"hello"
+    assert rtc.read_eeprom(0x00, 5) == b"hello"
+    assert rtc.write_eeprom(0x00, b"hello") == 0
+
+
+def test_the_automatic_refresh_is_disabled_once_and_restored():
+    simulator, rtc = _rtc()
+    assert rtc.get_field('EERD') == 0
+
+    rtc.read_eeprom(0x00, 0x2B)
+
+    assert rtc.get_field('EERD') == 0
+    eerd_writes = [t for t in simulator.transactions if t.operation == 'write_byte_data' and
+                   t.register == RV_3028.CONTROL1_REGISTER_ADDRESS]
+    assert len(eerd_writes) == 2
+
+    rtc.use_eeprom(True)
+    rtc.write_eeprom(0x00, b"\x01")
+    assert rtc.get_field('EERD') == 1
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import json
+import os
+import stat
+
+from melopero_RV_3028 import RV_3028, RV_3028_Simulator, BusyWait, ConfigurationEEPROM
+
+_PASSWORD = bytes([0xDE, 0xAD, 0xBE, 0xEF])
+
+
+def _mirror(cache_path: str):
+    simulator = RV_3028_Simulator()
+    simulator.eeprom[0x30:0x35] = bytes([0xFF]) + _PASSWORD
+    rtc = RV_3028(bus=simulator)
+    rtc.write_registers(0x30, [0xFF] + list(_PASSWORD))
+    rtc.eeprom_wait = BusyWait(sleep=simulator.clock.sleep, clock=simulator.clock.monotonic)
+    return simulator, rtc, ConfigurationEEPROM(rtc, cache_path=cache_path)
+
+
+def test_the_cache_file_never_holds_the_password_and_is_private(tmp_path):
+    cache_path = str(tmp_path / 'eeprom.json')
+    _, _, mirror = _mirror(cache_path)
+
+    config = mirror.load()
+
+    with open(cache_path) as cache_file:
+        cache = json.load(cache_file)
+    assert _PASSWORD.hex() not in cache['ram'] + cache['eeprom']
+    assert len(bytes.fromhex(cache['eeprom'])) == 3
+    assert stat.S_IMODE(os.stat(cache_path).st_mode) == 0o600
+    assert not mirror.from_cache
+    assert config.clkout_enabled
+
+
+def test_the_cache_stays_valid_when_only_the_password_changes(tmp_path):
+    cache_path = str(tmp_path / 'eeprom.json')
+    _, rtc, mirror = _mirror(cache_path)
+    mirror.load()
+
+    rtc.write_registers(0x31, [0x01, 0x02, 0x03, 0x04])
+    reloaded = ConfigurationEEPROM(rtc, cache_path=cache_path)
+    reloaded.load()
+
+    assert reloaded.from_cache
+    rtc.set_fields(BSM=3)
+    reloaded.load()
+    assert not reloaded.from_cache
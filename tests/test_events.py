@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import datetime
+
+import pytest
+
+from melopero_RV_3028 import RV_3028, RV_3028_Simulator
+from melopero_RV_3028.events import EventCapture
+
+
+@pytest.mark.parametrize('overwrite, writes', [(False, 2), (True, 1)])
+def test_read_is_a_single_burst_read(overwrite, writes):
+    simulator = RV_3028_Simulator(start=datetime.datetime(2020, 7, 26, 14, 16, 42))
+    capture = EventCapture(RV_3028(bus=simulator), overwrite=overwrite, sleep=simulator.clock.sleep)
+    capture.start()
+    simulator.trigger_event()
+    simulator.clock.advance(2.5)
+    simulator.trigger_event()
+    simulator.reset_transactions()
+
+    event = capture.read()
+
+    assert [t.operation for t in simulator.transactions] == ['read_i2c_block_data'] + ['write_byte_data'] * writes
+    assert event.timestamp == datetime.datetime(2020, 7, 26, 14, 16, 44 if overwrite else 42)
+    assert (event.count, event.missed) == (2, 1)
+    assert capture.read() is None
+
+
+def test_first_event_mode_resets_the_time_stamp_for_the_next_event():
+    simulator = RV_3028_Simulator(start=datetime.datetime(2020, 7, 26, 14, 16, 42))
+    capture = EventCapture(RV_3028(bus=simulator), sleep=simulator.clock.sleep)
+    capture.start()
+    simulator.trigger_event()
+    capture.read()
+    simulator.clock.advance(3)
+    simulator.trigger_event()
+
+    event = capture.read()
+
+    assert event.timestamp == datetime.datetime(2020, 7, 26, 14, 16, 45)
+    assert (event.count, event.missed) == (1, 0)
+    assert (capture.events_read, capture.missed) == (2, 0)
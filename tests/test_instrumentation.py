@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+from melopero_RV_3028 import BusInstrumentation, RV_3028, RV_3028_Simulator
+
+
+def test_transfers_are_counted_per_outermost_public_method():
+    rtc = RV_3028(bus=RV_3028_Simulator(), instrumentation=BusInstrumentation())
+    rtc.get_time()
+    rtc.set_time(14, 16, 42)
+    with rtc.batch():
+        rtc.enable_timer(enable=True, repeat=True, generate_interrupt=True)
+        rtc.set_12h_format(True)
+
+    assert set(rtc.instrumentation.methods) == {'get_time', 'set_time', 'batch'}
+    assert rtc._caller.method is None
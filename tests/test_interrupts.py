@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import pytest
+
+from melopero_RV_3028 import RV_3028, RV_3028_Simulator, InterruptDispatcher, FakeInterruptBackend
+
+
+class _RaiseFlagOnStatusWrite():
+    """
+    Raises a flag of the simulator right before the STATUS register is written.
+    """
+
+    def __init__(self, simulator: RV_3028_Simulator, flag: int = InterruptDispatcher.TIMER):
+        self.simulator = simulator
+        self.flag = flag
+
+    def __getattr__(self, name: str):
+        return getattr(self.simulator, name)
+
+    def write_byte_data(self, i2c_addr: int, register: int, value: int) -> None:
+        if register == RV_3028.STATUS_REGISTER_ADDRESS:
+            self.simulator.raise_flags(self.flag)
+        self.simulator.write_byte_data(i2c_addr, register, value)
+
+    def write_i2c_block_data(self, i2c_addr: int, register: int, values: list) -> None:
+        if register <= RV_3028.STATUS_REGISTER_ADDRESS < register + len(values):
+            self.simulator.raise_flags(self.flag)
+        self.simulator.write_i2c_block_data(i2c_addr, register, values)
+
+
+def test_dispatch_keeps_the_flags_raised_after_the_status_read():
+    simulator = RV_3028_Simulator()
+    rtc = RV_3028(bus=_RaiseFlagOnStatusWrite(simulator))
+    backend = FakeInterruptBackend()
+    dispatcher = InterruptDispatcher(rtc, backend)
+    handled = []
+    dispatcher.add_handler(InterruptDispatcher.EVENT, handled.append)
+    dispatcher.start()
+
+    simulator.trigger_event()
+    backend.trigger()
+
+    status = rtc.read_register(RV_3028.STATUS_REGISTER_ADDRESS)
+    assert handled == [InterruptDispatcher.EVENT]
+    assert not status & InterruptDispatcher.EVENT
+    assert status & InterruptDispatcher.TIMER
+
+
+def test_clear_interrupt_flags_keeps_the_other_flags_with_a_single_write():
+    simulator = RV_3028_Simulator()
+    rtc = RV_3028(bus=_RaiseFlagOnStatusWrite(simulator))
+    simulator.trigger_event()
+    simulator.reset_transactions()
+
+    rtc.clear_interrupt_flags(clear_timer_flag=False)
+    assert len(simulator.transactions) == 1
+
+    status = rtc.read_register(RV_3028.STATUS_REGISTER_ADDRESS)
+    assert status & InterruptDispatcher.EVENT
+    assert status & InterruptDispatcher.TIMER
+
+
+def _status_reads(simulator: RV_3028_Simulator) -> list:
+    return [transaction for transaction in simulator.transactions if transaction.operation.startswith('read') and
+            0 <= RV_3028.STATUS_REGISTER_ADDRESS - transaction.register < len(transaction.data)]
+
+
+@pytest.mark.parametrize('clear_flag, flag', [
+    (lambda rtc: rtc.enable_timer(enable=True, repeat=True, generate_interrupt=True), InterruptDispatcher.ALARM),
+    (lambda rtc: rtc.enable_alarm(enable=True, generate_interrupt=True), InterruptDispatcher.TIMER),
+    (lambda rtc: rtc.enable_event_timestamp(), InterruptDispatcher.TIMER),
+    (lambda rtc: rtc.set_fields(TF=0, TIE=1), InterruptDispatcher.ALARM),
+])
+def test_clearing_a_flag_never_reads_status_and_keeps_the_other_flags(clear_flag, flag):
+    simulator = RV_3028_Simulator()
+    rtc = RV_3028(bus=_RaiseFlagOnStatusWrite(simulator, flag))
+    simulator.reset_transactions()
+
+    clear_flag(rtc)
+
+    assert not _status_reads(simulator)
+    assert rtc.read_register(RV_3028.STATUS_REGISTER_ADDRESS) & flag
+
+
+def test_apply_keeps_the_flags_raised_after_its_snapshot():
+    simulator = RV_3028_Simulator()
+    rtc = RV_3028(bus=_RaiseFlagOnStatusWrite(simulator, InterruptDispatcher.TIMER))
+    simulator.trigger_event()
+
+    rtc.apply({'EVF': 0})
+
+    status = rtc.read_register(RV_3028.STATUS_REGISTER_ADDRESS)
+    assert not status & InterruptDispatcher.EVENT
+    assert status & InterruptDispatcher.TIMER
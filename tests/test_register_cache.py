@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+from melopero_RV_3028 import RV_3028, RV_3028_Simulator
+
+
+def _rtc():
+    simulator = RV_3028_Simulator()
+    rtc = RV_3028(bus=simulator, register_cache=True)
+    rtc.sync_register_cache()
+    simulator.reset_transactions()
+    return simulator, rtc
+
+
+def test_sync_register_cache_is_a_single_block_read():
+    simulator = RV_3028_Simulator()
+    rtc = RV_3028(bus=simulator, register_cache=True)
+
+    rtc.sync_register_cache()
+
+    assert [(t.operation, t.register, len(t.data)) for t in simulator.transactions] == [
+        ('read_i2c_block_data', RV_3028.STATUS_REGISTER_ADDRESS, 6)]
+
+
+def test_the_cached_registers_are_read_and_updated_without_reads():
+    simulator, rtc = _rtc()
+
+    assert rtc.get_fields('TE', 'TIE', 'H12', 'TSE') == {'TE': 0, 'TIE': 0, 'H12': 0, 'TSE': 0}
+    rtc.set_fields(TIE=1, TSE=1)
+    assert rtc.get_fields('TIE', 'TSE') == {'TIE': 1, 'TSE': 1}
+
+    assert [t.operation for t in simulator.transactions] == ['write_byte_data']
+    assert rtc.read_register(RV_3028.CONTROL2_REGISTER_ADDRESS) == \
+        simulator.read_byte_data(RV_3028.RV_3028_ADDRESS, RV_3028.CONTROL2_REGISTER_ADDRESS)
+
+
+def test_the_volatile_bits_are_always_read_from_the_device():
+    simulator, rtc = _rtc()
+    simulator.trigger_event()
+
+    assert rtc.get_field('EVF') == 1
+    assert [t.operation for t in simulator.transactions] == ['read_byte_data']
+
+
+def test_the_self_clearing_bits_are_not_cached():
+    simulator, rtc = _rtc()
+
+    rtc.set_fields(TSR=1)
+
+    assert rtc.get_field('TSR') == 0
+    assert [t.operation for t in simulator.transactions] == ['write_byte_data']
+
+
+def test_invalidate_register_cache_reads_the_register_again():
+    simulator, rtc = _rtc()
+    # configured by someone else
+    simulator.write_byte_data(RV_3028.RV_3028_ADDRESS, RV_3028.CONTROL1_REGISTER_ADDRESS, 0x04)
+    assert rtc.get_field('TE') == 0
+
+    rtc.invalidate_register_cache(RV_3028.CONTROL1_REGISTER_ADDRESS)
+
+    assert rtc.get_field('TE') == 1
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import errno
+
+import pytest
+
+from melopero_RV_3028 import BusyWait, CircuitOpenError, DeadlineExceededError, RV_3028, RV_3028_Simulator
+from melopero_RV_3028.resilience import CircuitBreaker, RetryPolicy
+
+
+class _FailEveryOtherTransfer():
+    """
+    An smbus bus that fails every other transfer with an OSError and runs the others on the simulator.
+    """
+
+    def __init__(self, simulator: RV_3028_Simulator):
+        self.simulator = simulator
+        self.fail = False
+
+    def _transfer(self, operation: str, *args):
+        self.fail = not self.fail
+        if self.fail:
+            raise OSError(errno.EREMOTEIO, "Remote I/O error")
+        return getattr(self.simulator, operation)(*args)
+
+    def read_byte_data(self, *args):
+        return self._transfer('read_byte_data', *args)
+
+    def write_byte_data(self, *args):
+        return self._transfer('write_byte_data', *args)
+
+    def read_i2c_block_data(self, *args):
+        return self._transfer('read_i2c_block_data', *args)
+
+    def write_i2c_block_data(self, *args):
+        return self._transfer('write_i2c_block_data', *args)
+
+
+class _FailingBus(_FailEveryOtherTransfer):
+    """
+    An smbus bus that fails the next failures transfers and runs the others on the simulator.
+    """
+
+    def __init__(self, simulator: RV_3028_Simulator, failures: int = 0):
+        super().__init__(simulator)
+        self.failures = failures
+        self.attempts = 0
+
+    def _transfer(self, operation: str, *args):
+        self.attempts += 1
+        if self.failures:
+            self.failures -= 1
+            raise OSError(errno.EREMOTEIO, "Remote I/O error")
+        return getattr(self.simulator, operation)(*args)
+
+
+def _rtc(bus, simulator: RV_3028_Simulator, timeout: float) -> RV_3028:
+    clock = simulator.clock
+    rtc = RV_3028(bus=bus, retry_policy=RetryPolicy(attempts=10, delay=0.01, jitter=0, timeout=timeout,
+                                                    sleep=clock.sleep, clock=clock.monotonic))
+    rtc.eeprom_wait = BusyWait(sleep=clock.sleep, clock=clock.monotonic)
+    return rtc
+
+
+def test_the_transfers_of_a_call_share_its_deadline():
+    simulator = RV_3028_Simulator()
+    rtc = _rtc(_FailEveryOtherTransfer(simulator), simulator, timeout=0.05)
+
+    start = simulator.clock.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        # every transfer is retried once, the call would take ~0.3 s with a deadline per transfer
+        rtc.read_eeprom(0x00, 8)
+    assert simulator.clock.monotonic() - start <= 0.05
+
+
+def test_the_deadline_never_stops_a_call_that_does_not_fail():
+    simulator = RV_3028_Simulator()
+    rtc = _rtc(simulator, simulator, timeout=0.001)
+
+    assert rtc.read_eeprom(0x00, 8) == bytes(8)
+    assert simulator.clock.monotonic() > 0.001
+
+
+def test_the_failed_transfers_are_retried_with_backoff():
+    simulator = RV_3028_Simulator()
+    bus = _FailingBus(simulator, failures=2)
+    rtc = _rtc(bus, simulator, timeout=None)
+
+    rtc.write_register(RV_3028.USER_RAM1_ADDRESS, 0x42)
+
+    assert rtc.read_register(RV_3028.USER_RAM1_ADDRESS) == 0x42
+    assert rtc.retry_policy.retries == 2
+    # 0.01 s, then 0.02 s
+    assert simulator.clock.monotonic() == pytest.approx(0.03)
+
+
+def test_a_transfer_failing_every_attempt_raises_its_error():
+    simulator = RV_3028_Simulator()
+    bus = _FailingBus(simulator, failures=100)
+    rtc = _rtc(bus, simulator, timeout=None)
+
+    with pytest.raises(OSError) as error:
+        rtc.read_register(RV_3028.USER_RAM1_ADDRESS)
+    assert error.value.errno == errno.EREMOTEIO
+    assert bus.attempts == 10
+    assert rtc.retry_policy.failures == 1
+
+
+def test_the_circuit_breaker_opens_and_tries_a_single_transfer_when_half_open():
+    simulator = RV_3028_Simulator()
+    bus = _FailingBus(simulator, failures=100)
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=1, clock=simulator.clock.monotonic)
+    rtc = RV_3028(bus=bus, circuit_breaker=breaker)
+
+    for _ in range(2):
+        with pytest.raises(OSError):
+            rtc.read_register(RV_3028.USER_RAM1_ADDRESS)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        rtc.read_register(RV_3028.USER_RAM1_ADDRESS)
+    assert (bus.attempts, breaker.rejected) == (2, 1)
+
+    simulator.clock.advance(1)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(OSError):
+        rtc.read_register(RV_3028.USER_RAM1_ADDRESS)
+    # a failure while half open opens the circuit again
+    assert (bus.attempts, breaker.state, breaker.trips) == (3, CircuitBreaker.OPEN, 2)
+
+    simulator.clock.advance(1)
+    bus.failures = 0
+    assert rtc.read_register(RV_3028.USER_RAM1_ADDRESS) == 0
+    assert breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import datetime
+
+import pytest
+
+from melopero_RV_3028 import RV_3028, RV_3028_Simulator, InterruptDispatcher, FakeInterruptBackend
+from melopero_RV_3028.scheduler import WakeupScheduler, plan_timer, ALARM_MARGIN
+
+
+@pytest.mark.parametrize('delay, precision, plan', [
+    # the coarsest clock precise enough
+    (90, 60, (RV_3028.TIMER_FREQ_1_60Hz, 2, True)),
+    (90, 1, (RV_3028.TIMER_FREQ_1Hz, 90, True)),
+    (0.5, 0.02, (RV_3028.TIMER_FREQ_64Hz, 32, True)),
+    (0.00001, 0, (RV_3028.TIMER_FREQ_4096Hz, 1, True)),
+    # beyond the range of the precise clock: an intermediate countdown on a coarser one
+    (5000, 1, (RV_3028.TIMER_FREQ_1_60Hz, 82, False)),
+    # the end of the range of the timer (68 hours)
+    (4095 * 60, 60, (RV_3028.TIMER_FREQ_1_60Hz, 4095, True)),
+    (4095 * 60 + 30, 60, None),
+])
+def test_plan_timer(delay, precision, plan):
+    assert plan_timer(delay, precision) == plan
+
+
+def _scheduler(start: datetime.datetime = datetime.datetime(2024, 2, 27, 12, 0, 30)):
+    simulator = RV_3028_Simulator(start=start)
+    rtc = RV_3028(bus=simulator)
+    dispatcher = InterruptDispatcher(rtc, FakeInterruptBackend(), clock=simulator.clock.monotonic_ns)
+    dispatcher.start()
+    simulator.interrupt_listeners.append(dispatcher.on_edge)
+    scheduler = WakeupScheduler(rtc, clock=simulator.clock.monotonic)
+    scheduler.attach(dispatcher)
+    return simulator, scheduler
+
+
+def _run(simulator: RV_3028_Simulator, duration: float, step: float = 0.001) -> None:
+    for _ in range(round(duration / step)):
+        simulator.clock.advance(step)
+
+
+def test_the_wakeups_run_within_their_precision():
+    simulator, scheduler = _scheduler()
+    woken = []
+    for delay, precision in ((0.5, 0.02), (3, 1), (2, 0.02)):
+        scheduler.schedule(delay, lambda delay=delay: woken.append((delay, simulator.clock.monotonic())),
+                           precision=precision)
+    cancelled = scheduler.schedule(1, lambda: woken.append('cancelled'))
+    scheduler.cancel(cancelled)
+
+    _run(simulator, 4)
+
+    assert [delay for delay, _ in woken] == [0.5, 2, 3]
+    for delay, time in woken:
+        assert abs(time - delay) <= {0.5: 0.02, 2: 0.02, 3: 1}[delay]
+    assert scheduler.armed is None
+    assert len(scheduler) == 0
+
+
+def test_the_deadlines_beyond_the_timer_range_use_the_alarm_first():
+    simulator, scheduler = _scheduler()
+    woken = []
+    delay = 100 * 3600.0
+
+    scheduler.schedule(delay, lambda: woken.append(simulator.clock.monotonic()), precision=1)
+
+    kind, alarm = scheduler.armed
+    assert kind == 'alarm'
+    assert alarm == (datetime.datetime(2024, 2, 27, 12, 0, 30) + datetime.timedelta(
+        seconds=delay - ALARM_MARGIN)).replace(second=0)
+    simulator.clock.advance(delay - ALARM_MARGIN)
+    assert scheduler.armed[0] == 'timer'
+    _run(simulator, ALARM_MARGIN + 1, step=0.1)
+    assert len(woken) == 1 and abs(woken[0] - delay) <= 1
+
+
+@pytest.mark.parametrize('register_cache, transfers', [(False, 5), (True, 3)])
+def test_rearming_the_timer_never_reads_te(register_cache, transfers):
+    simulator, scheduler = _scheduler()
+    scheduler.rtc.register_cache = register_cache
+    for delay in (10, 20):
+        scheduler.schedule(delay, lambda: None)
+    simulator.clock.advance(10.5)
+    simulator.reset_transactions()
+
+    scheduler.on_interrupt(InterruptDispatcher.TIMER)
+
+    assert len(simulator.transactions) == transfers
+    assert sum(1 for transaction in simulator.transactions if transaction.operation.startswith('read')) == \
+        transfers - 3
+    assert scheduler.armed[0] == 'timer'
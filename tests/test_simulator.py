@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import datetime
+import errno
+
+import pytest
+
+from melopero_RV_3028 import RV_3028, RV_3028_Simulator, VirtualClock
+from melopero_RV_3028.simulator import transaction_duration
+
+_ADDRESS = RV_3028.RV_3028_ADDRESS
+
+
+def test_the_time_follows_the_virtual_clock():
+    simulator = RV_3028_Simulator(start=datetime.datetime(2099, 12, 31, 23, 59, 59))
+
+    simulator.clock.advance(0.999)
+    assert simulator.get_datetime() == datetime.datetime(2099, 12, 31, 23, 59, 59)
+    simulator.clock.advance(0.001)
+    # the year register wraps to 00
+    assert simulator.get_datetime() == datetime.datetime(2000, 1, 1, 0, 0, 0)
+    assert simulator.read_i2c_block_data(_ADDRESS, RV_3028.UNIX_TIME_ADDRESS, 4) == [1, 0, 0, 0]
+
+
+def test_the_crystal_error_and_the_offset_correction():
+    simulator = RV_3028_Simulator(start=datetime.datetime(2024, 1, 1), frequency_error=100)
+
+    simulator.clock.advance(10000.5)
+    # 1 second ahead after 10000 seconds at +100 ppm
+    assert simulator.get_datetime() == datetime.datetime(2024, 1, 1, 2, 46, 41)
+
+    # EEOffset 105: -100.1 ppm
+    simulator.write_i2c_block_data(_ADDRESS, 0x36, [105 >> 1, 0x80])
+    simulator.clock.advance(10000)
+    assert simulator.get_datetime() == datetime.datetime(2024, 1, 1, 5, 33, 21)
+
+
+def test_the_status_flags_are_write_zero_to_clear():
+    simulator = RV_3028_Simulator()
+    simulator.raise_flags(0x08 | 0x04)
+    assert simulator.read_byte_data(_ADDRESS, RV_3028.STATUS_REGISTER_ADDRESS) == 0x0D
+
+    # the ones leave the flags unchanged
+    simulator.write_byte_data(_ADDRESS, RV_3028.STATUS_REGISTER_ADDRESS, 0xFF & ~0x08)
+    assert simulator.read_byte_data(_ADDRESS, RV_3028.STATUS_REGISTER_ADDRESS) == 0x05
+
+
+def test_the_timer_raises_its_flag_and_the_interrupt_pin():
+    simulator = RV_3028_Simulator()
+    edges = []
+    simulator.interrupt_listeners.append(edges.append)
+    rtc = RV_3028(bus=simulator)
+    rtc.set_timer(ticks=3, frequency=RV_3028.TIMER_FREQ_1Hz)
+    rtc.enable_timer(enable=True, repeat=False, generate_interrupt=True)
+
+    simulator.clock.advance(2.9)
+    assert not simulator.int_asserted
+    simulator.clock.advance(0.2)
+    assert simulator.int_asserted
+    assert rtc.get_field('TF') == 1
+    assert len(edges) == 1
+
+    rtc.clear_interrupt_flags()
+    assert not simulator.int_asserted
+
+
+def test_the_eeprom_is_busy_for_the_duration_of_a_command():
+    simulator = RV_3028_Simulator()
+    simulator.write_i2c_block_data(_ADDRESS, RV_3028.EEPROM_ADDRESS_ADDRESS, [0x00, 0x42, 0x21])
+
+    assert simulator.read_byte_data(_ADDRESS, RV_3028.STATUS_REGISTER_ADDRESS) & 0x80
+    simulator.clock.advance(RV_3028_Simulator.EEPROM_WRITE_TIME)
+    assert not simulator.read_byte_data(_ADDRESS, RV_3028.STATUS_REGISTER_ADDRESS) & 0x80
+    assert simulator.eeprom[0x00] == 0x42
+
+
+def test_the_transactions_are_recorded_and_take_bus_time():
+    clock = VirtualClock()
+    simulator = RV_3028_Simulator(clock, bus_frequency=100000)
+
+    simulator.read_i2c_block_data(_ADDRESS, RV_3028.SECONDS_REGISTER_ADDRESS, 7)
+
+    duration = transaction_duration('read_i2c_block_data', 7, 100000)
+    assert clock.monotonic() == pytest.approx(duration)
+    assert [(t.operation, t.register, len(t.data)) for t in simulator.transactions] == [
+        ('read_i2c_block_data', RV_3028.SECONDS_REGISTER_ADDRESS, 7)]
+
+
+def test_the_bus_errors():
+    simulator = RV_3028_Simulator()
+
+    with pytest.raises(OSError) as error:
+        simulator.read_byte_data(0x50, 0x00)
+    assert error.value.errno == errno.EREMOTEIO
+    with pytest.raises(OSError) as error:
+        simulator.combined_transfer(_ADDRESS, [('read', 0x00, 1)])
+    assert error.value.errno == errno.EOPNOTSUPP
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import datetime
+import errno
+import threading
+
+from melopero_RV_3028 import RV_3028, RV_3028_Simulator, SoftwareClock
+
+
+class _ControlledBus():
+    """
+    Forwards the transfers to the simulator, failing them while fail is True and blocking them while gate is clear.
+    """
+
+    def __init__(self, simulator: RV_3028_Simulator):
+        self.simulator = simulator
+        self.fail = False
+        self.attempts = 0
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def read_i2c_block_data(self, i2c_addr: int, register: int, length: int) -> list:
+        self.attempts += 1
+        self.gate.wait()
+        if self.fail:
+            raise OSError(errno.EREMOTEIO, "nack")
+        return self.simulator.read_i2c_block_data(i2c_addr, register, length)
+
+    def read_byte_data(self, i2c_addr: int, register: int) -> int:
+        return self.read_i2c_block_data(i2c_addr, register, 1)[0]
+
+
+def _clock(align: bool):
+    simulator = RV_3028_Simulator(start=datetime.datetime(2024, 2, 28, 23, 59, 58))
+    bus = _ControlledBus(simulator)
+    clock = SoftwareClock(RV_3028(bus=bus), resync_interval=60, align=align, clock=simulator.clock.monotonic_ns,
+                          sleep=simulator.clock.sleep, retry_backoff=5)
+    return simulator, bus, clock
+
+
+def test_now_waits_the_backoff_after_a_failed_resync():
+    simulator, bus, clock = _clock(align=False)
+    first = clock.now()
+    simulator.clock.advance(61)
+    bus.fail = True
+    bus.attempts = 0
+
+    assert clock.now() >= first + datetime.timedelta(seconds=61)
+    assert bus.attempts == 1
+    simulator.clock.advance(4)
+    clock.now()
+    assert bus.attempts == 1
+
+    simulator.clock.advance(1)
+    bus.fail = False
+    assert clock.now() == datetime.datetime(2024, 2, 29, 0, 1, 4)
+    assert bus.attempts == 2
+    assert clock.resyncs == 2
+
+
+def _background_resyncs() -> list:
+    return [thread for thread in threading.enumerate() if thread.name == 'rv3028-clock-resync']
+
+
+def test_now_never_waits_for_the_background_resync():
+    simulator, bus, clock = _clock(align=True)
+    clock.now()
+    for thread in _background_resyncs():
+        thread.join(5)
+    first = clock.now()
+    resyncs = clock.resyncs
+    simulator.clock.advance(61)
+    bus.gate.clear()
+
+    stamps = [clock.now() for _ in range(100)]
+    background = _background_resyncs()
+
+    assert stamps[0] == first + datetime.timedelta(seconds=61)
+    assert len(background) == 1
+    bus.gate.set()
+    background[0].join(5)
+    assert not background[0].is_alive()
+    assert clock.resyncs == resyncs + 1
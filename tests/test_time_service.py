@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import datetime
+import threading
+
+import pytest
+
+from melopero_RV_3028 import RV_3028, RV_3028_Simulator
+from melopero_RV_3028.time_service import TimeService, TimeServiceClient, _SEQUENCE
+
+
+@pytest.fixture
+def service(tmp_path):
+    simulator = RV_3028_Simulator(start=datetime.datetime(2024, 2, 28, 23, 59, 58))
+    rtc = RV_3028(bus=simulator)
+    rtc.set_unix_time(1709164798)
+    service = TimeService(rtc, runtime_dir=str(tmp_path), resync_interval=3600, clock=simulator.clock.monotonic_ns,
+                          sleep=simulator.clock.sleep)
+    service.start()
+    client = TimeServiceClient(i2c_bus=rtc.i2c_bus, runtime_dir=str(tmp_path), clock=simulator.clock.monotonic_ns)
+    yield simulator, service, client
+    client.close()
+    service.stop()
+
+
+def test_the_clients_read_the_time_without_bus_transfers(service):
+    simulator, _, client = service
+    simulator.clock.advance(3.5)
+    simulator.reset_transactions()
+
+    now = client.get_datetime_object()
+
+    assert not simulator.transactions
+    assert now.replace(microsecond=0) == simulator.get_datetime()
+    assert client.get_unix_time() == 1709164798 + (now - datetime.datetime(2024, 2, 28, 23, 59, 58)).seconds
+
+
+def test_the_readers_never_use_an_anchor_being_written(service):
+    _, service, client = service
+    segment = service._segment
+    sequence = _SEQUENCE.unpack_from(segment)[0]
+
+    _SEQUENCE.pack_into(segment, 0, sequence + 1)
+    with pytest.raises(TimeoutError):
+        client.get_datetime_object()
+    _SEQUENCE.pack_into(segment, 0, sequence)
+    client.get_datetime_object()
+
+
+def test_the_readers_get_consistent_anchors_while_the_owner_publishes(service):
+    simulator, service, client = service
+    anchor_ns = simulator.clock.monotonic_ns()
+    anchors = [(datetime.datetime(2024, 1, 1, 0, 0, 0), 1704067200, 1),
+               (datetime.datetime(2030, 12, 31, 23, 59, 59), 1924991999, 2)]
+    stop = threading.Event()
+
+    def publish():
+        while not stop.is_set():
+            for rtc_time, unix_time, weekday in anchors:
+                service.publish(rtc_time, anchor_ns, unix_time, weekday, False)
+                stop.wait(0.0001)
+
+    thread = threading.Thread(target=publish)
+    thread.start()
+    try:
+        reads = [client._now() for _ in range(2000)]
+    finally:
+        stop.set()
+        thread.join()
+    published = {(rtc_time, unix_time, weekday) for rtc_time, unix_time, weekday in anchors}
+    for now, unix_time, weekday, _ in reads:
+        # the clock doesn't advance: the extrapolation is the anchor
+        assert (now, unix_time, weekday) in published
+
+
+def test_the_other_operations_run_in_the_owner(service):
+    simulator, service, client = service
+    resyncs = service.resyncs
+
+    client.set_datetime(datetime.datetime(2030, 5, 6, 13, 0, 0))
+    client.write_register(RV_3028.USER_RAM1_ADDRESS, 0x42)
+
+    # the owner has read the RTC again at the start of the next second
+    assert simulator.get_datetime() == datetime.datetime(2030, 5, 6, 13, 0, 1)
+    assert client.get_datetime_object().replace(microsecond=0) == simulator.get_datetime()
+    # only the time change is published again
+    assert service.resyncs == resyncs + 1
+    assert client.read_register(RV_3028.USER_RAM1_ADDRESS) == 0x42
+    assert service.calls == 3
+    with pytest.raises(ValueError):
+        client.set_time(99, 0, 0)
+    with pytest.raises(ValueError):
+        client.call('snapshot')
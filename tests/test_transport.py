@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import datetime
+
+import pytest
+
+from melopero_RV_3028 import RV_3028, RV_3028_Simulator, transport
+from melopero_RV_3028.transport import I2CRdwrTransport
+
+_ID_ADDRESS = 0x28
+
+
+class _DeviceFile():
+    """
+    Stands for /dev/i2c-1 with the simulator behind it: answers the I2C_FUNCS and I2C_RDWR ioctls.
+    """
+
+    def __init__(self, monkeypatch, simulator: RV_3028_Simulator):
+        self.simulator = simulator
+        self.ioctls = []
+        self.closed = False
+        monkeypatch.setattr(transport.os, 'open', lambda path, flags: 3)
+        monkeypatch.setattr(transport.os, 'close', lambda fd: setattr(self, 'closed', True))
+        monkeypatch.setattr(transport.fcntl, 'ioctl', self.ioctl)
+
+    def ioctl(self, fd: int, request: int, argument) -> None:
+        self.ioctls.append(request)
+        if request == transport.I2C_FUNCS:
+            argument.value = transport.I2C_FUNC_I2C
+            return
+        messages = argument.msgs[:argument.nmsgs]
+        index = 0
+        while index < len(messages):
+            message = messages[index]
+            if index + 1 < len(messages) and messages[index + 1].flags & transport.I2C_M_RD:
+                read = messages[index + 1]
+                for offset, value in enumerate(self.simulator.read_i2c_block_data(read.addr, message.buf[0],
+                                                                                  read.len)):
+                    read.buf[offset] = value
+                index += 2
+            else:
+                self.simulator.write_i2c_block_data(message.addr, message.buf[0], message.buf[1:message.len])
+                index += 1
+
+
+def test_combined_transfer_runs_reads_and_writes_in_one_ioctl(monkeypatch):
+    simulator = RV_3028_Simulator()
+    device_file = _DeviceFile(monkeypatch, simulator)
+    bus = I2CRdwrTransport(1)
+
+    results = bus.combined_transfer(RV_3028.RV_3028_ADDRESS, [
+        ('write', RV_3028.USER_RAM1_ADDRESS, [0x42, 0x43]),
+        ('read', RV_3028.USER_RAM1_ADDRESS, 2),
+        ('read', _ID_ADDRESS, 1),
+    ])
+
+    assert bus.supports_combined_transfers
+    assert results == [None, [0x42, 0x43], [RV_3028_Simulator.ID]]
+    assert device_file.ioctls == [transport.I2C_FUNCS, transport.I2C_RDWR]
+
+
+def test_combined_transfer_splits_at_the_message_limit(monkeypatch):
+    device_file = _DeviceFile(monkeypatch, RV_3028_Simulator())
+    bus = I2CRdwrTransport(1)
+
+    # two messages per read: 21 reads fill an ioctl
+    results = bus.combined_transfer(RV_3028.RV_3028_ADDRESS, [('read', _ID_ADDRESS, 1)] * 22)
+
+    assert results == [[RV_3028_Simulator.ID]] * 22
+    assert device_file.ioctls.count(transport.I2C_RDWR) == 2
+
+
+def test_invalid_transfers_raise(monkeypatch):
+    device_file = _DeviceFile(monkeypatch, RV_3028_Simulator())
+    bus = I2CRdwrTransport(1)
+
+    with pytest.raises(ValueError):
+        bus.read_i2c_block_data(RV_3028.RV_3028_ADDRESS, 0x00, transport.MAX_MESSAGE_LENGTH)
+    with pytest.raises(ValueError):
+        bus.combined_transfer(RV_3028.RV_3028_ADDRESS, [('erase', 0x00, [0])])
+    bus.close()
+    assert device_file.closed
+    with pytest.raises(OSError):
+        bus.read_byte_data(RV_3028.RV_3028_ADDRESS, 0x00)
+
+
+def test_the_driver_combines_the_reads_of_separate_registers(monkeypatch):
+    simulator = RV_3028_Simulator(start=datetime.datetime(2020, 7, 26, 14, 16, 42))
+    device_file = _DeviceFile(monkeypatch, simulator)
+    rtc = RV_3028(transport=I2CRdwrTransport)
+
+    assert rtc.get_fields('SECONDS', 'TIMER_VALUE', 'EEOFFSET') == {'SECONDS': 42, 'TIMER_VALUE': 0,
+                                                                    'EEOFFSET': 0}
+    assert device_file.ioctls == [transport.I2C_FUNCS, transport.I2C_RDWR]
+    assert rtc.get_datetime_object() == datetime.datetime(2020, 7, 26, 14, 16, 42)
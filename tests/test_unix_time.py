@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Leonardo La Rocca
+"""
+
+import datetime
+
+import pytest
+
+from melopero_RV_3028 import RV_3028, RV_3028_Simulator, Calibration
+from melopero_RV_3028.software_clock import read_second_edge
+
+
+def _rtc():
+    simulator = RV_3028_Simulator(start=datetime.datetime(2024, 2, 29, 23, 59, 59))
+    rtc = RV_3028(bus=simulator)
+    rtc.set_unix_time(1709251199)
+    simulator.clock.advance(0.3)
+    simulator.reset_transactions()
+    return simulator, rtc
+
+
+@pytest.mark.parametrize('find_edge', [
+    lambda rtc, clock: rtc.read_unix_time_edge(0.1, clock.monotonic_ns, clock.sleep),
+    lambda rtc, clock: rtc.get_unix_timestamp(poll_interval=0.1, clock=clock.monotonic_ns, sleep=clock.sleep),
+    lambda rtc, clock: read_second_edge(rtc, 0.1, clock.monotonic_ns, clock.sleep),
+    lambda rtc, clock: Calibration(rtc, poll_interval=0.1, reference_clock=clock.monotonic_ns,
+                                   sleep=clock.sleep)._unix_edge(),
+])
+def test_the_edge_is_found_with_one_unix_time_read_per_poll(find_edge):
+    simulator, rtc = _rtc()
+
+    find_edge(rtc, simulator.clock)
+
+    polls = [t for t in simulator.transactions if t.register == RV_3028.UNIX_TIME_ADDRESS]
+    assert len(polls) == 9
+    assert all(len(t.data) == 4 for t in polls)
+
+
+def test_read_unix_time_edge():
+    simulator, rtc = _rtc()
+
+    unix_time, edge_ns = rtc.read_unix_time_edge(0.1, simulator.clock.monotonic_ns, simulator.clock.sleep)
+
+    assert unix_time == 1709251200
+    assert abs(edge_ns - 1000000000) <= 100000000
+    assert read_second_edge(rtc, 0.1, simulator.clock.monotonic_ns, simulator.clock.sleep)[0] == \
+        datetime.datetime(2024, 3, 1, 0, 0, 1)
+
+
+class _StoppedCounter():
+    """
+    Answers the reads of the UNIX Time counter with a value that never changes, like a stopped oscillator.
+    """
+
+    def read_i2c_block_data(self, i2c_addr: int, register: int, length: int) -> list:
+        return [0] * length
+
+
+def test_read_unix_time_edge_times_out_if_the_counter_is_stopped():
+    simulator = RV_3028_Simulator()
+    rtc = RV_3028(bus=_StoppedCounter())
+
+    with pytest.raises(TimeoutError):
+        rtc.read_unix_time_edge(0.1, simulator.clock.monotonic_ns, simulator.clock.sleep, timeout=1)
+    assert simulator.clock.monotonic() < 1.2